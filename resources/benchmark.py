@@ -0,0 +1,213 @@
+from vetbiz_extractor.core.insights_extractor import (
+    get_lapsed_clients,
+    get_follow_up_consults,
+    get_dental_sales_after_consultation,
+    get_filtered_active_customers,
+)
+from vetbiz_extractor.utils.common import (
+    DateIndexedFrame,
+    get_products_list,
+    filter_data_for_date_range,
+    get_month_windows,
+)
+from vetbiz_extractor.utils.synthetic import (
+    generate_synthetic_sales_data,
+    generate_synthetic_customers_from_sales_data,
+)
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def filter_month_ranges(data, start_year=2020, months_threshold=18):
+    """
+    Filter the customers-from-sales data for every month since `start_year` and for its lookback period,
+    the month loop the active customers analysis used to run.
+    :param data: A DataFrame or a DateIndexedFrame with a date_field column.
+    :param start_year:
+    :param months_threshold:
+    :return: DataFrame with the number of rows in every month and in its lookback period.
+    """
+    windows = get_month_windows(
+        start_year * 12, datetime.now().year * 12 + 11, lookback_months=months_threshold
+    )
+    counts = []
+    for month, month_start, month_end, lookback_start in zip(
+        windows.months, windows.starts, windows.ends, windows.lookback_starts
+    ):
+        month_rows = filter_data_for_date_range(data, month_start, month_end)
+        lookback_rows = filter_data_for_date_range(
+            data, lookback_start, month_start - np.timedelta64(1, "D")
+        )
+        counts.append((month, len(month_rows), len(lookback_rows)))
+    return pd.DataFrame(counts, columns=["month_index", "month_rows", "lookback_rows"])
+
+
+def follow_up_consults_loop(sales_data, days_threshold=14):
+    """
+    Find the follow-up consults with the per-customer loop get_follow_up_consults used to run,
+    comparing the invoice dates of consecutive consults one row at a time.
+    :param sales_data:
+    :param days_threshold:
+    :return: DataFrame of the follow-up consults, as returned by get_follow_up_consults.
+    """
+    consult_products = get_products_list(sales_data["product_name"].unique(), "consult")
+    consults_df = sales_data[sales_data.product_name.isin(consult_products)]
+    consults_grouped_by_customer = consults_df.sort_values(by=["invoice_date"]).groupby(
+        "customer_tk"
+    )
+    follow_up_sale_ids = [
+        group["sale_id"].iloc[i]
+        for _, group in consults_grouped_by_customer
+        for i in range(1, len(group))
+        if (group["invoice_date"].iloc[i] - group["invoice_date"].iloc[i - 1]).days
+        <= days_threshold
+    ]
+    return consults_df[consults_df["sale_id"].isin(follow_up_sale_ids)].reset_index(
+        drop=True
+    )
+
+
+def filter_month_ranges_with_date_index(data):
+    # Includes the one-off sort of the date index
+    return filter_month_ranges(DateIndexedFrame(data))
+
+
+# Insights functions and the synthetic input each of them takes
+BENCHMARKS = {
+    "get_follow_up_consults": (get_follow_up_consults, "sales"),
+    "follow_up_consults_loop": (follow_up_consults_loop, "sales"),
+    "get_dental_sales_after_consultation": (
+        get_dental_sales_after_consultation,
+        "sales",
+    ),
+    "get_lapsed_clients": (get_lapsed_clients, "sales"),
+    "get_filtered_active_customers": (
+        get_filtered_active_customers,
+        "customers_from_sales",
+    ),
+    "filter_month_ranges": (filter_month_ranges, "customers_from_sales"),
+    "filter_month_ranges_with_date_index": (
+        filter_month_ranges_with_date_index,
+        "customers_from_sales",
+    ),
+}
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(function, data, repeat):
+    """
+    Time a function over `repeat` runs and measure its peak traced memory on a separate run.
+    :param function:
+    :param data:
+    :param repeat:
+    :return:
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function(data)
+        timings.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    function(data)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds_min": min(timings),
+        "seconds_median": float(np.median(timings)),
+        "peak_memory_mb": peak_memory / 1024**2,
+        "output_rows": len(result),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the insights functions on synthetic clinic data."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Numbers of synthetic sales lines, e.g. 10000 100000 1000000 10000000",
+    )
+    parser.add_argument(
+        "--functions",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Insights functions to benchmark",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs per function and size"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the synthetic data generator"
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        help="Machine-readable results file",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        sales_data = generate_synthetic_sales_data(size, seed=args.seed)
+        inputs = {
+            "sales": sales_data,
+            "customers_from_sales": generate_synthetic_customers_from_sales_data(
+                sales_data
+            ),
+        }
+        for name in args.functions:
+            function, input_name = BENCHMARKS[name]
+            measurement = run_benchmark(function, inputs[input_name], args.repeat)
+            results.append({"function": name, "rows": size, **measurement})
+            print(
+                f"{name} rows={size}: {measurement['seconds_min']:.3f}s, "
+                f"peak {measurement['peak_memory_mb']:.1f}MB, {measurement['output_rows']} output rows"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "commit": get_git_commit(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
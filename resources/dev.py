@@ -2,8 +2,17 @@ from vetbiz_extractor.utils.common import (
     measure_execution_time,
     validate_queries,
     validate_env_vars,
-    fetch_data_in_batches,
-    fetch_xero_journals_data_from_etani
+    run_concurrently,
+    fetch_data_in_batches
+)
+from vetbiz_extractor.utils.journals import (
+    fetch_batched_xero_journals_data,
+    JOURNAL_TABLES_PATTERN
+)
+from vetbiz_extractor.utils.connection_pool import ConnectionPool
+from vetbiz_extractor.utils.incremental import (
+    fetch_data_incrementally,
+    fetch_xero_journals_data_incrementally
 )
 
 from vetbiz_extractor.core.insights_extractor import (
@@ -12,9 +21,15 @@ from vetbiz_extractor.core.insights_extractor import (
     get_dental_sales_after_consultation,
     get_filtered_active_customers
 )
+from vetbiz_extractor.core.sharded_insights import run_insights_sharded
+from vetbiz_extractor.utils.product_index import ProductIndex
+from vetbiz_extractor.utils.export import export_insights, read_exported_insights
+from vetbiz_extractor.utils.time_budget import TimeBudget
 import argparse
 import os
 import json
+import pymysql
+from functools import partial
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,18 +37,45 @@ load_dotenv()
 
 @measure_execution_time
 def main():
-    # Validate environment variables
-    if not validate_env_vars():
-        print("Missing required environment variables. Terminating application.")
-        return
-
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Fetch data with optional limit.")
     parser.add_argument("--limit", type=int, help="Limit the number of records fetched")
+    parser.add_argument("--cache-dir", help="Cache fetched data here and only fetch new rows on later runs")
+    parser.add_argument("--workers", type=int,
+                        help="Run the sales insights on shards of clinics in this many processes")
+    parser.add_argument("--export-dir", help="Export the insights to a new version of Parquet files here")
+    parser.add_argument("--from-export",
+                        help="Load the latest exported insights from here instead of extracting them")
+    parser.add_argument("--query-timeout", type=float,
+                        help="Cancel a query after this many seconds and keep the rows fetched so far")
+    parser.add_argument("--time-budget", type=float,
+                        help="Cancel the queries still running this many seconds after the fetch starts")
+    parser.add_argument("--discover-journals", action="store_true",
+                        help=f"Fetch every journals table matching {JOURNAL_TABLES_PATTERN} in the Etani catalog")
+    parser.add_argument("--journal-columns",
+                        help="Comma-separated journals columns to fetch, batching small tables into UNION ALL queries")
 
     # Parse arguments
     args = parser.parse_args()
     query_limit = args.limit
+    cache_dir = args.cache_dir
+    workers = args.workers
+    export_dir = args.export_dir
+    query_timeout = args.query_timeout
+    time_budget_seconds = args.time_budget
+    journal_columns = args.journal_columns.split(",") if args.journal_columns else None
+    journal_tables_pattern = JOURNAL_TABLES_PATTERN if args.discover_journals else None
+
+    # Refresh from precomputed output: no database access
+    if args.from_export:
+        for name, df in read_exported_insights(args.from_export).items():
+            print(f"{name}:", df.shape)
+        return
+
+    # Validate environment variables
+    if not validate_env_vars():
+        print("Missing required environment variables. Terminating application.")
+        return
 
     # Database connection details
     db_user = os.getenv("DB_USER")
@@ -67,32 +109,6 @@ def main():
         customers_query += f" LIMIT {query_limit}"
         customers_from_sales_data_query += f" LIMIT {query_limit}"
 
-    # Fetch sales data
-    df_sales_full = fetch_data_in_batches(
-        query=sales_query,
-        db_user=db_user,
-        db_password=db_password,
-        db_host=db_host,
-        db_name=db_name,
-    )
-
-    # Fetch customers data
-    df_customers_full = fetch_data_in_batches(
-        query=customers_query,
-        db_user=db_user,
-        db_password=db_password,
-        db_host=db_host,
-        db_name=db_name,
-    )
-
-    customers_from_sales_data_df = fetch_data_in_batches(
-        query=customers_from_sales_data_query,
-        db_host=db_host,
-        db_user=db_user,
-        db_password=db_password,
-        db_name=db_name,
-    )
-
     # Database connection details
     etani_db_user = os.getenv("ETANI_DB_USER")
     etani_db_password = os.getenv("ETANI_DB_PASSWORD")
@@ -107,25 +123,116 @@ def main():
                             'TAZTECH_CLIENT8_XEROBLUE_Journals',
                             'TAZTECH_CLIENT9_XEROBLUE_Journals'
                             ]
-    # Xero journals tables from Etani
-    A_Journals = fetch_xero_journals_data_from_etani(db_server=etani_db_server,
-                                                     db_name=etani_db_name,
-                                                     db_user=etani_db_user,
-                                                     db_password=etani_db_password,
-                                                     journals_tables_list=journals_table_names,
-                                                     query_limit=query_limit)
+
+    # Every query shares the time budget of the fetch
+    time_budget = TimeBudget(time_budget_seconds)
+
+    # The three data warehouse queries share a pool of connections
+    mysql_pool = ConnectionPool(partial(pymysql.connect,
+                                        user=db_user,
+                                        password=db_password,
+                                        host=db_host,
+                                        database=db_name),
+                                max_size=3)
+    fetch_from_data_warehouse = partial(fetch_data_in_batches,
+                                        db_user=db_user,
+                                        db_password=db_password,
+                                        db_host=db_host,
+                                        db_name=db_name,
+                                        connection_pool=mysql_pool,
+                                        stream=True,
+                                        query_timeout=query_timeout,
+                                        time_budget=time_budget)
+
+    source_tasks = {
+        "df_sales_full": partial(fetch_from_data_warehouse, query=sales_query),
+        "df_customers_full": partial(fetch_from_data_warehouse, query=customers_query),
+        "customers_from_sales_data_df": partial(fetch_from_data_warehouse,
+                                                query=customers_from_sales_data_query),
+        "A_Journals": partial(fetch_batched_xero_journals_data,
+                              db_server=etani_db_server,
+                              db_name=etani_db_name,
+                              db_user=etani_db_user,
+                              db_password=etani_db_password,
+                              journals_tables_list=journals_table_names,
+                              query_limit=query_limit,
+                              max_workers=4,
+                              query_timeout=query_timeout,
+                              time_budget=time_budget,
+                              retries=2,
+                              journal_tables_pattern=journal_tables_pattern,
+                              columns=journal_columns,
+                              tables_per_query=4 if journal_columns else 1,
+                              max_rows_per_query=1000000),
+    }
+
+    # Incremental mode: sales and journals only fetch rows past the cached watermark
+    if cache_dir:
+        fetch_incrementally_from_data_warehouse = partial(fetch_data_incrementally,
+                                                          db_user=db_user,
+                                                          db_password=db_password,
+                                                          db_host=db_host,
+                                                          db_name=db_name,
+                                                          key_columns=["sale_id"],
+                                                          connection_pool=mysql_pool,
+                                                          query_timeout=query_timeout,
+                                                          time_budget=time_budget)
+        source_tasks["df_sales_full"] = partial(fetch_incrementally_from_data_warehouse,
+                                                query=sales_query,
+                                                cache_path=os.path.join(cache_dir, "sales.parquet"),
+                                                watermark_column="invoice_date")
+        source_tasks["customers_from_sales_data_df"] = partial(
+            fetch_incrementally_from_data_warehouse,
+            query=customers_from_sales_data_query,
+            cache_path=os.path.join(cache_dir, "customers_from_sales.parquet"),
+            watermark_column="date_field")
+        source_tasks["A_Journals"] = partial(fetch_xero_journals_data_incrementally,
+                                             db_server=etani_db_server,
+                                             db_name=etani_db_name,
+                                             db_user=etani_db_user,
+                                             db_password=etani_db_password,
+                                             journals_tables_list=journals_table_names,
+                                             cache_dir=os.path.join(cache_dir, "journals"),
+                                             watermark_column="JournalNumber",
+                                             max_workers=4,
+                                             columns=journal_columns,
+                                             tables_per_query=4 if journal_columns else 1,
+                                             query_timeout=query_timeout,
+                                             time_budget=time_budget,
+                                             retries=2,
+                                             journal_tables_pattern=journal_tables_pattern)
+
+    # Fetch sales, customers, customers from sales and Xero journals (from Etani) concurrently
+    with mysql_pool:
+        source_data = run_concurrently(source_tasks)
+
+    df_sales_full = source_data["df_sales_full"]
+    df_customers_full = source_data["df_customers_full"]
+    customers_from_sales_data_df = source_data["customers_from_sales_data_df"]
+    A_Journals = source_data["A_Journals"]
 
     # Get active customers
     df_filtered_active_customers = get_filtered_active_customers(customers_from_sales_data_df)
 
-    # Extract follow-up consults
-    follow_up_df = get_follow_up_consults(df_sales_full)
+    if workers:
+        # Extract follow-up consults, dental sales after consultation and lapsed clients on shards of clinics
+        sales_insights = run_insights_sharded(df_sales_full, max_workers=workers)
+        follow_up_df = sales_insights["get_follow_up_consults"]
+        consults_to_dental_df = sales_insights["get_dental_sales_after_consultation"]
+        lapsed_clients_df = sales_insights["get_lapsed_clients"]
+    else:
+        # Classify the products of the sales data once for the consult analyses
+        sales_product_index = ProductIndex(df_sales_full["product_name"])
 
-    # Extract dental sales after consultation within 14 days
-    consults_to_dental_df = get_dental_sales_after_consultation(df_sales_full)
+        # Extract follow-up consults
+        follow_up_df = get_follow_up_consults(df_sales_full, product_index=sales_product_index)
 
-    # Extract lapsed clients
-    lapsed_clients_df = get_lapsed_clients(df_sales_full)
+        # Extract dental sales after consultation within 14 days
+        consults_to_dental_df = get_dental_sales_after_consultation(df_sales_full,
+                                                                    product_index=sales_product_index)
+
+        # Extract lapsed clients
+        lapsed_clients_df = get_lapsed_clients(df_sales_full)
 
     print("Data extraction complete.")
     print("df_filtered_active_customers:", df_filtered_active_customers.shape)
@@ -136,6 +243,15 @@ def main():
     print("lapsed_clients_df:", lapsed_clients_df.shape)
     print("A_Journals:", A_Journals.shape)
 
+    if export_dir:
+        export_insights({
+            "df_filtered_active_customers": df_filtered_active_customers,
+            "follow_up_df": follow_up_df,
+            "consults_to_dental_df": consults_to_dental_df,
+            "lapsed_clients_df": lapsed_clients_df,
+            "A_Journals": A_Journals,
+        }, export_dir)
+
 
 if __name__ == "__main__":
     main()
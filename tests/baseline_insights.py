@@ -0,0 +1,150 @@
+"""
+The insights as they were computed before they were vectorized, kept as references for equivalence tests.
+"""
+
+import pandas as pd
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from vetbiz_extractor.utils.common import (
+    filter_data_for_date_range,
+    get_date_range_for_month,
+    get_products_list,
+)
+
+
+def get_dental_sales_after_consultation(
+    sales_data: pd.DataFrame, days_threshold: int = 14
+) -> pd.DataFrame:
+    """
+    Compare every unique consult record with every unique dental record.
+
+    :param sales_data: DataFrame containing sales data.
+    :param days_threshold: Number of days to define the threshold for sales after consultation.
+    :return: The unique dental (clinic_tk, customer_tk, invoice_date) records within the threshold of a consult.
+    """
+    return get_sales_after_trigger(sales_data, "consult", "dental", days_threshold)
+
+
+def get_sales_after_trigger(
+    sales_data: pd.DataFrame,
+    trigger_keyword: str,
+    target_keyword: str,
+    days_threshold: int = 14,
+) -> pd.DataFrame:
+    """
+    Compare every unique trigger record with every unique target record.
+
+    :param sales_data: DataFrame containing sales data.
+    :param trigger_keyword: Keyword of the products starting the window.
+    :param target_keyword: Keyword of the products sold within the window.
+    :param days_threshold: Number of days to define the threshold for sales after the trigger.
+    :return: The unique target (clinic_tk, customer_tk, invoice_date) records within the threshold of a trigger.
+    """
+    all_products = sales_data["product_name"].unique()
+
+    def filter_sales_data(products):
+        filtered_df = sales_data[sales_data.product_name.isin(products)]
+        return (
+            filtered_df[["clinic_tk", "customer_tk", "invoice_date"]]
+            .drop_duplicates()
+            .reset_index(drop=True)
+            .values
+        )
+
+    target_records = filter_sales_data(get_products_list(all_products, target_keyword))
+    trigger_records = filter_sales_data(
+        get_products_list(all_products, trigger_keyword)
+    )
+    results = [
+        target_record
+        for trigger_record in trigger_records
+        for target_record in target_records
+        if trigger_record[1] == target_record[1]
+        and trigger_record[2]
+        <= target_record[2]
+        <= trigger_record[2] + timedelta(days=days_threshold)
+    ]
+    return (
+        pd.DataFrame(results, columns=["clinic_tk", "customer_tk", "invoice_date"])
+        .drop_duplicates()
+        .reset_index(drop=True)
+    )
+
+
+def get_lapsed_clients(
+    sales_data: pd.DataFrame, start_year: int = 2018
+) -> pd.DataFrame:
+    """
+    Compare the P1 and P2 rows of every window, filtered month by month.
+
+    :param sales_data: DataFrame containing sales data.
+    :param start_year: The start year from which to measure inactivity.
+    :return: The P1 rows of the customers who did not buy in P2, with their l_period, window by window.
+    """
+    last_window_start = datetime.now().replace(day=1) - relativedelta(months=11)
+    lapsed_rows = []
+    counter = 0
+    for year in range(start_year, datetime.now().year + 1):
+        for month in range(1, 13):
+            p2_start, _ = get_date_range_for_month(year, month)
+            if not datetime(start_year, 7, 1) < p2_start <= last_window_start:
+                continue
+            counter += 1
+            p2_last_month = p2_start + relativedelta(months=11)
+            _, p2_end = get_date_range_for_month(
+                p2_last_month.year, p2_last_month.month
+            )
+            p1_df = sales_data[
+                (sales_data.invoice_date >= p2_start - relativedelta(months=12))
+                & (sales_data.invoice_date < p2_start)
+            ]
+            p2_df = sales_data[
+                (sales_data.invoice_date >= p2_start)
+                & (sales_data.invoice_date <= p2_end)
+            ]
+            lapsed_customers = set(p1_df["customer_tk"]) - set(p2_df["customer_tk"])
+            l_period = (
+                f"{counter}. {p2_start.strftime('%d-%b-%Y')} to "
+                f"{p2_end.strftime('%d-%b-%Y')}"
+            )
+            for values in p1_df[
+                p1_df["customer_tk"].isin(lapsed_customers)
+            ].values.tolist():
+                lapsed_rows.append(values + [l_period])
+    return pd.DataFrame(lapsed_rows, columns=list(sales_data.columns) + ["l_period"])
+
+
+def get_filtered_active_customers(
+    customers_from_sales_data_df: pd.DataFrame,
+    start_year: int = 2020,
+    months_threshold: int = 18,
+) -> pd.DataFrame:
+    """
+    Filter every month's rows, and the rows of its lookback period, from `start_year` to the end of the current year.
+
+    :param customers_from_sales_data_df: DataFrame containing customer sales data.
+    :param start_year: The start year from which to measure activity.
+    :param months_threshold: Number of months within which a customer must have made a purchase to be active.
+    :return: The rows of the customers who also bought in the lookback period of their month.
+    """
+    active_rows = []
+    for year in range(start_year, datetime.now().year + 1):
+        for month in range(1, 13):
+            start_date, end_date = get_date_range_for_month(year, month)
+            month_df = filter_data_for_date_range(
+                customers_from_sales_data_df, start_date, end_date
+            )
+            lookback_df = filter_data_for_date_range(
+                customers_from_sales_data_df,
+                start_date - relativedelta(months=months_threshold),
+                start_date - relativedelta(days=1),
+            )
+            customers = set(month_df.customer_tk.unique()).intersection(
+                set(lookback_df.customer_tk.unique())
+            )
+            active_rows.extend(
+                month_df[month_df["customer_tk"].isin(customers)].values.tolist()
+            )
+    return pd.DataFrame(
+        active_rows, columns=customers_from_sales_data_df.columns
+    ).reset_index(drop=True)
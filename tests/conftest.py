@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlite_stand_in import JOURNAL_TABLES, write_journals
+from vetbiz_extractor.utils.synthetic import generate_synthetic_sales_data
+
+
+def blank_customers(df: pd.DataFrame, fraction: float, seed: int) -> pd.DataFrame:
+    """
+    Blank the customer_tk of a fraction of the rows, as NULL keys come back from the database.
+
+    :param df: A synthetic sales frame.
+    :param fraction: Fraction of the rows without a customer.
+    :param seed: Seed of the random generator.
+    :return: A copy of the frame with an object customer_tk column holding None on the blanked rows.
+    """
+    df = df.copy()
+    customers = df["customer_tk"].astype(object)
+    customers[np.random.default_rng(seed).random(len(df)) < fraction] = None
+    df["customer_tk"] = customers
+    return df
+
+
+@pytest.fixture(params=[0, 3], ids=lambda seed: f"seed{seed}")
+def sales_data(request) -> pd.DataFrame:
+    """Synthetic sales lines since 2019, with NULL customers on 5% of the rows."""
+    return blank_customers(
+        generate_synthetic_sales_data(
+            2000,
+            n_customers=120,
+            start_date=pd.Timestamp(2019, 1, 1),
+            seed=request.param,
+        ),
+        0.05,
+        request.param,
+    )
+
+
+@pytest.fixture
+def journals_db(tmp_path) -> str:
+    """Path of a sqlite database with a journals table per tenant."""
+    path = str(tmp_path / "etani.db")
+    write_journals(path, JOURNAL_TABLES)
+    return path
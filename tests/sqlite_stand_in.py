@@ -0,0 +1,100 @@
+"""
+Local sqlite3 stand-ins of the Etani and data warehouse databases, injected through connection factories.
+"""
+
+import re
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional
+
+JOURNAL_TABLES = [
+    f"TAZTECH_CLIENT{client}_XEROBLUE_Journals" for client in range(3, 10)
+]
+
+
+class FlakyConnection:
+    """
+    A sqlite3 connection whose queries on some tables fail a number of times, like a dropped network connection.
+
+    Queries with parameters use the `%s` placeholders and `%%` escapes of pymssql and pymysql,
+    which are translated to sqlite's `?` and `%`.
+    """
+
+    def __init__(self, path: str, failures: Dict[str, int], lock: threading.Lock):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.failures = failures
+        self.lock = lock
+
+    def cursor(self) -> "FlakyCursor":
+        return FlakyCursor(self)
+
+    def interrupt(self) -> None:
+        self.connection.interrupt()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class FlakyCursor:
+    def __init__(self, connection: FlakyConnection):
+        self.connection = connection
+        self.cursor = connection.connection.cursor()
+
+    def execute(self, query: str, *args):
+        with self.connection.lock:
+            for table, failures in self.connection.failures.items():
+                if table in query and failures > 0:
+                    self.connection.failures[table] -= 1
+                    raise sqlite3.OperationalError(f"connection lost reading {table}")
+        if args:
+            query = re.sub(
+                r"%([%s])", lambda m: "?" if m.group(1) == "s" else "%", query
+            )
+        return self.cursor.execute(query, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def get_connection_factory(
+    path: str, failures: Optional[Dict[str, int]] = None
+) -> Callable[[], FlakyConnection]:
+    """Return a factory of connections to a sqlite database, sharing the number of failures left per table."""
+    lock = threading.Lock()
+    failures = dict(failures or {})
+    return lambda: FlakyConnection(path, failures, lock)
+
+
+def write_journals(path: str, tables: List[str], seed: int = 0) -> None:
+    """Write a journals table per tenant, of different sizes (the third one empty)."""
+    rng = np.random.default_rng(seed)
+    with sqlite3.connect(path) as connection:
+        for number, table in enumerate(tables):
+            rows = 0 if number == 2 else int(rng.integers(1, 500))
+            pd.DataFrame(
+                {
+                    "JournalID": np.arange(rows),
+                    "JournalNumber": np.arange(rows) + number * 10000,
+                    "JournalDate": pd.date_range("2021-01-01", periods=rows, freq="D")
+                    .strftime("%Y-%m-%d")
+                    .tolist(),
+                    "Amount": rng.normal(size=rows).round(2),
+                    "Reference": [f"INV-{number}-{row}" for row in range(rows)],
+                }
+            ).to_sql(table, connection, index=False)
+
+
+def read_journals(
+    path: str, tables: List[str], source_table_column: Optional[str] = None
+) -> pd.DataFrame:
+    """Read the journals tables one after another, the expected result of a fetch."""
+    with sqlite3.connect(path) as connection:
+        dfs = []
+        for table in tables:
+            df = pd.read_sql_query(f"SELECT * FROM {table}", connection)
+            if source_table_column:
+                df[source_table_column] = table
+            dfs.append(df)
+    return pd.concat([df for df in dfs if not df.empty], ignore_index=True)
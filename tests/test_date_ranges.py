@@ -0,0 +1,124 @@
+import importlib.util
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from dateutil.relativedelta import relativedelta
+from vetbiz_extractor.utils.common import (
+    DateIndexedFrame,
+    filter_data_for_date_range,
+    get_date_range_for_month,
+    get_month_windows,
+)
+from vetbiz_extractor.utils.synthetic import (
+    generate_synthetic_customers_from_sales_data,
+)
+
+BENCHMARK_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, "resources", "benchmark.py"
+)
+
+# Dates on both sides of month and year boundaries, with and without a time of day
+BOUNDARY_DATES = [
+    "2019-12-31",
+    "2019-12-31 23:59:59",
+    "2020-01-01",
+    "2020-01-01 00:00:01",
+    "2020-01-31",
+    "2020-02-01",
+    "2020-02-28",
+    "2020-02-29",
+    "2020-02-29 12:00:00",
+    "2020-03-01",
+    "2020-06-30",
+    "2020-07-01",
+    "2020-12-31",
+    "2021-01-01",
+    "2021-02-28",
+    "2021-03-01",
+    None,
+    "2020-01-01",
+    "2021-12-31 23:59:59",
+    "2022-01-01",
+]
+
+
+def load_benchmark():
+    """Import resources/benchmark.py, which is a script rather than a module of the package."""
+    spec = importlib.util.spec_from_file_location("benchmark", BENCHMARK_PATH)
+    benchmark = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(benchmark)
+    return benchmark
+
+
+@pytest.fixture
+def boundary_data():
+    return pd.DataFrame(
+        {
+            "customer_tk": np.arange(len(BOUNDARY_DATES)),
+            "date_field": pd.to_datetime(BOUNDARY_DATES, format="ISO8601"),
+        }
+    ).sample(frac=1, random_state=0)
+
+
+@pytest.mark.parametrize("lookback_months", [1, 12, 18])
+def test_date_indexed_ranges_match_masks(boundary_data, lookback_months):
+    date_indexed_data = DateIndexedFrame(boundary_data)
+    windows = get_month_windows(
+        2019 * 12 + 10, 2022 * 12 + 1, lookback_months=lookback_months
+    )
+
+    ranges = list(zip(windows.starts, windows.ends)) + list(
+        zip(windows.lookback_starts, windows.starts - np.timedelta64(1, "D"))
+    )
+    for start_date, end_date in ranges:
+        expected = filter_data_for_date_range(boundary_data, start_date, end_date)
+        result = filter_data_for_date_range(date_indexed_data, start_date, end_date)
+        # The date index returns the same rows, ordered by date
+        assert result["date_field"].is_monotonic_increasing
+        pd.testing.assert_frame_equal(result.sort_index(), expected.sort_index())
+
+
+def test_date_indexed_row_bounds_match_single_ranges(boundary_data):
+    date_indexed_data = DateIndexedFrame(boundary_data)
+    windows = get_month_windows(2019 * 12 + 11, 2021 * 12 + 2)
+
+    starts, stops = date_indexed_data.get_row_bounds(windows.starts, windows.ends)
+    for start, stop, start_date, end_date in zip(
+        starts, stops, windows.starts, windows.ends
+    ):
+        assert (start, stop) == date_indexed_data.get_row_bounds(start_date, end_date)
+    # Like the masks, the ranges end at midnight of their end date, and rows without a date are in no range
+    assert (stops - starts).sum() == sum(
+        len(filter_data_for_date_range(boundary_data, start_date, end_date))
+        for start_date, end_date in zip(windows.starts, windows.ends)
+    )
+
+
+def test_month_windows_match_calendar_months():
+    windows = get_month_windows(
+        2019 * 12 + 10, 2021 * 12 + 2, lookback_months=13, lookahead_months=11
+    )
+
+    for month, start, end, lookback_start, lookahead_end in zip(*windows):
+        year, month_number = divmod(int(month), 12)
+        month_start, month_end = get_date_range_for_month(year, month_number + 1)
+        lookahead_month = month_start + relativedelta(months=11)
+        assert pd.Timestamp(start) == month_start
+        assert pd.Timestamp(end) == month_end
+        assert pd.Timestamp(lookback_start) == month_start - relativedelta(months=13)
+        assert (
+            pd.Timestamp(lookahead_end)
+            == get_date_range_for_month(lookahead_month.year, lookahead_month.month)[1]
+        )
+    assert not windows.starts.flags.writeable
+
+
+def test_benchmarked_month_filters_match(sales_data):
+    benchmark = load_benchmark()
+    customers_from_sales = generate_synthetic_customers_from_sales_data(sales_data)
+
+    pd.testing.assert_frame_equal(
+        benchmark.filter_month_ranges_with_date_index(customers_from_sales),
+        benchmark.filter_month_ranges(customers_from_sales),
+    )
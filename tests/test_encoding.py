@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vetbiz_extractor.core.funnel_insights import FunnelRule, get_funnel_sales
+from vetbiz_extractor.core.insights_extractor import (
+    get_dental_sales_after_consultation,
+    get_filtered_active_customers,
+    get_follow_up_consults,
+    get_lapsed_clients,
+)
+from vetbiz_extractor.utils.encoding import decode_sales_data, encode_sales_data
+from vetbiz_extractor.utils.synthetic import (
+    generate_synthetic_customers_from_sales_data,
+)
+
+FUNNEL_RULES = [
+    FunnelRule("dental_after_consult", "consult", "dental", days_threshold=14),
+    FunnelRule("vaccination_after_consult", "consult", "vaccin", days_threshold=30),
+]
+
+
+def test_encoding_round_trips_missing_values():
+    df = pd.DataFrame(
+        {
+            # Integer ids with NULLs, as fetched from the database
+            "customer_tk": pd.Series([3, None, 1, 3, None], dtype=object),
+            "clinic_tk": [1.0, 2.0, np.nan, 1.0, 2.0],
+            "product_tk": pd.array([7, None, 7, 8, 9], dtype="Int64"),
+            "product_name": [
+                "Consultation",
+                None,
+                "Dental Scale",
+                None,
+                "Consultation",
+            ],
+            "invoice_date": pd.to_datetime(
+                ["2021-01-31", None, "2021-02-01", "1969-12-31", "2024-02-29"]
+            ),
+            "total_sale": [10.0, 20.0, np.nan, 5.0, 1.0],
+        }
+    )
+    encoded, encoding = encode_sales_data(df)
+
+    for column in ["customer_tk", "clinic_tk", "product_tk", "product_name"]:
+        assert isinstance(encoded[column].dtype, pd.CategoricalDtype)
+        np.testing.assert_array_equal(
+            encoded[column].cat.codes.to_numpy() == -1, df[column].isna().to_numpy()
+        )
+    assert encoded["invoice_date"].dtype == np.int32
+    assert encoded["total_sale"].dtype == df["total_sale"].dtype
+
+    decoded = decode_sales_data(encoded, encoding)
+
+    pd.testing.assert_frame_equal(decoded, df)
+    # Missing values of object columns come back as None, not NaN
+    assert decoded["customer_tk"].tolist() == df["customer_tk"].tolist()
+    assert decoded["product_name"].tolist() == df["product_name"].tolist()
+
+
+def test_decoding_a_subset_of_rows_and_columns():
+    df = pd.DataFrame(
+        {
+            "customer_tk": pd.Series([3, None, 1], dtype=object),
+            "product_name": ["Consultation", None, "Dental Scale"],
+            "invoice_date": pd.to_datetime(["2021-01-31", None, "2021-02-01"]),
+        }
+    )
+    encoded, encoding = encode_sales_data(df)
+
+    pd.testing.assert_frame_equal(
+        decode_sales_data(encoded.iloc[1:][["customer_tk", "invoice_date"]], encoding),
+        df.iloc[1:][["customer_tk", "invoice_date"]],
+    )
+
+
+# A None decoded as NaN (or the other way around) must fail the comparisons
+@pytest.mark.filterwarnings("error::FutureWarning")
+@pytest.mark.parametrize(
+    "insight",
+    [
+        get_follow_up_consults,
+        get_dental_sales_after_consultation,
+        get_lapsed_clients,
+        lambda sales_data: get_funnel_sales(sales_data, FUNNEL_RULES),
+    ],
+    ids=["follow_up_consults", "dental_sales", "lapsed_clients", "funnel_sales"],
+)
+def test_insights_on_encoded_sales_data_match_raw(sales_data, insight):
+    encoded, encoding = encode_sales_data(sales_data)
+
+    pd.testing.assert_frame_equal(
+        decode_sales_data(insight(encoded), encoding), insight(sales_data)
+    )
+
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_active_customers_on_encoded_data_match_raw(sales_data):
+    customers_from_sales = generate_synthetic_customers_from_sales_data(sales_data)
+    encoded, encoding = encode_sales_data(customers_from_sales)
+
+    pd.testing.assert_frame_equal(
+        decode_sales_data(get_filtered_active_customers(encoded), encoding),
+        get_filtered_active_customers(customers_from_sales),
+    )
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from typing import Optional
+from vetbiz_extractor.core.insights_extractor import (
+    get_follow_up_consults,
+    get_lapsed_clients,
+)
+from vetbiz_extractor.utils.common import get_month_index
+from vetbiz_extractor.utils.export import (
+    DEFAULT_EXPORT_PARTITIONS,
+    UNDATED_FILE,
+    export_insights,
+    read_exported_insight,
+    read_exported_insights,
+)
+
+
+def normalize_exported(df: pd.DataFrame) -> pd.DataFrame:
+    """Read categoricals back as objects, with NaN for every missing value."""
+    categorical_columns = [
+        column
+        for column, dtype in df.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    df = df.astype({column: object for column in categorical_columns})
+    return df.astype({"customer_tk": float}).fillna(np.nan)
+
+
+def sort_exported(df: pd.DataFrame, partition_column: Optional[str]) -> pd.DataFrame:
+    """Order the rows as read back: by month of the partition column (undated rows last), stably."""
+    if partition_column is not None:
+        months = get_month_index(df[partition_column]).fillna(np.inf)
+        df = df.iloc[np.argsort(months.to_numpy(), kind="stable")]
+    return normalize_exported(df).reset_index(drop=True)
+
+
+@pytest.fixture
+def insights(sales_data):
+    lapsed_clients_df = get_lapsed_clients(sales_data)
+    # Exported rows without a date go to their own file
+    follow_up_df = get_follow_up_consults(sales_data)
+    follow_up_df.loc[follow_up_df.index[::10], "invoice_date"] = pd.NaT
+    return {
+        "lapsed_clients_df": lapsed_clients_df,
+        "follow_up_df": follow_up_df,
+        "sales_data": sales_data,
+    }
+
+
+@pytest.mark.parametrize("min_rows_per_file", [1, 500, 10**9])
+def test_exported_insights_round_trip(tmp_path, insights, min_rows_per_file):
+    export_dir = str(tmp_path / "export")
+    export_insights(insights, export_dir, min_rows_per_file=min_rows_per_file)
+    result = read_exported_insights(export_dir)
+
+    assert set(result) == set(insights)
+    for name, df in insights.items():
+        pd.testing.assert_frame_equal(
+            normalize_exported(result[name]),
+            sort_exported(df, DEFAULT_EXPORT_PARTITIONS.get(name)),
+        )
+
+
+def test_small_months_are_grouped_into_files(tmp_path, insights):
+    export_dir = str(tmp_path / "export")
+    follow_up_df = insights["follow_up_df"]
+
+    report = export_insights(
+        {"follow_up_df": follow_up_df}, export_dir, min_rows_per_file=50
+    )
+    version = report["version"]
+    file_names = sorted(os.listdir(os.path.join(export_dir, version, "follow_up_df")))
+    dated_rows = follow_up_df["invoice_date"].notna().sum()
+
+    assert UNDATED_FILE in file_names
+    assert report["outputs"]["follow_up_df"]["files"] == len(file_names)
+    # Every file of months but the last holds at least 50 rows
+    assert len(file_names) - 1 <= dated_rows // 50 + 1
+    assert file_names[0].startswith(
+        follow_up_df["invoice_date"].min().strftime("%Y-%m")
+    )
+    assert file_names[-2].endswith(
+        f"_{follow_up_df['invoice_date'].max().strftime('%Y-%m')}.parquet"
+    )
+    for file_name in file_names[:-2]:
+        rows = len(
+            pd.read_parquet(
+                os.path.join(export_dir, version, "follow_up_df", file_name)
+            )
+        )
+        assert rows >= 50
+
+    pd.testing.assert_frame_equal(
+        normalize_exported(read_exported_insight(export_dir, "follow_up_df")),
+        sort_exported(follow_up_df, "invoice_date"),
+    )
+
+
+def test_reading_a_missing_export_raises(tmp_path, insights):
+    export_dir = str(tmp_path / "export")
+    os.makedirs(export_dir)
+
+    with pytest.raises(FileNotFoundError):
+        read_exported_insights(export_dir)
+    export_insights({"sales_data": insights["sales_data"]}, export_dir)
+    with pytest.raises(FileNotFoundError):
+        read_exported_insight(export_dir, "lapsed_clients_df")
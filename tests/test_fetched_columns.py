@@ -0,0 +1,195 @@
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import pytest
+from pymysql.constants import FIELD_TYPE
+from vetbiz_extractor.utils.common import (
+    MSSQL_COLUMN_KINDS,
+    MYSQL_COLUMN_KINDS,
+    convert_column_values,
+    downcast_columns,
+    fetch_cursor_dataframe,
+    finalize_fetched_dataframe,
+    get_column_kinds,
+)
+
+# Columns of a sales query as described by a pymysql cursor:
+# (name, type_code, display_size, internal_size, precision, scale, null_ok)
+MYSQL_DESCRIPTION = (
+    ("sale_id", FIELD_TYPE.LONGLONG, None, 20, 20, 0, False),
+    ("customer_tk", FIELD_TYPE.LONG, None, 11, 11, 0, True),
+    ("clinic_tk", FIELD_TYPE.LONG, None, 11, 11, 0, False),
+    ("total_sale", FIELD_TYPE.NEWDECIMAL, None, 12, 12, 2, True),
+    ("unit_cost", FIELD_TYPE.DOUBLE, None, 22, 22, 31, True),
+    ("invoice_date", FIELD_TYPE.DATE, None, 10, 10, 0, True),
+    ("updated_at", FIELD_TYPE.DATETIME, None, 19, 19, 0, True),
+    ("product_name", FIELD_TYPE.VAR_STRING, None, 1020, 1020, 0, True),
+)
+# customer_tk has no NULLs in the first batch of two rows
+MYSQL_ROWS = [
+    (
+        1,
+        10,
+        1,
+        Decimal("12.50"),
+        1.5,
+        date(2023, 1, 31),
+        datetime(2023, 1, 31, 9, 30),
+        "Consultation",
+    ),
+    (2, 11, 1, None, None, date(2023, 2, 1), None, "Dental Extraction"),
+    (3, None, 2, Decimal("-3.10"), 2.0, None, datetime(2024, 2, 29, 23, 59, 59), None),
+    (
+        4,
+        10,
+        2,
+        Decimal("0.00"),
+        0.0,
+        date(1969, 12, 31),
+        datetime(2023, 3, 1),
+        "Consultation",
+    ),
+    (
+        5,
+        None,
+        1,
+        Decimal("7.25"),
+        3.5,
+        date(2024, 2, 29),
+        datetime(2023, 3, 2),
+        "Consultation",
+    ),
+]
+MYSQL_DTYPES = {
+    "sale_id": np.dtype(np.int64),
+    "customer_tk": np.dtype(np.float64),
+    "clinic_tk": np.dtype(np.int64),
+    "total_sale": np.dtype(np.float64),
+    "unit_cost": np.dtype(np.float64),
+    "invoice_date": np.dtype("datetime64[ns]"),
+    "updated_at": np.dtype("datetime64[ns]"),
+    "product_name": np.dtype(object),
+}
+
+
+class DescribedCursor:
+    """A DB-API cursor returning fixed rows with a driver's description."""
+
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+def test_mysql_type_codes_map_to_column_kinds():
+    assert get_column_kinds(MYSQL_DESCRIPTION, MYSQL_COLUMN_KINDS) == [
+        "integer",
+        "integer",
+        "integer",
+        "float",
+        "float",
+        "date",
+        "datetime",
+        "object",
+    ]
+
+
+@pytest.mark.parametrize(
+    "values, kind, expected",
+    [
+        ([1, 2, 3], "integer", np.array([1, 2, 3], dtype=np.int64)),
+        ([1, None, 3], "integer", np.array([1.0, np.nan, 3.0])),
+        ([Decimal("1.10"), None], "float", np.array([1.1, np.nan])),
+        (
+            [date(2023, 12, 31), None, date(1969, 12, 31)],
+            "date",
+            np.array(["2023-12-31", "NaT", "1969-12-31"], dtype="datetime64[ns]"),
+        ),
+        (
+            [datetime(2024, 2, 29, 23, 59, 59), None],
+            "datetime",
+            np.array(["2024-02-29T23:59:59", "NaT"], dtype="datetime64[ns]"),
+        ),
+        (["a", None], "object", np.array(["a", None], dtype=object)),
+    ],
+)
+def test_column_values_convert_to_typed_arrays(values, kind, expected):
+    column = convert_column_values(values, kind)
+
+    assert column.dtype == expected.dtype
+    np.testing.assert_array_equal(column, expected)
+
+
+@pytest.mark.parametrize("max_queued_batches", [0, 2])
+def test_mysql_rows_fetch_into_typed_columns(max_queued_batches):
+    cursor = DescribedCursor(MYSQL_DESCRIPTION, MYSQL_ROWS)
+    df = fetch_cursor_dataframe(
+        cursor, 2, MYSQL_COLUMN_KINDS, max_queued_batches=max_queued_batches
+    )
+
+    # customer_tk is int64 in the first batch and float64 with NaN once NULLs are fetched
+    assert df.dtypes.to_dict() == MYSQL_DTYPES
+    assert df["customer_tk"].isna().tolist() == [False, False, True, False, True]
+    assert df["total_sale"].iloc[0] == 12.5
+    assert df["total_sale"].isna().tolist() == [False, True, False, False, False]
+    assert df["invoice_date"].isna().tolist() == [False, False, True, False, False]
+    assert df["invoice_date"].iloc[3] == pd.Timestamp(1969, 12, 31)
+    assert df["updated_at"].iloc[2] == pd.Timestamp(2024, 2, 29, 23, 59, 59)
+
+
+def test_fetched_mysql_columns_downcast():
+    cursor = DescribedCursor(MYSQL_DESCRIPTION, MYSQL_ROWS)
+    df = downcast_columns(fetch_cursor_dataframe(cursor, 2, MYSQL_COLUMN_KINDS))
+
+    assert df.dtypes.to_dict() == {
+        **MYSQL_DTYPES,
+        "sale_id": np.dtype(np.int32),
+        "clinic_tk": np.dtype(np.int32),
+        "product_name": pd.CategoricalDtype(["Consultation", "Dental Extraction"]),
+    }
+    assert df["product_name"].isna().tolist() == [False, False, True, False, False]
+
+
+def test_downcast_keeps_columns_that_do_not_fit():
+    df = pd.DataFrame(
+        {
+            "journal_number": np.array([1, 2**40], dtype=np.int64),
+            "reference": ["INV-1", "INV-2"],
+            "mixed": ["a", 1],
+        }
+    )
+
+    assert downcast_columns(df).dtypes.to_dict() == df.dtypes.to_dict()
+
+
+def test_fetched_mssql_columns_finalize():
+    # pymssql describes every numeric column as NUMBER, so integers are inferred
+    description = (
+        ("JournalNumber", 3, None, None, None, None, None),
+        ("Amount", 5, None, None, None, None, None),
+        ("JournalDate", 4, None, None, None, None, None),
+        ("Reference", 1, None, None, None, None, None),
+        ("Empty", 1, None, None, None, None, None),
+    )
+    rows = [
+        (1, Decimal("10.00"), datetime(2023, 1, 1), "INV-1", None),
+        (2, None, None, "INV-1", None),
+        (3, Decimal("-2.50"), datetime(2023, 1, 2), None, None),
+    ]
+    df = finalize_fetched_dataframe(
+        fetch_cursor_dataframe(
+            DescribedCursor(description, rows), 2, MSSQL_COLUMN_KINDS
+        ),
+        downcast=True,
+    )
+
+    assert df.dtypes.to_dict() == {
+        "JournalNumber": np.dtype(np.int32),
+        "Amount": np.dtype(np.float64),
+        "JournalDate": np.dtype("datetime64[ns]"),
+        "Reference": pd.CategoricalDtype(["INV-1"]),
+    }
@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+import baseline_insights
+from test_insights_extractor import sort_rows
+from vetbiz_extractor.core.funnel_insights import (
+    RULE_COLUMN,
+    FunnelRule,
+    get_funnel_sales,
+)
+
+# Several rules with different windows, sharing their trigger and overlapping on products:
+# every "Re-check Consultation" is also a "consult", and "consult" after "consult" matches its own records
+RULES = [
+    FunnelRule("dental_after_consult", "consult", "dental", days_threshold=14),
+    FunnelRule("vaccination_after_consult", "consult", "vaccin", days_threshold=30),
+    FunnelRule("dental_same_day", "consult", "dental", days_threshold=0),
+    FunnelRule("recheck_after_consult", "consult", "re-check", days_threshold=60),
+    FunnelRule("consult_after_consult", "consult", "consult", days_threshold=7),
+    FunnelRule("consult_after_recheck", "re-check", "consultation", days_threshold=90),
+]
+
+
+def get_expected_funnel_sales(sales_data, rules):
+    """Compute every rule with the brute-force baseline and tag its records with the rule id."""
+    return pd.concat(
+        [
+            baseline_insights.get_sales_after_trigger(
+                sales_data,
+                rule.trigger_keyword,
+                rule.target_keyword,
+                rule.days_threshold,
+            ).assign(**{RULE_COLUMN: rule.rule_id})
+            for rule in rules
+        ],
+        ignore_index=True,
+    )
+
+
+def test_funnel_sales_match_baseline(sales_data):
+    result = get_funnel_sales(sales_data, RULES)
+
+    assert set(result[RULE_COLUMN]) == {rule.rule_id for rule in RULES}
+    pd.testing.assert_frame_equal(
+        sort_rows(result),
+        sort_rows(get_expected_funnel_sales(sales_data, RULES)),
+        check_dtype=False,
+    )
+
+
+def test_funnel_rules_are_independent(sales_data):
+    result = get_funnel_sales(sales_data, RULES)
+
+    # The records are ordered by rule, and each rule matches as if it were computed alone
+    rule_ids = [rule.rule_id for rule in RULES]
+    assert result[RULE_COLUMN].map(rule_ids.index).is_monotonic_increasing
+    for rule in RULES:
+        pd.testing.assert_frame_equal(
+            result[result[RULE_COLUMN] == rule.rule_id].reset_index(drop=True),
+            get_funnel_sales(sales_data, [rule]),
+        )
+
+
+def test_funnel_windows_are_nested(sales_data):
+    windows = [0, 14, 60]
+    rules = [
+        FunnelRule(f"dental_within_{days}", "consult", "dental", days_threshold=days)
+        for days in windows
+    ]
+    result = get_funnel_sales(sales_data, rules)
+
+    def records(days):
+        rule_df = result[result[RULE_COLUMN] == f"dental_within_{days}"]
+        # NaN customers would never equal each other in a set
+        rule_df = sort_rows(rule_df).fillna({"customer_tk": -1})
+        return set(map(tuple, rule_df.drop(columns=RULE_COLUMN).values))
+
+    assert records(0) < records(14) < records(60)
+
+
+def test_duplicate_funnel_rule_ids_raise(sales_data):
+    with pytest.raises(ValueError):
+        get_funnel_sales(
+            sales_data,
+            [
+                FunnelRule("dental", "consult", "dental", days_threshold=14),
+                FunnelRule("dental", "consult", "dental", days_threshold=30),
+            ],
+        )
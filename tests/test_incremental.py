@@ -0,0 +1,223 @@
+import os
+import sqlite3
+from functools import partial
+import pandas as pd
+from sqlite_stand_in import JOURNAL_TABLES, get_connection_factory, read_journals
+from vetbiz_extractor.utils.common import (
+    FAILED_TABLES_ATTR,
+    PARTIAL_RESULT_ATTR,
+    PARTIAL_TABLES_ATTR,
+)
+from vetbiz_extractor.utils.connection_pool import ConnectionPool
+from vetbiz_extractor.utils.incremental import (
+    fetch_data_incrementally,
+    fetch_xero_journals_data_incrementally,
+    merge_incremental_rows,
+)
+from vetbiz_extractor.utils.journals import JOURNAL_TABLES_PATTERN
+from vetbiz_extractor.utils.time_budget import TimeBudget
+
+
+def fetch_journals_incrementally(journals_db, cache_dir, failures=None, **kwargs):
+    return fetch_xero_journals_data_incrementally(
+        "server",
+        "user",
+        "password",
+        "etani",
+        JOURNAL_TABLES,
+        cache_dir=cache_dir,
+        watermark_column="JournalNumber",
+        key_columns=["JournalID"],
+        max_workers=3,
+        connection_factory=get_connection_factory(journals_db, failures),
+        **kwargs,
+    )
+
+
+def append_journal(journals_db, table, journal_id, journal_number):
+    with sqlite3.connect(journals_db) as connection:
+        connection.execute(
+            f"INSERT INTO {table} VALUES (?, ?, '2024-01-01', 1.5, 'INV-new')",
+            (journal_id, journal_number),
+        )
+
+
+def test_incremental_journals_fetch_new_rows(journals_db, tmp_path):
+    cache_dir = str(tmp_path / "journals")
+    cold = fetch_journals_incrementally(journals_db, cache_dir)
+    append_journal(journals_db, JOURNAL_TABLES[0], 100000, 100000)
+
+    warm = fetch_journals_incrementally(journals_db, cache_dir)
+
+    expected = read_journals(journals_db, JOURNAL_TABLES)
+    assert len(warm) == len(cold) + 1
+    pd.testing.assert_frame_equal(
+        warm.sort_values("JournalNumber").reset_index(drop=True),
+        expected.sort_values("JournalNumber").reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert warm.attrs == {}
+
+
+def test_incremental_journals_report_failed_tables(journals_db, tmp_path):
+    cache_dir = str(tmp_path / "journals")
+    cold = fetch_journals_incrementally(journals_db, cache_dir)
+    failed_table = JOURNAL_TABLES[0]
+    append_journal(journals_db, failed_table, 100000, 100000)
+
+    warm = fetch_journals_incrementally(journals_db, cache_dir, {failed_table: 1})
+
+    # The failed table keeps its cached rows, without the new one
+    assert len(warm) == len(cold)
+    assert warm.attrs[PARTIAL_RESULT_ATTR] is True
+    assert warm.attrs[FAILED_TABLES_ATTR] == [failed_table]
+
+
+def test_incremental_journals_retry_failed_tables(journals_db, tmp_path):
+    failed_table = JOURNAL_TABLES[0]
+
+    result = fetch_journals_incrementally(
+        journals_db,
+        str(tmp_path / "journals"),
+        {failed_table: 1},
+        retries=1,
+        retry_backoff_seconds=0.01,
+    )
+
+    assert len(result) == len(read_journals(journals_db, JOURNAL_TABLES))
+    assert result.attrs == {}
+
+
+def test_incremental_journals_discover_tables(journals_db, tmp_path):
+    result = fetch_xero_journals_data_incrementally(
+        "server",
+        "user",
+        "password",
+        "etani",
+        None,
+        cache_dir=str(tmp_path / "journals"),
+        watermark_column="JournalNumber",
+        connection_factory=get_connection_factory(journals_db),
+        journal_tables_pattern=JOURNAL_TABLES_PATTERN,
+        dialect="sqlite",
+    )
+
+    assert len(result) == len(read_journals(journals_db, JOURNAL_TABLES))
+    assert sorted(os.listdir(tmp_path / "journals")) == sorted(
+        f"{table}.parquet" for table in JOURNAL_TABLES if table != JOURNAL_TABLES[2]
+    )
+
+
+def test_incremental_journals_do_not_cache_cut_short_tables(journals_db, tmp_path):
+    cache_dir = str(tmp_path / "journals")
+
+    cut_short = fetch_journals_incrementally(
+        journals_db, cache_dir, batch_size=1, time_budget=TimeBudget(0)
+    )
+
+    assert cut_short.attrs[PARTIAL_RESULT_ATTR] is True
+    assert cut_short.attrs[PARTIAL_TABLES_ATTR]
+    assert not os.path.exists(cache_dir)
+
+    full = fetch_journals_incrementally(journals_db, cache_dir)
+
+    assert len(full) == len(read_journals(journals_db, JOURNAL_TABLES))
+    assert full.attrs == {}
+
+
+def test_incremental_query_does_not_cache_cut_short_fetch(journals_db, tmp_path):
+    cache_path = str(tmp_path / "journals.parquet")
+    fetch = partial(
+        fetch_data_incrementally,
+        f"SELECT * FROM {JOURNAL_TABLES[0]}",
+        cache_path,
+        "JournalNumber",
+        "user",
+        "password",
+        "host",
+        "database",
+        batch_size=1,
+        connection_pool=ConnectionPool(get_connection_factory(journals_db)),
+    )
+
+    cut_short = fetch(time_budget=TimeBudget(0))
+
+    assert cut_short.attrs[PARTIAL_RESULT_ATTR] is True
+    assert not os.path.exists(cache_path)
+
+    full = fetch()
+
+    assert len(full) == len(read_journals(journals_db, JOURNAL_TABLES[:1]))
+    assert os.path.exists(cache_path)
+
+
+def test_merge_incremental_rows_keeps_rows_without_watermark():
+    cached = pd.DataFrame(
+        {
+            "sale_id": [1, 2, 3, 4],
+            "invoice_date": pd.to_datetime(["2024-01-01", "2024-01-02", None, None]),
+        }
+    )
+    new_rows = pd.DataFrame(
+        {
+            "sale_id": [2, 4, 5],
+            "invoice_date": pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-03"]),
+        }
+    )
+
+    merged = merge_incremental_rows(cached, new_rows, "invoice_date", ["sale_id"])
+
+    # Sale 3 was never fetched again, and sale 4 got an invoice date
+    pd.testing.assert_frame_equal(
+        merged.sort_values("sale_id", ignore_index=True),
+        pd.concat([cached.iloc[[0, 2]], new_rows]).sort_values(
+            "sale_id", ignore_index=True
+        ),
+    )
+
+
+def write_sales(path, sales):
+    with sqlite3.connect(path) as connection:
+        pd.DataFrame(sales, columns=["sale_id", "invoice_day", "product_name"]).to_sql(
+            "sales", connection, index=False, if_exists="append"
+        )
+
+
+def test_incremental_fetch_matches_cold_fetch(tmp_path):
+    path = str(tmp_path / "warehouse.db")
+    write_sales(
+        path,
+        [
+            (1, 20240101, "Dental scale"),
+            (2, None, "Dental polish"),
+            (3, 20240102, "Consult"),
+            (4, 20240102, "Dental scale"),
+        ],
+    )
+    fetch = partial(
+        fetch_data_incrementally,
+        # A LIKE pattern with literal % characters
+        "SELECT * FROM sales WHERE product_name LIKE '%Dental%'",
+        watermark_column="invoice_day",
+        db_user="user",
+        db_password="password",
+        db_host="host",
+        db_name="database",
+        key_columns=["sale_id"],
+        connection_pool=ConnectionPool(get_connection_factory(path)),
+    )
+    fetch(cache_path=str(tmp_path / "warm.parquet"))
+    write_sales(path, [(5, 20240103, "Dental scale"), (6, None, "Dental x-ray")])
+
+    warm = fetch(cache_path=str(tmp_path / "warm.parquet"))
+    cold = fetch(cache_path=str(tmp_path / "cold.parquet"))
+
+    # Sale 6 has no invoice day, so it is only fetched by a cold run
+    pd.testing.assert_frame_equal(
+        warm.astype({"invoice_day": float}).sort_values("sale_id", ignore_index=True),
+        cold[cold["sale_id"] != 6]
+        .astype({"invoice_day": float})
+        .sort_values("sale_id", ignore_index=True),
+        check_dtype=False,
+    )
+    assert warm["sale_id"].tolist().count(2) == 1
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime
+import pandas as pd
+import pytest
+from test_insights_extractor import sort_rows
+from vetbiz_extractor.core import insights_cache, insights_extractor
+from vetbiz_extractor.core.insights_cache import (
+    INSIGHT_SPECS,
+    run_insight_incrementally,
+)
+from vetbiz_extractor.utils.product_index import ProductIndex
+from vetbiz_extractor.utils.synthetic import (
+    generate_synthetic_customers_from_sales_data,
+)
+
+
+@pytest.fixture
+def set_now(monkeypatch):
+    """Return a function freezing the current time of the insights functions and their cache."""
+
+    def set_now(now: datetime) -> None:
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now
+
+        for module in (insights_cache, insights_extractor):
+            monkeypatch.setattr(module, "datetime", FrozenDatetime)
+
+    return set_now
+
+
+def get_insight_data(insight, sales_data):
+    if INSIGHT_SPECS[insight].date_column == "date_field":
+        return generate_synthetic_customers_from_sales_data(sales_data)
+    return sales_data
+
+
+def assert_same_rows(result, expected):
+    pd.testing.assert_frame_equal(
+        sort_rows(result), sort_rows(expected), check_dtype=False
+    )
+
+
+@pytest.mark.parametrize("insight", list(INSIGHT_SPECS))
+def test_warm_runs_match_direct_calls(insight, sales_data, tmp_path, set_now):
+    function = INSIGHT_SPECS[insight].function
+    cache_dir = str(tmp_path / "insights")
+    set_now(datetime(2024, 6, 15))
+    data = get_insight_data(insight, sales_data)
+
+    cold = run_insight_incrementally(insight, data, cache_dir)
+    assert_same_rows(cold, function(data))
+
+    # Rows removed from some months and the cache reused
+    changed_data = data.drop(index=data.index[::40])
+    warm = run_insight_incrementally(insight, changed_data, cache_dir)
+    assert_same_rows(warm, function(changed_data))
+
+    # The month moves on: new lapsed-client windows elapse
+    set_now(datetime(2024, 7, 2))
+    next_month = run_insight_incrementally(insight, changed_data, cache_dir)
+    assert_same_rows(next_month, function(changed_data))
+
+
+def test_run_without_metadata_recomputes_results(sales_data, tmp_path):
+    cache_dir = str(tmp_path / "insights")
+    run_insight_incrementally("get_follow_up_consults", sales_data, cache_dir)
+    # As left by a run interrupted after writing the results
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if name == "metadata.json":
+                os.remove(os.path.join(root, name))
+
+    result = run_insight_incrementally(
+        "get_follow_up_consults", sales_data.iloc[100:], cache_dir
+    )
+
+    assert_same_rows(
+        result, INSIGHT_SPECS["get_follow_up_consults"].function(sales_data.iloc[100:])
+    )
+
+
+def test_parameters_must_be_json_serializable(sales_data, tmp_path):
+    with pytest.raises(ValueError, match="JSON-serializable"):
+        run_insight_incrementally(
+            "get_follow_up_consults",
+            sales_data,
+            str(tmp_path / "insights"),
+            product_index=ProductIndex(sales_data["product_name"]),
+        )
@@ -0,0 +1,143 @@
+import pandas as pd
+import pytest
+import baseline_insights
+from vetbiz_extractor.core.chunked_insights import iter_filtered_active_customers
+from vetbiz_extractor.core.insights_extractor import (
+    get_dental_sales_after_consultation,
+    get_filtered_active_customers,
+    get_lapsed_client_periods,
+    get_lapsed_clients,
+    materialize_lapsed_clients,
+)
+from vetbiz_extractor.utils.partitioned_dataset import write_month_partitions
+from vetbiz_extractor.utils.synthetic import (
+    generate_synthetic_customers_from_sales_data,
+)
+
+
+def sort_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Order the rows by all columns, to compare results whose row order differs."""
+    return normalize_customers(df.sort_values(list(df.columns)).reset_index(drop=True))
+
+
+def normalize_customers(df: pd.DataFrame) -> pd.DataFrame:
+    """Represent missing customers as NaN, whether they are None or NaN."""
+    return df.assign(customer_tk=df["customer_tk"].astype(float))
+
+
+@pytest.mark.parametrize("days_threshold", [0, 14, 60])
+def test_dental_sales_after_consultation_match_baseline(sales_data, days_threshold):
+    expected = baseline_insights.get_dental_sales_after_consultation(
+        sales_data, days_threshold
+    )
+    result = get_dental_sales_after_consultation(sales_data, days_threshold)
+
+    pd.testing.assert_frame_equal(
+        sort_rows(result), sort_rows(expected), check_dtype=False
+    )
+
+
+@pytest.mark.parametrize("customer_dtype", [object, float])
+def test_dental_sales_after_consultation_match_missing_customers(customer_dtype):
+    sales_data = pd.DataFrame(
+        {
+            "clinic_tk": [1, 1, 1],
+            "customer_tk": pd.Series([None, None, 7], dtype=customer_dtype),
+            "invoice_date": pd.to_datetime(["2023-03-01", "2023-03-04", "2023-03-04"]),
+            "product_name": ["Consultation", "Dental Extraction", "Dental Extraction"],
+        }
+    )
+
+    result = get_dental_sales_after_consultation(sales_data)
+
+    assert len(result) == 1
+    assert result["customer_tk"].isna().all()
+    assert result["invoice_date"].tolist() == [pd.Timestamp("2023-03-04")]
+
+
+@pytest.mark.parametrize("customer_dtype", [object, float])
+@pytest.mark.parametrize("start_year", [2018, 2020])
+def test_materialized_lapsed_clients_match_baseline(
+    sales_data, customer_dtype, start_year
+):
+    # The missing customers are None as objects and NaN as floats
+    lapsed_clients = get_lapsed_client_periods(
+        sales_data.astype({"customer_tk": customer_dtype}), start_year
+    )
+    expected = baseline_insights.get_lapsed_clients(sales_data, start_year)
+
+    assert sales_data["customer_tk"].isna().any()
+    assert expected["customer_tk"].isna().any()
+    pd.testing.assert_frame_equal(
+        normalize_customers(materialize_lapsed_clients(sales_data, lapsed_clients)),
+        normalize_customers(expected),
+        check_dtype=False,
+    )
+    pd.testing.assert_frame_equal(
+        normalize_customers(get_lapsed_clients(sales_data, start_year)),
+        normalize_customers(expected),
+        check_dtype=False,
+    )
+
+
+def test_materialized_lapsed_clients_select_columns(sales_data):
+    lapsed_clients = get_lapsed_client_periods(sales_data)
+    columns = ["customer_tk", "invoice_date"]
+
+    pd.testing.assert_frame_equal(
+        materialize_lapsed_clients(sales_data, lapsed_clients, columns),
+        get_lapsed_clients(sales_data)[columns + ["l_period"]],
+    )
+    assert list(lapsed_clients.periods["l_period"]) == sorted(
+        set(lapsed_clients.periods["l_period"]),
+        key=lambda label: int(label.split(".")[0]),
+    )
+
+
+@pytest.mark.parametrize("start_year, months_threshold", [(2020, 18), (2021, 6)])
+def test_filtered_active_customers_match_baseline(
+    sales_data, start_year, months_threshold
+):
+    customers_from_sales_data = generate_synthetic_customers_from_sales_data(sales_data)
+    expected = baseline_insights.get_filtered_active_customers(
+        customers_from_sales_data, start_year, months_threshold
+    )
+    result = get_filtered_active_customers(
+        customers_from_sales_data, start_year, months_threshold
+    )
+
+    assert result["customer_tk"].isna().any()
+    pd.testing.assert_frame_equal(
+        normalize_customers(result), normalize_customers(expected), check_dtype=False
+    )
+
+
+def test_filtered_active_customers_use_calendar_months():
+    customers_from_sales_data = pd.DataFrame(
+        {
+            "customer_tk": [1, 1],
+            "date_field": [
+                pd.Timestamp(2022, 12, 5),
+                pd.Timestamp(2023, 1, 31, 15, 30),
+            ],
+        }
+    )
+
+    result = get_filtered_active_customers(customers_from_sales_data, 2023)
+
+    assert result["date_field"].tolist() == [pd.Timestamp("2023-01-31 15:30")]
+
+
+def test_chunked_filtered_active_customers_match_in_memory(sales_data, tmp_path):
+    customers_from_sales_data = generate_synthetic_customers_from_sales_data(sales_data)
+    write_month_partitions(customers_from_sales_data, str(tmp_path), "date_field")
+
+    result = pd.concat(
+        list(iter_filtered_active_customers(str(tmp_path))), ignore_index=True
+    )
+
+    pd.testing.assert_frame_equal(
+        normalize_customers(result),
+        normalize_customers(get_filtered_active_customers(customers_from_sales_data)),
+        check_dtype=False,
+    )
@@ -0,0 +1,307 @@
+import sqlite3
+import pandas as pd
+import pytest
+from sqlite_stand_in import JOURNAL_TABLES, get_connection_factory, read_journals
+from vetbiz_extractor.utils import common
+from vetbiz_extractor.utils.common import (
+    FAILED_TABLES_ATTR,
+    PARTIAL_RESULT_ATTR,
+    PARTIAL_TABLES_ATTR,
+    cancel_connection_query,
+)
+from vetbiz_extractor.utils.journals import (
+    JOURNAL_TABLES_PATTERN,
+    discover_tables,
+    fetch_batched_xero_journals_data,
+    fetch_xero_journals_data_from_etani,
+    get_journal_tables_query,
+    get_table_batches,
+)
+
+JOURNAL_COLUMNS = ["JournalID", "JournalNumber", "JournalDate", "Amount", "Reference"]
+
+
+def fetch_journals(tables, **kwargs) -> pd.DataFrame:
+    return fetch_xero_journals_data_from_etani(
+        "server", "user", "password", "etani", tables, **kwargs
+    )
+
+
+def fetch_batched_journals(tables, **kwargs) -> pd.DataFrame:
+    return fetch_batched_xero_journals_data(
+        "server", "user", "password", "etani", tables, **kwargs
+    )
+
+
+def get_counting_connection_factory(journals_db, executed, failures=None):
+    """Return a factory of connections recording every query they execute in `executed`."""
+    connection_factory = get_connection_factory(journals_db, failures)
+
+    def counting_connection_factory():
+        connection = connection_factory()
+        connection.connection.set_trace_callback(executed.append)
+        return connection
+
+    return counting_connection_factory
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_fetch_journals_keeps_table_order(journals_db, max_workers):
+    tables = JOURNAL_TABLES[::-1]
+
+    result = fetch_journals(
+        tables,
+        batch_size=50,
+        max_workers=max_workers,
+        source_table_column="source_table",
+        connection_factory=get_connection_factory(journals_db),
+    )
+
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        read_journals(journals_db, tables, "source_table"),
+        check_dtype=False,
+    )
+    assert result.attrs == {}
+
+
+def test_fetch_journals_reports_failed_tables(journals_db):
+    failed_table = JOURNAL_TABLES[1]
+
+    result = fetch_journals(
+        JOURNAL_TABLES,
+        max_workers=4,
+        connection_factory=get_connection_factory(journals_db, {failed_table: 10}),
+    )
+
+    other_tables = [table for table in JOURNAL_TABLES if table != failed_table]
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        read_journals(journals_db, other_tables),
+        check_dtype=False,
+    )
+    assert result.attrs[PARTIAL_RESULT_ATTR] is True
+    assert result.attrs[FAILED_TABLES_ATTR] == [failed_table]
+
+
+def test_fetch_journals_retries_failed_tables(journals_db):
+    failures = {JOURNAL_TABLES[1]: 1, JOURNAL_TABLES[5]: 2}
+    executed = []
+
+    result = fetch_journals(
+        JOURNAL_TABLES,
+        max_workers=4,
+        connection_factory=get_counting_connection_factory(
+            journals_db, executed, failures
+        ),
+        retries=2,
+        retry_backoff_seconds=0.01,
+    )
+
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        read_journals(journals_db, JOURNAL_TABLES),
+        check_dtype=False,
+    )
+    assert result.attrs == {}
+    # Tables fetched in an earlier attempt are not fetched again
+    assert len(executed) == len(JOURNAL_TABLES)
+
+
+def unreachable_connection_factory():
+    raise sqlite3.OperationalError("unable to open database file")
+
+
+@pytest.mark.parametrize(
+    "tables, journal_tables_pattern, failed_tables",
+    [(JOURNAL_TABLES, None, JOURNAL_TABLES), (None, JOURNAL_TABLES_PATTERN, [])],
+    ids=["listed", "discovered"],
+)
+def test_fetch_journals_from_unreachable_database_returns_empty_partial_result(
+    tables, journal_tables_pattern, failed_tables
+):
+    result = fetch_batched_journals(
+        tables,
+        journal_tables_pattern=journal_tables_pattern,
+        connection_factory=unreachable_connection_factory,
+        dialect="sqlite",
+    )
+
+    assert result.empty
+    assert result.attrs == {
+        PARTIAL_RESULT_ATTR: True,
+        PARTIAL_TABLES_ATTR: [],
+        FAILED_TABLES_ATTR: failed_tables,
+    }
+
+
+def test_discover_tables_lists_matching_tables(journals_db):
+    with sqlite3.connect(journals_db) as connection:
+        connection.execute("CREATE TABLE TAZTECH_CLIENT3_XEROBLUE_Invoices (id)")
+
+    tables = discover_tables(
+        get_connection_factory(journals_db), JOURNAL_TABLES_PATTERN, "sqlite"
+    )
+
+    assert tables == {table: None for table in sorted(JOURNAL_TABLES)}
+
+
+def test_get_table_batches_splits_by_count_and_estimated_rows():
+    tables = ["a", "b", "c", "d", "e", "f"]
+    row_counts = {"a": 10, "b": 10, "c": 500, "d": 10, "e": None, "f": 10}
+
+    assert get_table_batches(tables, 4) == [("a", "b", "c", "d"), ("e", "f")]
+    assert get_table_batches(tables, 4, row_counts, 100) == [
+        ("a", "b"),
+        ("c",),
+        ("d", "e", "f"),
+    ]
+    assert get_table_batches(tables) == [(table,) for table in tables]
+
+
+@pytest.mark.parametrize("dialect", ["mssql", "mysql"])
+def test_get_journal_tables_query_limits_and_filters_each_table(dialect):
+    query, params = get_journal_tables_query(
+        ["a", "b"],
+        ["x"],
+        query_limit=5,
+        source_table_column="source",
+        watermark_column="x",
+        watermarks={"b": 7},
+        dialect=dialect,
+    )
+
+    limited_select = {
+        "mssql": "SELECT TOP 5 x, 'b' AS source FROM b WHERE x >= %s",
+        "mysql": "(SELECT x, 'b' AS source FROM b WHERE x >= %s LIMIT 5)",
+    }[dialect]
+    assert query.endswith(f" UNION ALL {limited_select};")
+    assert params == (7,)
+
+
+def test_fetch_discovered_journals_in_batches(journals_db):
+    executed = []
+
+    result = fetch_batched_journals(
+        None,
+        journal_tables_pattern=JOURNAL_TABLES_PATTERN,
+        columns=JOURNAL_COLUMNS,
+        tables_per_query=3,
+        max_workers=2,
+        source_table_column="source_table",
+        connection_factory=get_counting_connection_factory(journals_db, executed),
+        dialect="sqlite",
+    )
+
+    tables = sorted(JOURNAL_TABLES)
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        read_journals(journals_db, tables, "source_table"),
+        check_dtype=False,
+    )
+    assert result.attrs == {}
+    # The catalog query, then one query per batch of up to 3 tables
+    assert len(executed) == 1 + 3
+
+
+def test_fetch_journals_in_batches_reports_every_table_of_a_failed_batch(journals_db):
+    failed_table = JOURNAL_TABLES[4]
+
+    result = fetch_batched_journals(
+        JOURNAL_TABLES,
+        columns=JOURNAL_COLUMNS,
+        tables_per_query=3,
+        source_table_column="source_table",
+        connection_factory=get_connection_factory(journals_db, {failed_table: 10}),
+        dialect="sqlite",
+    )
+
+    failed_batch = JOURNAL_TABLES[3:6]
+    other_tables = [table for table in JOURNAL_TABLES if table not in failed_batch]
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        read_journals(journals_db, other_tables, "source_table"),
+        check_dtype=False,
+    )
+    assert result.attrs[FAILED_TABLES_ATTR] == failed_batch
+
+
+@pytest.mark.parametrize("tables_per_query", [1, 3])
+def test_fetch_journals_limits_rows_past_watermarks(journals_db, tables_per_query):
+    watermarks = {JOURNAL_TABLES[1]: 10005, JOURNAL_TABLES[4]: 40100}
+
+    result = fetch_batched_journals(
+        JOURNAL_TABLES,
+        columns=JOURNAL_COLUMNS,
+        tables_per_query=tables_per_query,
+        query_limit=5,
+        source_table_column="source_table",
+        watermark_column="JournalNumber",
+        watermarks=watermarks,
+        connection_factory=get_connection_factory(journals_db),
+        dialect="sqlite",
+    )
+
+    journals = read_journals(journals_db, JOURNAL_TABLES, "source_table")
+    past_watermark = journals["JournalNumber"] >= journals["source_table"].map(
+        watermarks
+    ).fillna(0)
+    expected = journals[past_watermark].groupby("source_table", sort=False).head(5)
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_journals_functions_are_still_importable_from_common():
+    assert (
+        common.fetch_xero_journals_data_from_etani
+        is fetch_xero_journals_data_from_etani
+    )
+    assert common.JOURNAL_TABLES_PATTERN == JOURNAL_TABLES_PATTERN
+    with pytest.raises(AttributeError):
+        common.fetch_missing_journals
+
+
+class CancellableQuery:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class DriverConnection:
+    """A connection exposing its driver connection as _conn, like pymssql."""
+
+    def __init__(self, driver_connection):
+        self._conn = driver_connection
+
+
+def test_cancel_connection_query_uses_the_driver_cancel():
+    driver_connection = CancellableQuery()
+    cancel_connection_query(DriverConnection(driver_connection))
+
+    assert driver_connection.cancelled
+
+
+@pytest.mark.parametrize("driver_connection", [None, object()])
+def test_cancel_connection_query_skips_connections_without_cancel(driver_connection):
+    # Nothing to cancel: the query runs until it ends
+    cancel_connection_query(DriverConnection(driver_connection))
+    cancel_connection_query(object())
+
+
+def test_cancel_connection_query_interrupts_sqlite(journals_db):
+    conn = sqlite3.connect(journals_db)
+    cursor = conn.cursor()
+    cursor.execute(
+        "WITH RECURSIVE numbers(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM numbers) "
+        "SELECT n FROM numbers"
+    )
+    cancel_connection_query(conn)
+
+    with pytest.raises(sqlite3.OperationalError):
+        cursor.fetchall()
+    conn.close()
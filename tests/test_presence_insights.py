@@ -0,0 +1,87 @@
+import sqlite3
+import pandas as pd
+import pytest
+from sqlite_stand_in import get_connection_factory
+from test_insights_extractor import normalize_customers
+from vetbiz_extractor.core.insights_extractor import (
+    get_filtered_active_customers,
+    get_lapsed_clients,
+)
+from vetbiz_extractor.core.presence_insights import (
+    fetch_active_customer_months,
+    fetch_lapsed_customer_months,
+    join_active_customers,
+    join_lapsed_clients,
+)
+from vetbiz_extractor.utils.connection_pool import ConnectionPool
+from vetbiz_extractor.utils.synthetic import (
+    generate_synthetic_customers_from_sales_data,
+)
+
+CREDENTIALS = ("user", "password", "host", "database")
+
+
+@pytest.fixture
+def warehouse(tmp_path, sales_data):
+    """A sqlite data warehouse with the sales and customers-from-sales rows, and the rows as fetched."""
+    # Fetched customer keys are floats, with NaN for NULL
+    sales_data = normalize_customers(sales_data)
+    customers_from_sales = generate_synthetic_customers_from_sales_data(sales_data)
+    path = str(tmp_path / "warehouse.db")
+    with sqlite3.connect(path) as connection:
+        sales_data.to_sql("sales", connection, index=False)
+        customers_from_sales.to_sql("customers_from_sales", connection, index=False)
+    return (
+        ConnectionPool(get_connection_factory(path)),
+        sales_data,
+        customers_from_sales,
+    )
+
+
+def test_pushed_down_lapsed_clients_match_in_memory(warehouse):
+    pool, sales_data, _ = warehouse
+    lapsed_customer_months = fetch_lapsed_customer_months(
+        "SELECT * FROM sales", *CREDENTIALS, connection_pool=pool, dialect="sqlite"
+    )
+
+    pd.testing.assert_frame_equal(
+        join_lapsed_clients(sales_data, lapsed_customer_months),
+        get_lapsed_clients(sales_data),
+        check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize("start_year, months_threshold", [(2020, 18), (2021, 6)])
+def test_pushed_down_active_customers_match_in_memory(
+    warehouse, start_year, months_threshold
+):
+    pool, _, customers_from_sales = warehouse
+    active_customer_months = fetch_active_customer_months(
+        "SELECT * FROM customers_from_sales",
+        *CREDENTIALS,
+        start_year=start_year,
+        months_threshold=months_threshold,
+        connection_pool=pool,
+        dialect="sqlite",
+    )
+    expected = get_filtered_active_customers(
+        customers_from_sales, start_year, months_threshold
+    )
+
+    pd.testing.assert_frame_equal(
+        join_active_customers(customers_from_sales, active_customer_months),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_failed_presence_query_raises(warehouse):
+    pool, _, _ = warehouse
+
+    with pytest.raises(sqlite3.OperationalError):
+        fetch_lapsed_customer_months(
+            "SELECT * FROM missing_sales",
+            *CREDENTIALS,
+            connection_pool=pool,
+            dialect="sqlite",
+        )
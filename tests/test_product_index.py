@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vetbiz_extractor.core.insights_extractor import (
+    get_dental_sales_after_consultation,
+    get_follow_up_consults,
+)
+from vetbiz_extractor.utils import product_index as product_index_module
+from vetbiz_extractor.utils.product_index import ProductIndex, get_product_index
+
+PRODUCT_NAMES = [
+    "Consultation",
+    "DENTAL Scale",
+    None,
+    "Mystery Item",
+    np.nan,
+    "Dental Consult",
+    "Consultation",
+    "",
+]
+
+
+@pytest.mark.parametrize("product_dtype", [object, "category"])
+def test_product_index_matches_keywords(product_dtype):
+    product_names = pd.Series(PRODUCT_NAMES, dtype=product_dtype)
+    product_index = ProductIndex(product_names)
+
+    # Unknown and missing product names belong to no category
+    expected_consult = [True, False, False, False, False, True, True, False]
+    expected_dental = [False, True, False, False, False, True, False, False]
+    np.testing.assert_array_equal(product_index.get_mask("consult"), expected_consult)
+    np.testing.assert_array_equal(product_index.get_mask("dental"), expected_dental)
+    assert sorted(product_index.get_products("consult")) == [
+        "Consultation",
+        "Dental Consult",
+    ]
+    assert len(product_index) == len(PRODUCT_NAMES)
+
+
+def test_product_index_maps_keywords_to_categories():
+    product_index = ProductIndex(
+        pd.Series(PRODUCT_NAMES),
+        {"consult": "visit", "scale": "visit", "mystery": "other"},
+    )
+
+    np.testing.assert_array_equal(
+        product_index.get_mask("visit"),
+        [True, True, False, False, False, True, True, False],
+    )
+    np.testing.assert_array_equal(
+        product_index.get_mask("other"),
+        [False, False, False, True, False, False, False, False],
+    )
+
+
+def test_unknown_category_raises():
+    product_index = ProductIndex(pd.Series(PRODUCT_NAMES))
+
+    with pytest.raises(KeyError):
+        product_index.get_mask("vaccination")
+    with pytest.raises(KeyError):
+        product_index.get_products("Mystery Item")
+
+
+def test_mismatched_product_index_raises(sales_data):
+    product_index = ProductIndex(sales_data["product_name"].iloc[1:])
+
+    with pytest.raises(ValueError):
+        get_product_index(sales_data, product_index)
+
+
+def test_shared_product_index_matches_separate_indexes(sales_data, monkeypatch):
+    sales_data = sales_data.copy()
+    sales_data.loc[sales_data.index[::50], "product_name"] = np.nan
+    expected_follow_ups = get_follow_up_consults(sales_data)
+    expected_dental_sales = get_dental_sales_after_consultation(sales_data)
+
+    product_index = ProductIndex(sales_data["product_name"])
+
+    # The shared index is used as is, never rebuilt
+    class UnexpectedProductIndex:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("The product index was rebuilt.")
+
+    monkeypatch.setattr(product_index_module, "ProductIndex", UnexpectedProductIndex)
+    pd.testing.assert_frame_equal(
+        get_follow_up_consults(sales_data, product_index=product_index),
+        expected_follow_ups,
+    )
+    pd.testing.assert_frame_equal(
+        get_dental_sales_after_consultation(sales_data, product_index=product_index),
+        expected_dental_sales,
+    )
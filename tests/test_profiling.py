@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from vetbiz_extractor.utils.profiling import (
+    PROFILE_ENV_VAR,
+    Profiler,
+    profiler_from_env,
+)
+
+
+def test_invalid_profile_format_disables_profiling(monkeypatch):
+    monkeypatch.setenv(PROFILE_ENV_VAR, "jsn")
+
+    with pytest.warns(RuntimeWarning, match="Unsupported profile format 'jsn'"):
+        profiler = profiler_from_env()
+
+    assert not profiler.enabled
+
+
+def test_spans_record_their_max_rss_growth():
+    profiler = Profiler("json")
+
+    with profiler.span("allocate"):
+        data = np.ones(64 * 1024**2, dtype=np.uint8)
+        data[::4096] = 2
+
+    (record,) = profiler.to_json()["spans"]
+    if record["process_max_rss_mb"] is None:
+        pytest.skip("The peak resident set size is not available on this platform")
+    assert record["max_rss_growth_mb"] >= 0
+    assert record["max_rss_growth_mb"] <= record["process_max_rss_mb"]
@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+from vetbiz_extractor.core.sharded_insights import (
+    SHARDABLE_INSIGHTS,
+    run_insights_sharded,
+)
+
+
+@pytest.mark.parametrize("shard_by", ["clinic_tk", "customer_tk"])
+def test_sharded_insights_match_single_process(sales_data, shard_by):
+    results = run_insights_sharded(
+        sales_data, shard_by=shard_by, n_shards=3, max_workers=2
+    )
+
+    for insight, insights_function in SHARDABLE_INSIGHTS.items():
+        pd.testing.assert_frame_equal(
+            results[insight], insights_function(sales_data), obj=insight
+        )
+
+
+def test_sharded_insights_require_shard_columns(sales_data):
+    with pytest.raises(KeyError):
+        run_insights_sharded(sales_data.drop(columns="product_name"), max_workers=1)
@@ -0,0 +1,257 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Optional
+from vetbiz_extractor.core.insights_extractor import (
+    get_follow_up_consults,
+    get_dental_sales_after_consultation,
+    get_lapsed_clients,
+    get_filtered_active_customers,
+)
+from vetbiz_extractor.utils.common import (
+    get_date_for_month_index,
+    get_month_starts,
+)
+from vetbiz_extractor.utils.partitioned_dataset import (
+    get_month_partition_name,
+    iter_month_partitions,
+)
+from vetbiz_extractor.utils.product_index import ProductIndex
+from vetbiz_extractor.utils.profiling import span
+
+# Position of a row in its month; carried rows from earlier months are marked with -1
+ROW_COLUMN = "__row"
+
+
+def get_month_key_rows(
+    month_df: pd.DataFrame,
+    columns: List[str],
+    carried_rows: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Select the key columns of a month's rows, numbered by position, after the rows carried from earlier months.
+
+    :param month_df: The rows of the month.
+    :param columns: The key columns the insights function reads.
+    :param carried_rows: Optional key rows carried from earlier months (with ROW_COLUMN -1).
+    :return: The carried rows followed by the key rows of the month.
+    """
+    key_rows = month_df[columns].copy()
+    key_rows[ROW_COLUMN] = np.arange(len(month_df))
+    if carried_rows is None or carried_rows.empty:
+        return key_rows
+    return pd.concat([carried_rows, key_rows], ignore_index=True)
+
+
+def get_carried_consults(
+    key_rows: pd.DataFrame, product_index: ProductIndex, days_threshold: int
+) -> pd.DataFrame:
+    """
+    Keep the consult rows later months can still be within `days_threshold` days of.
+
+    :param key_rows: The key rows of the month, after the rows carried from earlier months.
+    :param product_index: The product index of the key rows.
+    :param days_threshold: Number of days of the consult analyses.
+    :return: The consult key rows of the last `days_threshold` days, marked as carried.
+    """
+    consult_rows = key_rows[product_index.get_mask("consult")]
+    last_date = key_rows["invoice_date"].max()
+    carried_rows = consult_rows[
+        consult_rows["invoice_date"] >= last_date - pd.Timedelta(days=days_threshold)
+    ].copy()
+    carried_rows[ROW_COLUMN] = -1
+    return carried_rows
+
+
+def iter_follow_up_consults(
+    dataset_dir: str,
+    days_threshold: int = 14,
+    keyword_categories: Optional[Dict[str, str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Compute the follow-up consults of a month-partitioned sales dataset one month at a time.
+
+    Only one month of sales is held in memory, together with the consults of the last `days_threshold` days,
+    which are carried into the next month. Each month is computed by get_follow_up_consults.
+
+    :param dataset_dir: Directory of a sales dataset written by write_month_partitions on invoice_date.
+    :param days_threshold: Number of days to define the follow-up threshold (default is 14 days).
+    :param keyword_categories: Optional mapping of product keywords to categories (see ProductIndex).
+    :return: An iterator of the follow-up consults of every month, in chronological order.
+    """
+    key_columns = ["sale_id", "customer_tk", "invoice_date", "product_name"]
+    carried_rows = None
+    for month, month_df in iter_month_partitions(dataset_dir):
+        with span(
+            "follow_up_consults_month",
+            month=get_month_partition_name(month),
+            rows_in=len(month_df),
+        ) as month_span:
+            key_rows = get_month_key_rows(month_df, key_columns, carried_rows)
+            product_index = ProductIndex(key_rows["product_name"], keyword_categories)
+            follow_ups = get_follow_up_consults(
+                key_rows, days_threshold, product_index=product_index
+            )
+            rows = follow_ups.loc[follow_ups[ROW_COLUMN] >= 0, ROW_COLUMN]
+            carried_rows = get_carried_consults(key_rows, product_index, days_threshold)
+            month_span.set(rows_out=len(rows))
+        yield month_df.iloc[rows.to_numpy()].reset_index(drop=True)
+
+
+def iter_dental_sales_after_consultation(
+    dataset_dir: str,
+    days_threshold: int = 14,
+    keyword_categories: Optional[Dict[str, str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Compute the dental sales after consultation of a month-partitioned sales dataset one month at a time.
+
+    Only one month of sales is held in memory, together with the consults of the last `days_threshold` days,
+    which are carried into the next month. Each month is computed by get_dental_sales_after_consultation.
+
+    :param dataset_dir: Directory of a sales dataset written by write_month_partitions on invoice_date.
+    :param days_threshold: Number of days to define the threshold for sales after consultation (default is 14 days).
+    :param keyword_categories: Optional mapping of product keywords to categories (see ProductIndex).
+    :return: An iterator of the dental sales of every month, in chronological order.
+    """
+    key_columns = ["clinic_tk", "customer_tk", "invoice_date", "product_name"]
+    carried_rows = None
+    for month, month_df in iter_month_partitions(dataset_dir, key_columns):
+        with span(
+            "dental_sales_after_consultation_month",
+            month=get_month_partition_name(month),
+            rows_in=len(month_df),
+        ) as month_span:
+            key_rows = get_month_key_rows(month_df, key_columns, carried_rows)
+            product_index = ProductIndex(key_rows["product_name"], keyword_categories)
+            dental_sales = get_dental_sales_after_consultation(
+                key_rows, days_threshold, product_index=product_index
+            )
+            # Carried consults are all earlier than the month, so are the dental sales among them
+            dental_sales = dental_sales[
+                dental_sales["invoice_date"] >= month_df["invoice_date"].min()
+            ].reset_index(drop=True)
+            carried_rows = get_carried_consults(key_rows, product_index, days_threshold)
+            month_span.set(rows_out=len(dental_sales))
+        yield dental_sales
+
+
+def iter_lapsed_clients(
+    dataset_dir: str, start_year: int = 2018
+) -> Iterator[pd.DataFrame]:
+    """
+    Compute the lapsed clients of a month-partitioned sales dataset one month at a time.
+
+    A first pass reads only customer_tk and invoice_date to collect the distinct customers of every month.
+    The second pass reads one month of sales at a time and computes its lapsed P1 rows with get_lapsed_clients,
+    given the customers' purchases in the 23 following months (every P2 the month's rows can be compared with).
+
+    :param dataset_dir: Directory of a sales dataset written by write_month_partitions on invoice_date.
+    :param start_year: integer representing the start year from which to measure inactivity.
+                       Defaults to 2018.
+    :return: An iterator of the lapsed client rows whose purchase fell in every month, in chronological order.
+             Rows within a month are ordered by window.
+    """
+    with span("lapsed_clients_presence"):
+        month_customers = {
+            month: month_df["customer_tk"].drop_duplicates()
+            for month, month_df in iter_month_partitions(dataset_dir, ["customer_tk"])
+        }
+
+    for month, month_df in iter_month_partitions(dataset_dir):
+        with span(
+            "lapsed_clients_month",
+            month=get_month_partition_name(month),
+            rows_in=len(month_df),
+        ) as month_span:
+            customers = month_df["customer_tk"].drop_duplicates()
+            # Purchases of the month's customers in the P2 periods of its windows
+            later_purchases = []
+            for later_month in range(month + 1, month + 24):
+                if later_month not in month_customers:
+                    continue
+                later_customers = month_customers[later_month]
+                later_purchases.append(
+                    pd.DataFrame(
+                        {
+                            "customer_tk": later_customers[
+                                later_customers.isin(customers)
+                            ].to_numpy(),
+                            "invoice_date": pd.Timestamp(
+                                get_date_for_month_index(later_month)
+                            ),
+                            ROW_COLUMN: -1,
+                        }
+                    )
+                )
+
+            key_rows = pd.concat(
+                [get_month_key_rows(month_df, ["customer_tk", "invoice_date"])]
+                + later_purchases,
+                ignore_index=True,
+            )
+            lapsed = get_lapsed_clients(key_rows, start_year)
+            lapsed = lapsed[lapsed[ROW_COLUMN] >= 0]
+
+            lapsed_clients = month_df.iloc[lapsed[ROW_COLUMN].to_numpy()].reset_index(
+                drop=True
+            )
+            lapsed_clients["l_period"] = lapsed["l_period"].to_numpy(dtype=object)
+            month_span.set(rows_out=len(lapsed_clients))
+        yield lapsed_clients
+
+
+def iter_filtered_active_customers(
+    dataset_dir: str, start_year: int = 2020, months_threshold: int = 18
+) -> Iterator[pd.DataFrame]:
+    """
+    Compute the active customers of a month-partitioned customers-from-sales dataset one month at a time.
+
+    Only one month of rows is held in memory, together with the month each customer was last seen in,
+    for the customers seen in the last `months_threshold` months. Each month is computed by
+    get_filtered_active_customers.
+
+    :param dataset_dir: Directory of a customers-from-sales dataset written by write_month_partitions on date_field.
+    :param start_year: integer representing the start year from which to measure activity.
+                       Defaults to 2020.
+    :param months_threshold: Integer representing the number of months within which a customer
+                             must have made a purchase to be considered active. Defaults to 18 months.
+    :return: An iterator of the active customer rows of every month, in chronological order.
+    """
+    last_seen_months = pd.Series(dtype=np.int64)
+    for month, month_df in iter_month_partitions(dataset_dir):
+        with span(
+            "active_customers_month",
+            month=get_month_partition_name(month),
+            rows_in=len(month_df),
+        ) as month_span:
+            customers = month_df["customer_tk"].drop_duplicates()
+            # One purchase in the month each of the month's customers was last seen in
+            previous_months = last_seen_months[last_seen_months.index.isin(customers)]
+            carried_rows = pd.DataFrame(
+                {
+                    "customer_tk": previous_months.index,
+                    "date_field": get_month_starts(previous_months.to_numpy()),
+                    ROW_COLUMN: -1,
+                }
+            )
+
+            key_rows = get_month_key_rows(
+                month_df, ["customer_tk", "date_field"], carried_rows
+            )
+            active = get_filtered_active_customers(
+                key_rows, start_year, months_threshold
+            )
+            rows = active.loc[active[ROW_COLUMN] >= 0, ROW_COLUMN]
+
+            last_seen_months = pd.concat(
+                [
+                    last_seen_months[~last_seen_months.index.isin(customers)],
+                    pd.Series(month, index=customers.to_numpy(), dtype=np.int64),
+                ]
+            )
+            # Customers not seen for longer than the threshold can no longer make a later month active
+            last_seen_months = last_seen_months[
+                last_seen_months >= month - months_threshold
+            ]
+            month_span.set(rows_out=len(rows))
+        yield month_df.iloc[rows.to_numpy()].reset_index(drop=True)
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, NamedTuple, Optional, Sequence
+from vetbiz_extractor.utils.common import get_key_codes, get_time_values
+from vetbiz_extractor.utils.product_index import ProductIndex, get_product_index
+from vetbiz_extractor.utils.profiling import profiled, span
+
+# Columns identifying a target sale record of a funnel
+FUNNEL_RECORD_COLUMNS = ["clinic_tk", "customer_tk", "invoice_date"]
+# Column of the funnel results holding the id of the matched rule
+RULE_COLUMN = "rule_id"
+
+
+class FunnelRule(NamedTuple):
+    """
+    A sale-after-trigger funnel: a target sale made no more than `days_threshold` days after a trigger sale
+    of the same customer (on the same day included).
+
+    - rule_id: the id of the rule in the funnel results.
+    - trigger_keyword: the product keyword (or product index category) of the trigger sales, e.g. consult.
+    - target_keyword: the product keyword (or product index category) of the target sales, e.g. dental.
+    - days_threshold: the maximum number of days between the trigger and the target sale.
+    """
+
+    rule_id: str
+    trigger_keyword: str
+    target_keyword: str
+    days_threshold: int = 14
+
+
+# The funnel of get_dental_sales_after_consultation
+DENTAL_AFTER_CONSULT_RULE = FunnelRule("dental_after_consult", "consult", "dental")
+
+
+def get_funnel_product_index(
+    sales_data: pd.DataFrame,
+    rules: Sequence[FunnelRule],
+    product_index: Optional[ProductIndex] = None,
+) -> ProductIndex:
+    """
+    Return a product index with a category for every keyword of the rules.
+
+    :param sales_data: DataFrame containing sales data.
+    :param rules: The funnel rules.
+    :param product_index: An optional index already built for the rows of `sales_data`, whose categories
+                          are the keywords of the rules.
+    :return: The product index of `sales_data`.
+    """
+    if product_index is not None:
+        return get_product_index(sales_data, product_index)
+    keywords = dict.fromkeys(
+        keyword
+        for rule in rules
+        for keyword in (rule.trigger_keyword, rule.target_keyword)
+    )
+    return ProductIndex(
+        sales_data["product_name"], {keyword: keyword for keyword in keywords}
+    )
+
+
+@profiled()
+def get_funnel_sales(
+    sales_data: pd.DataFrame,
+    rules: Sequence[FunnelRule],
+    product_index: Optional[ProductIndex] = None,
+) -> pd.DataFrame:
+    """
+    Find the target sales made within the days threshold after a trigger sale, for several funnel rules at once.
+
+    Every rule's trigger sales and unique (clinic, customer, invoice date) target records are gathered into one
+    event list, sorted once by (rule, customer, date), and swept once: each target record is matched with the
+    latest trigger of the same rule and customer on or before its date. Sales without a customer_tk are matched
+    with each other, as the sales of one customer.
+
+    :param sales_data: DataFrame containing sales data.
+    :param rules: The funnel rules, e.g. [FunnelRule("vaccination_after_consult", "consult", "vaccin", 30)].
+    :param product_index: Optional product index of the sales data. Its categories must include the keywords of
+                          the rules; when none is given, one is built with every keyword as its own category.
+    :return: DataFrame with the clinic_tk, customer_tk, invoice_date and rule_id of every matched target record,
+             ordered by rule (in the order of `rules`), then by first appearance in the sales data.
+    :raises ValueError: If two rules have the same id
+    """
+    rules = list(rules)
+    rule_ids = [rule.rule_id for rule in rules]
+    if len(set(rule_ids)) != len(rule_ids):
+        raise ValueError("Funnel rule ids must be unique.")
+
+    product_index = get_funnel_product_index(sales_data, rules, product_index)
+    # Sales without a customer are matched with each other, as one customer
+    customer_codes = get_key_codes(sales_data["customer_tk"], missing_as_key=True)
+    times, has_date, ticks_per_day = get_time_values(sales_data["invoice_date"])
+
+    with span("funnel_events", rules=len(rules)) as events_span:
+        trigger_rows: Dict[str, np.ndarray] = {}
+        target_rows: Dict[str, np.ndarray] = {}
+        event_rules, event_rows, event_is_target = [], [], []
+        for rule_number, rule in enumerate(rules):
+            if rule.trigger_keyword not in trigger_rows:
+                trigger_rows[rule.trigger_keyword] = np.flatnonzero(
+                    product_index.get_mask(rule.trigger_keyword) & has_date
+                )
+            if rule.target_keyword not in target_rows:
+                # Unique target records, in order of first appearance
+                rows = np.flatnonzero(product_index.get_mask(rule.target_keyword))
+                rows = rows[
+                    ~sales_data[FUNNEL_RECORD_COLUMNS]
+                    .iloc[rows]
+                    .duplicated()
+                    .to_numpy()
+                ]
+                # Records without an invoice date can never match a trigger
+                target_rows[rule.target_keyword] = rows[has_date[rows]]
+
+            for rows, is_target in (
+                (trigger_rows[rule.trigger_keyword], False),
+                (target_rows[rule.target_keyword], True),
+            ):
+                event_rules.append(np.full(len(rows), rule_number, dtype=np.int64))
+                event_rows.append(rows)
+                event_is_target.append(np.full(len(rows), is_target))
+
+        event_rules = np.concatenate(event_rules or [np.empty(0, dtype=np.int64)])
+        event_rows = np.concatenate(event_rows or [np.empty(0, dtype=np.int64)])
+        event_is_target = np.concatenate(event_is_target or [np.empty(0, dtype=bool)])
+        events_span.set(rows_out=len(event_rows))
+
+    with span("funnel_sweep", rows_in=len(event_rows)) as sweep_span:
+        # Sort by rule, customer and date; on the same date, triggers come before targets
+        event_customers = customer_codes[event_rows]
+        event_times = times[event_rows]
+        order = np.lexsort((event_is_target, event_times, event_customers, event_rules))
+        event_rules, event_rows, event_is_target = (
+            event_rules[order],
+            event_rows[order],
+            event_is_target[order],
+        )
+        event_customers, event_times = event_customers[order], event_times[order]
+
+        # Position of the latest trigger at or before every event
+        latest_trigger = np.maximum.accumulate(
+            np.where(event_is_target, -1, np.arange(len(event_rows)))
+        )
+        latest = np.maximum(latest_trigger, 0)
+        thresholds = np.array([rule.days_threshold for rule in rules], dtype=np.int64)
+        matched = (
+            event_is_target
+            & (latest_trigger >= 0)
+            & (event_rules[latest] == event_rules)
+            & (event_customers[latest] == event_customers)
+            & (
+                event_times - event_times[latest]
+                <= thresholds[event_rules] * ticks_per_day
+            )
+        )
+        matched_rules, matched_rows = event_rules[matched], event_rows[matched]
+        result_order = np.lexsort((matched_rows, matched_rules))
+        sweep_span.set(rows_out=len(result_order))
+
+    funnel_sales = (
+        sales_data[FUNNEL_RECORD_COLUMNS]
+        .iloc[matched_rows[result_order]]
+        .reset_index(drop=True)
+    )
+    funnel_sales[RULE_COLUMN] = np.array(rule_ids, dtype=object)[
+        matched_rules[result_order]
+    ]
+    return funnel_sales
@@ -0,0 +1,277 @@
+import hashlib
+import inspect
+import json
+import os
+import pandas as pd
+from datetime import datetime
+from typing import Any, Callable, Dict, NamedTuple, Tuple
+from vetbiz_extractor.core.insights_extractor import (
+    get_follow_up_consults,
+    get_dental_sales_after_consultation,
+    get_lapsed_clients,
+    get_filtered_active_customers,
+)
+from vetbiz_extractor.utils.common import get_month_index, get_month_index_for_date
+from vetbiz_extractor.utils.incremental import (
+    read_cached_dataframe,
+    write_cached_dataframe,
+)
+
+# Column holding the output month of each cached result row
+OUTPUT_MONTH_COLUMN = "__output_month"
+
+
+class InsightSpec(NamedTuple):
+    """
+    Describes how the results of an insights function are partitioned by month.
+
+    - date_column: the input column that assigns input rows to months.
+    - dependency_months: given the parameters, the (lookback, lookahead) months of input an output month depends on.
+    - output_months: given the parameters and the (first, last) input months, the range of output months.
+    - output_month: given the parameters and the result, the output month of each result row.
+    """
+
+    function: Callable[..., pd.DataFrame]
+    date_column: str
+    dependency_months: Callable[[Dict[str, Any]], Tuple[int, int]]
+    output_months: Callable[[Dict[str, Any], Tuple[int, int]], Tuple[int, int]]
+    output_month: Callable[[Dict[str, Any], pd.DataFrame], pd.Series]
+
+
+def get_days_threshold_lookback_months(params: Dict[str, Any]) -> Tuple[int, int]:
+    """A consult up to days_threshold days earlier can lie this many calendar months back."""
+    return params["days_threshold"] // 28 + 1, 0
+
+
+def get_invoice_month(params: Dict[str, Any], result: pd.DataFrame) -> pd.Series:
+    """Results of the consult analyses belong to the month of their invoice date."""
+    return get_month_index(result["invoice_date"])
+
+
+def get_lapsed_window_month(params: Dict[str, Any], result: pd.DataFrame) -> pd.Series:
+    """Lapsed client rows belong to their window, numbered from August of start_year in l_period."""
+    window_numbers = result["l_period"].str.split(".", n=1).str[0].astype(int)
+    return window_numbers + params["start_year"] * 12 + 6
+
+
+INSIGHT_SPECS = {
+    "get_follow_up_consults": InsightSpec(
+        function=get_follow_up_consults,
+        date_column="invoice_date",
+        dependency_months=get_days_threshold_lookback_months,
+        output_months=lambda params, data_months: data_months,
+        output_month=get_invoice_month,
+    ),
+    "get_dental_sales_after_consultation": InsightSpec(
+        function=get_dental_sales_after_consultation,
+        date_column="invoice_date",
+        dependency_months=get_days_threshold_lookback_months,
+        output_months=lambda params, data_months: data_months,
+        output_month=get_invoice_month,
+    ),
+    # Window w compares P1 (w - 12 .. w - 1) with P2 (w .. w + 11)
+    "get_lapsed_clients": InsightSpec(
+        function=get_lapsed_clients,
+        date_column="invoice_date",
+        dependency_months=lambda params: (12, 11),
+        output_months=lambda params, data_months: (
+            params["start_year"] * 12 + 7,
+            get_month_index_for_date(datetime.now()) - 11,
+        ),
+        output_month=get_lapsed_window_month,
+    ),
+    # Month m keeps the customers also seen in the months_threshold months before it
+    "get_filtered_active_customers": InsightSpec(
+        function=get_filtered_active_customers,
+        date_column="date_field",
+        dependency_months=lambda params: (params["months_threshold"], 0),
+        output_months=lambda params, data_months: (
+            params["start_year"] * 12,
+            datetime.now().year * 12 + 11,
+        ),
+        output_month=lambda params, result: get_month_index(result["date_field"]),
+    ),
+}
+
+
+def get_month_partition_hashes(data: pd.DataFrame, date_column: str) -> Dict[int, str]:
+    """
+    Compute a content hash of the input rows of every month.
+
+    :param data: The input DataFrame.
+    :param date_column: The column assigning rows to months.
+    :return: Mapping of month index to the hash of that month's rows (in their input order).
+    """
+    row_hashes = pd.util.hash_pandas_object(data, index=False)
+    months = get_month_index(data[date_column])
+    return {
+        int(month): hashlib.sha1(month_row_hashes.to_numpy().tobytes()).hexdigest()
+        for month, month_row_hashes in row_hashes.groupby(months.to_numpy())
+    }
+
+
+def get_cache_key(insight: str, data: pd.DataFrame, params: Dict[str, Any]) -> str:
+    """
+    Build the cache key of an insights function call from its name, parameters and input schema.
+
+    :param insight: Name of the insights function.
+    :param data: The input DataFrame.
+    :param params: The bound parameters of the call (without the input DataFrame).
+    :return: A hex digest identifying the cached results.
+    """
+    key = {
+        "insight": insight,
+        "params": params,
+        "schema": [[str(name), str(dtype)] for name, dtype in data.dtypes.items()],
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def write_cached_metadata(metadata: Dict[str, Any], metadata_path: str) -> None:
+    """
+    Write the metadata of cached results atomically, like write_cached_dataframe.
+
+    :param metadata: The JSON-serializable metadata.
+    :param metadata_path: Path of the JSON file.
+    """
+    temp_path = f"{metadata_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(metadata, f)
+    os.replace(temp_path, metadata_path)
+
+
+def run_insight_incrementally(
+    insight: str, data: pd.DataFrame, cache_dir: str, **params: Any
+) -> pd.DataFrame:
+    """
+    Run an insights function, recomputing only the output months whose input changed since the last run.
+
+    Results are cached per (function, parameters, input schema) together with a content hash of every input month.
+    On a rerun, output months whose dependency window contains a changed, new or removed input month,
+    and output months that were not covered before (e.g. a newly elapsed lapsed-client window),
+    are recomputed from the input rows of their dependency windows only. The cached results of all
+    other months are stitched in.
+
+    The result has the same rows as calling the function directly, ordered by output month
+    (rows within a month keep the function's order).
+
+    :param insight: Name of the insights function, one of INSIGHT_SPECS.
+    :param data: The input DataFrame of the insights function.
+    :param cache_dir: Directory of the insights cache.
+    :param params: Keyword parameters of the insights function.
+    :return: The result of the insights function.
+    :raises ValueError: If the insights function is not supported, or if a parameter is not JSON-serializable
+                        (e.g. a product_index), since the parameters are part of the cache key
+    """
+    if insight not in INSIGHT_SPECS:
+        raise ValueError(
+            f"Unsupported insights function '{insight}'. "
+            f"Supported functions: {', '.join(INSIGHT_SPECS)}"
+        )
+
+    spec = INSIGHT_SPECS[insight]
+    bound_arguments = inspect.signature(spec.function).bind(data, **params)
+    bound_arguments.apply_defaults()
+    params = dict(list(bound_arguments.arguments.items())[1:])
+    try:
+        json.dumps(params)
+    except TypeError as e:
+        raise ValueError(
+            f"The parameters of '{insight}' must be JSON-serializable to key the cache: {e}"
+        ) from e
+
+    cache_path = os.path.join(cache_dir, insight, get_cache_key(insight, data, params))
+    results_path = os.path.join(cache_path, "results.parquet")
+    metadata_path = os.path.join(cache_path, "metadata.json")
+
+    month_hashes = get_month_partition_hashes(data, spec.date_column)
+    data_months = (min(month_hashes), max(month_hashes)) if month_hashes else (0, -1)
+    first_output_month, last_output_month = spec.output_months(params, data_months)
+    lookback, lookahead = spec.dependency_months(params)
+
+    cached_results = read_cached_dataframe(results_path)
+    metadata = None
+    if cached_results is not None and os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+
+    if metadata is None:
+        dirty_months = set(range(first_output_month, last_output_month + 1))
+    else:
+        cached_hashes = {int(k): v for k, v in metadata["month_hashes"].items()}
+        changed_months = {
+            month
+            for month in set(month_hashes) | set(cached_hashes)
+            if month_hashes.get(month) != cached_hashes.get(month)
+        }
+        covered_months = set(
+            range(metadata["output_months"][0], metadata["output_months"][1] + 1)
+        )
+        dirty_months = {
+            month
+            for month in range(first_output_month, last_output_month + 1)
+            if month not in covered_months
+            or any(
+                dependency_month in changed_months
+                for dependency_month in range(month - lookback, month + lookahead + 1)
+            )
+        }
+
+    if dirty_months:
+        # Input rows of the dependency windows of every dirty month
+        dependency_months = {
+            dependency_month
+            for month in dirty_months
+            for dependency_month in range(month - lookback, month + lookahead + 1)
+        }
+        data_months_index = get_month_index(data[spec.date_column])
+        dirty_data = data[data_months_index.isin(dependency_months)]
+
+        recomputed = spec.function(dirty_data, **params)
+        recomputed[OUTPUT_MONTH_COLUMN] = spec.output_month(params, recomputed)
+        recomputed = recomputed[recomputed[OUTPUT_MONTH_COLUMN].isin(dirty_months)]
+    else:
+        recomputed = None
+
+    results = [
+        df
+        for df in (
+            (
+                cached_results[
+                    ~cached_results[OUTPUT_MONTH_COLUMN].isin(dirty_months)
+                    & cached_results[OUTPUT_MONTH_COLUMN].between(
+                        first_output_month, last_output_month
+                    )
+                ]
+                if metadata is not None
+                else None
+            ),
+            recomputed,
+        )
+        if df is not None and not df.empty
+    ]
+    if results:
+        results = pd.concat(results, ignore_index=True).sort_values(
+            OUTPUT_MONTH_COLUMN, kind="mergesort"
+        )
+    else:
+        results = spec.function(data.iloc[:0], **params)
+        results[OUTPUT_MONTH_COLUMN] = pd.Series(dtype="int64")
+
+    print(
+        f"{insight}: recomputed {len(dirty_months)} of "
+        f"{max(last_output_month - first_output_month + 1, 0)} months"
+    )
+    # Without metadata, results left by an interrupted run are recomputed rather than trusted
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+    write_cached_dataframe(results, results_path)
+    write_cached_metadata(
+        {
+            "month_hashes": month_hashes,
+            "output_months": [first_output_month, last_output_month],
+        },
+        metadata_path,
+    )
+
+    return results.drop(columns=OUTPUT_MONTH_COLUMN).reset_index(drop=True)
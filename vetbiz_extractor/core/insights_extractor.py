@@ -1,132 +1,252 @@
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+from vetbiz_extractor.core.funnel_insights import (
+    DENTAL_AFTER_CONSULT_RULE,
+    RULE_COLUMN,
+    get_funnel_sales,
+)
 from vetbiz_extractor.utils.common import (
-    end_of_month,
-    get_products_list,
-    get_date_range_for_month,
-    filter_data_for_date_range,
+    get_month_index,
+    get_month_index_for_date,
+    get_month_windows,
+    get_key_codes,
+    get_time_values,
 )
-from dateutil.relativedelta import relativedelta
+from vetbiz_extractor.utils.product_index import ProductIndex, get_product_index
+from vetbiz_extractor.utils.profiling import profiled, span
 
 
+@profiled()
 def get_follow_up_consults(
-    sales_data: pd.DataFrame, days_threshold: int = 14
+    sales_data: pd.DataFrame,
+    days_threshold: int = 14,
+    product_index: Optional[ProductIndex] = None,
 ) -> pd.DataFrame:
     """
     Filter the sales data to retrieve follow-up consults within a specified days threshold.
 
     :param sales_data: DataFrame containing sales data.
     :param days_threshold: Number of days to define the follow-up threshold (default is 14 days).
+    :param product_index: Optional product index of the sales data, built once and shared between analyses.
     :return: DataFrame filtered for follow-up consults within the specified days threshold.
     """
 
-    all_products = sales_data["product_name"].unique()
-    consult_products = get_products_list(all_products, "consult")
-
-    consults_df = sales_data[sales_data.product_name.isin(consult_products)]
-    # this workflow involves comparing days difference
-    # it's important to sort with invoice_date first
-    sorted_consults_df = consults_df.sort_values(by=["invoice_date"])
-    # Follow-up counts for each customer.
-    # A single customer may be linked to multiple consults, so group by customer as well.
-    consults_grouped_by_customer = sorted_consults_df.groupby("customer_tk")
-
-    def get_follow_up_within_days(consults_grouped_df, period):
-        """
-        Extract follow-up sale IDs from consults (grouped by customer)
-        for follow-up sales based on invoice dates within a given period.
-        :param consults_grouped_df:
-        :param period:
-        :return:
-        """
-        sale_ids = [
-            group["sale_id"].iloc[i]
-            for _, group in consults_grouped_df
-            for i in range(1, len(group))
-            if (group["invoice_date"].iloc[i] - group["invoice_date"].iloc[i - 1]).days
-            <= period
-        ]
-        return sale_ids
-
-    follow_up_sale_ids = get_follow_up_within_days(
-        consults_grouped_by_customer, days_threshold
+    product_index = get_product_index(sales_data, product_index)
+
+    consults_df = sales_data[product_index.get_mask("consult")]
+    customer_codes = get_key_codes(consults_df["customer_tk"])
+    times, has_date, ticks_per_day = get_time_values(consults_df["invoice_date"])
+
+    # this workflow involves comparing days difference between consecutive consults
+    # of the same customer, so sort once by customer and invoice_date.
+    # A stable sort keeps same-day consults in their original order.
+    # Consults without a customer or an invoice date are never follow-ups.
+    rows = np.flatnonzero(has_date & (customer_codes >= 0))
+    rows = rows[np.lexsort((times[rows], customer_codes[rows]))]
+
+    # A consult is a follow-up when the previous consult of the same customer is at most
+    # days_threshold whole days earlier
+    follow_ups = (customer_codes[rows[1:]] == customer_codes[rows[:-1]]) & (
+        np.diff(times[rows]) < (days_threshold + 1) * ticks_per_day
     )
+    follow_up_sale_ids = consults_df["sale_id"].to_numpy()[rows[1:][follow_ups]]
     return consults_df[consults_df["sale_id"].isin(follow_up_sale_ids)].reset_index(
         drop=True
     )
 
 
+@profiled()
 def get_dental_sales_after_consultation(
-    sales_data: pd.DataFrame, days_threshold: int = 14
+    sales_data: pd.DataFrame,
+    days_threshold: int = 14,
+    product_index: Optional[ProductIndex] = None,
 ) -> pd.DataFrame:
     """
     Filter the sales data to retrieve dental sales made after consultations within a specified days threshold.
 
     :param sales_data: DataFrame containing sales data.
     :param days_threshold: Number of days to define the threshold for sales after consultation (default is 14 days).
+    :param product_index: Optional product index of the sales data, built once and shared between analyses.
     :return: DataFrame filtered for dental sales made after consultations within the specified days threshold.
     """
 
-    all_products = sales_data["product_name"].unique()
-    dental_products = get_products_list(all_products, "dental")
-    consult_products = get_products_list(all_products, "consult")
-
-    def filter_sales_data(df, products):
-        """
-        Filters and returns unique sales records for a given list of products
-        :param df:
-        :param products:
-        :return:
-        """
-        filtered_df = df[df.product_name.isin(products)]
-        unique_sales = (
-            filtered_df[["clinic_tk", "customer_tk", "invoice_date"]]
-            .drop_duplicates()
-            .reset_index(drop=True)
-        )
-        return unique_sales.values
-
-    def find_dental_sales_within_days(
-        consult_products_sale_records, dental_products_sale_records, period
-    ):
-        """
-        find dental sales that occurred within 14 days (or period variable) after a consultation
-        :param consult_products_sale_records:
-        :param dental_products_sale_records:
-        :param period:
-        :return:
-        """
-        results = []
-        for consult_products_sale_record in consult_products_sale_records:
-            for dental_products_sale_record in dental_products_sale_records:
-                if consult_products_sale_record[1] == dental_products_sale_record[
-                    1
-                ] and consult_products_sale_record[2] <= dental_products_sale_record[
-                    2
-                ] <= consult_products_sale_record[
-                    2
-                ] + timedelta(
-                    days=period
-                ):
-                    results.append(dental_products_sale_record)
-        return (
-            pd.DataFrame(results, columns=["clinic_tk", "customer_tk", "invoice_date"])
-            .drop_duplicates()
-            .reset_index(drop=True)
+    # One rule of the funnel engine (see get_funnel_sales)
+    rule = DENTAL_AFTER_CONSULT_RULE._replace(days_threshold=days_threshold)
+    dental_sales = get_funnel_sales(
+        sales_data, [rule], product_index=get_product_index(sales_data, product_index)
+    )
+    return dental_sales.drop(columns=RULE_COLUMN)
+
+
+@lru_cache(maxsize=32)
+def get_lapsed_period_labels(first_window: int, last_window: int) -> np.ndarray:
+    """
+    Label the P2 period of every lapsed window, e.g. "1. 01-Jan-2019 to 31-Dec-2019".
+
+    :param first_window: The month index of the first window.
+    :param last_window: The month index of the last window.
+    :return: A read-only object array of the labels, one per window in chronological order.
+    """
+    windows = get_month_windows(first_window, last_window, lookahead_months=11)
+    p2_starts = pd.DatetimeIndex(windows.starts).strftime("%d-%b-%Y")
+    p2_ends = pd.DatetimeIndex(windows.lookahead_ends).strftime("%d-%b-%Y")
+    labels = np.array(
+        [
+            f"{counter}. {p2_start} to {p2_end}"
+            for counter, (p2_start, p2_end) in enumerate(
+                zip(p2_starts, p2_ends), start=1
+            )
+        ],
+        dtype=object,
+    )
+    labels.flags.writeable = False
+    return labels
+
+
+class LapsedClientPeriods(NamedTuple):
+    """
+    Compact lapsed clients: one (sales row, period) pair per lapsed client row, instead of a copy of the row.
+
+    - rows: int32 positions of the lapsed P1 rows in the sales data.
+    - period_ids: int32 ids of their periods, i.e. positions in `periods`.
+    - periods: the period dimension table, one row per window, with the columns window (the month index of
+      its first P2 month), l_period, p1_start, p1_end, p2_start and p2_end.
+    """
+
+    rows: np.ndarray
+    period_ids: np.ndarray
+    periods: pd.DataFrame
+
+
+def get_lapsed_periods(first_window: int, last_window: int) -> pd.DataFrame:
+    """
+    Build the period dimension table of the lapsed windows.
+
+    :param first_window: The month index of the first window.
+    :param last_window: The month index of the last window.
+    :return: DataFrame with the columns window, l_period, p1_start, p1_end, p2_start and p2_end.
+    """
+    windows = get_month_windows(
+        first_window, last_window, lookback_months=12, lookahead_months=11
+    )
+    return pd.DataFrame(
+        {
+            "window": windows.months,
+            "l_period": get_lapsed_period_labels(first_window, last_window),
+            "p1_start": windows.lookback_starts,
+            "p1_end": windows.starts - np.timedelta64(1, "D"),
+            "p2_start": windows.starts,
+            "p2_end": windows.lookahead_ends,
+        }
+    )
+
+
+@profiled()
+def get_lapsed_client_periods(
+    sales_data: pd.DataFrame, start_year: int = 2018
+) -> LapsedClientPeriods:
+    """
+    Identify the lapsed clients of the sales data, as row positions and period ids.
+
+    The windows are those of get_lapsed_clients. The result holds two int32 arrays and a small period table
+    instead of a wide frame; materialize_lapsed_clients builds the frame of get_lapsed_clients from it,
+    optionally for a subset of columns.
+
+    :param sales_data: Pandas DataFrame containing sales data.
+    :param start_year: integer representing the start year from which to measure inactivity.
+                       Defaults to 2018.
+    :return: The lapsed client rows, ordered by window, then by position in the sales data.
+    """
+    # Row positions fit in int32 for any realistic sales data
+    row_dtype = np.int32 if len(sales_data) <= np.iinfo(np.int32).max else np.int64
+    current_month_index = get_month_index_for_date(datetime.now())
+    # P2 of a window covers its own month and the 11 months after it
+    first_window, last_window = start_year * 12 + 7, current_month_index - 11
+    if first_window > last_window:
+        return LapsedClientPeriods(
+            np.empty(0, dtype=row_dtype),
+            np.empty(0, dtype=np.int32),
+            get_lapsed_periods(first_window, first_window - 1),
         )
 
-    # Filter dental products
-    unique_dental_products_sales = filter_sales_data(sales_data, dental_products)
-    # Filter consult products
-    unique_consult_products_sales = filter_sales_data(sales_data, consult_products)
+    # Only months covered by some P1 or P2 matter
+    first_month, last_month = first_window - 12, last_window + 11
+    month_index = get_month_index(sales_data["invoice_date"])
+    in_range = (month_index >= first_month) & (month_index <= last_month)
+    row_positions = np.flatnonzero(in_range.to_numpy())
+    row_months = month_index[in_range].to_numpy(dtype=np.int64) - first_month
+    customer_codes, _ = pd.factorize(
+        sales_data["customer_tk"].iloc[row_positions], use_na_sentinel=False
+    )
 
-    return find_dental_sales_within_days(
-        unique_consult_products_sales,
-        unique_dental_products_sales,
-        days_threshold,
+    # Distinct (customer, month) purchases encoded as sorted integer keys.
+    # The stride leaves a gap between customers wider than a P2 period,
+    # so a key lookup never runs into the next customer's purchases.
+    stride = last_month - first_month + 1 + 12
+    purchase_keys, row_purchase = np.unique(
+        customer_codes.astype(np.int64) * stride + row_months, return_inverse=True
+    )
+    purchase_months = purchase_keys % stride
+    sentinel_keys = np.append(purchase_keys, np.iinfo(np.int64).max)
+
+    lapsed_rows, lapsed_windows = [], []
+    # A purchase in month m falls in the P1 of windows m + 1 .. m + 12
+    for offset in range(1, 13):
+        with span("lapsed_clients_window_offset", offset=offset) as offset_span:
+            window_keys = purchase_keys + offset
+            window_months = purchase_months + offset + first_month
+            # First purchase of the same customer on or after the window start
+            next_purchase_keys = sentinel_keys[
+                np.searchsorted(purchase_keys, window_keys)
+            ]
+            lapsed = (
+                (next_purchase_keys >= window_keys + 12)
+                & (window_months >= first_window)
+                & (window_months <= last_window)
+            )
+            rows = np.flatnonzero(lapsed[row_purchase])
+            lapsed_rows.append(row_positions[rows])
+            lapsed_windows.append(window_months[row_purchase[rows]])
+            offset_span.set(rows_in=len(row_purchase), rows_out=len(rows))
+
+    lapsed_rows = np.concatenate(lapsed_rows)
+    lapsed_windows = np.concatenate(lapsed_windows)
+    # Windows in chronological order, rows in their original order within a window
+    order = np.lexsort((lapsed_rows, lapsed_windows))
+
+    return LapsedClientPeriods(
+        lapsed_rows[order].astype(row_dtype),
+        (lapsed_windows[order] - first_window).astype(np.int32),
+        get_lapsed_periods(first_window, last_window),
     )
 
 
+def materialize_lapsed_clients(
+    sales_data: pd.DataFrame,
+    lapsed_clients: LapsedClientPeriods,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Build the wide lapsed clients frame from the compact result, when (and as far as) it is needed.
+
+    :param sales_data: The sales data the compact result was computed from.
+    :param lapsed_clients: The compact result of get_lapsed_client_periods.
+    :param columns: Optional columns of the sales data to include (default is all columns).
+    :return: The lapsed client rows with their l_period, as returned by get_lapsed_clients.
+    """
+    if columns is not None:
+        sales_data = sales_data[columns]
+    lapsed_clients_df = sales_data.iloc[lapsed_clients.rows].reset_index(drop=True)
+    lapsed_clients_df["l_period"] = lapsed_clients.periods["l_period"].to_numpy(
+        dtype=object
+    )[lapsed_clients.period_ids]
+    return lapsed_clients_df
+
+
+@profiled()
 def get_lapsed_clients(
     sales_data: pd.DataFrame, start_year: int = 2018
 ) -> pd.DataFrame:
@@ -135,69 +255,25 @@ def get_lapsed_clients(
 
     A lapsed client is defined as a client who has not made any purchases since a specified start year.
 
+    Each window compares a 12-month period P1 with the following 12-month period P2 and keeps the P1 rows
+    of customers who bought in P1 but not in P2. Windows start every month from August of `start_year`
+    until the last month whose P2 has fully elapsed.
+
+    The output copies a P1 row for every window it is lapsed in; get_lapsed_client_periods returns the
+    compact (row, period) pairs instead.
+
     :param sales_data: Pandas DataFrame containing sales data.
                        It must include a 'last_purchase_date' column with dates of the last purchase.
     :param start_year: integer representing the start year from which to measure inactivity.
                        Defaults to 2018.
     :return: A pandas DataFrame filtered to include only the lapsed clients who have not made a purchase since the start year.
     """
-
-    columns = list(sales_data.columns) + ["l_period"]
-    current_year, current_month = datetime.now().year, datetime.now().month
-    all_df_values = []
-    counter = 0
-
-    def get_lapsed_customers(df1, df2):
-        return set(df1["customer_tk"]) - set(df2["customer_tk"])
-
-    for year in range(start_year, current_year + 1):
-        for month in range(1, 13):
-            if (
-                datetime(current_year - 1, current_month + 1, 1)
-                >= datetime(year, month, 1)
-                > datetime(start_year, 7, 1)
-            ):
-                counter += 1
-                p1_start, p1_end = (
-                    (datetime(year - 1, month, 1), datetime(year - 1, 12, 31))
-                    if month == 1
-                    else (
-                        datetime(year - 1, month, 1),
-                        datetime(year, month - 1, end_of_month(year, month - 1)),
-                    )
-                )
-                p2_start, p2_end = (
-                    (datetime(year, month, 1), datetime(year, 12, 31))
-                    if month == 1
-                    else (
-                        datetime(year, month, 1),
-                        datetime(
-                            year + 1, month - 1, end_of_month(year + 1, month - 1)
-                        ),
-                    )
-                )
-
-                p1_df = sales_data[
-                    (sales_data.invoice_date >= p1_start)
-                    & (sales_data.invoice_date <= p1_end)
-                ]
-                p2_df = sales_data[
-                    (sales_data.invoice_date >= p2_start)
-                    & (sales_data.invoice_date <= p2_end)
-                ]
-
-                temp_df = p1_df[
-                    p1_df.customer_tk.isin(get_lapsed_customers(p1_df, p2_df))
-                ]
-                temp_df_values = temp_df.values.tolist()
-                for values in temp_df_values:
-                    l_period = f"{counter}. {p2_start.strftime('%d-%b-%Y')} to {p2_end.strftime('%d-%b-%Y')}"
-                    values.append(l_period)
-                all_df_values = all_df_values + temp_df_values
-
-    return pd.DataFrame(data=all_df_values, columns=columns)
+    return materialize_lapsed_clients(
+        sales_data, get_lapsed_client_periods(sales_data, start_year)
+    )
 
 
+@profiled()
 def get_filtered_active_customers(
     customers_from_sales_data_df: pd.DataFrame,
     start_year: int = 2020,
@@ -209,6 +285,9 @@ def get_filtered_active_customers(
     This function filters out customers from the provided sales data DataFrame
     who have made purchases within the specified months threshold since the start year.
 
+    Rows are assigned to calendar months by their date, whatever their time of day, and rows without
+    a customer_tk are counted as the rows of one customer.
+
     :param customers_from_sales_data_df: Pandas DataFrame containing customer sales data.
                                          It must include a 'last_purchase_date' column.
     :param start_year: integer representing the start year from which to measure activity.
@@ -222,52 +301,46 @@ def get_filtered_active_customers(
     active_customers_df_columns = customers_from_sales_data_df.columns
 
     current_year = datetime.now().year
-    filtered_active_customers_list = []
-
-    def get_unique_customers(df):
-        """Returns a set of unique customers from the DataFrame."""
-        return set(df.customer_tk.unique())
-
-    for year in range(start_year, current_year + 1):
-        for month in range(1, 13):
-            start_date, end_date = get_date_range_for_month(year, month)
+    first_month, last_month = start_year * 12, current_year * 12 + 11
 
-            # Customers in the current month
-            current_month_data_df = filter_data_for_date_range(
-                customers_from_sales_data_df, start_date, end_date
-            )
-
-            active_window_start_date = start_date - relativedelta(
-                months=months_threshold
-            )
-
-            # Customers active in the period months_threshold before the current month
-            active_period_data_df = filter_data_for_date_range(
-                customers_from_sales_data_df,
-                active_window_start_date,
-                start_date - relativedelta(days=1),
-            )
-
-            # Get unique customer IDs
-            active_customers_current_month = get_unique_customers(current_month_data_df)
-            active_customers_period = get_unique_customers(active_period_data_df)
-
-            # Find active customers in the intersection
-            active_customers_to_keep = active_customers_current_month.intersection(
-                active_customers_period
-            )
-
-            # Filter the current month data to keep the active customers
-            active_customers_current_month_df = current_month_data_df[
-                current_month_data_df["customer_tk"].isin(active_customers_to_keep)
-            ]
+    # Months from the start of the lookback window of the first month to the end of the current year
+    month_index = get_month_index(customers_from_sales_data_df["date_field"])
+    in_range = (month_index >= first_month - months_threshold) & (
+        month_index <= last_month
+    )
+    row_positions = np.flatnonzero(in_range.to_numpy())
+    row_months = month_index[in_range].to_numpy(dtype=np.int64)
+    # Rows without a customer_tk are counted as the rows of one customer
+    customer_codes, _ = pd.factorize(
+        customers_from_sales_data_df["customer_tk"].iloc[row_positions],
+        use_na_sentinel=False,
+    )
 
-            # Convert DataFrame to list and append to active customers list
-            filtered_active_customers_list.extend(
-                active_customers_current_month_df.values.tolist()
-            )
+    # Walk each customer's distinct purchase months in order, carrying the month they were last seen
+    with span("active_customers_months", rows_in=len(row_positions)) as months_span:
+        purchases = (
+            pd.DataFrame({"customer": customer_codes, "month": row_months})
+            .drop_duplicates()
+            .sort_values(["customer", "month"])
+        )
+        last_seen_month = purchases.groupby("customer")["month"].shift()
+        purchases["active"] = (purchases["month"] >= first_month) & (
+            purchases["month"] - last_seen_month <= months_threshold
+        )
+        months_span.set(rows_out=len(purchases))
+
+    # Keep the rows of active (customer, month) pairs, month by month in their original order
+    with span("active_customers_rows", rows_in=len(row_positions)) as rows_span:
+        active_rows = pd.DataFrame(
+            {"position": row_positions, "customer": customer_codes, "month": row_months}
+        ).merge(
+            purchases[purchases["active"]][["customer", "month"]],
+            on=["customer", "month"],
+        )
+        active_rows = active_rows.sort_values(["month", "position"])
+        rows_span.set(rows_out=len(active_rows))
 
     # Create a DataFrame for all filtered active customers
-    return pd.DataFrame(
-        filtered_active_customers_list, columns=active_customers_df_columns
-    ).reset_index(drop=True)
+    return customers_from_sales_data_df.iloc[active_rows["position"].to_numpy()][
+        active_customers_df_columns
+    ].reset_index(drop=True)
@@ -0,0 +1,356 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import List, Optional
+from vetbiz_extractor.core.insights_extractor import (
+    get_lapsed_client_periods,
+    get_filtered_active_customers,
+    materialize_lapsed_clients,
+)
+from vetbiz_extractor.utils.common import (
+    fetch_data_in_batches,
+    get_month_starts,
+    get_month_index,
+    get_month_index_for_date,
+)
+from vetbiz_extractor.utils.connection_pool import ConnectionPool
+
+# SQL expressions of the month index (year * 12 + month - 1) of a date column, per SQL dialect
+MONTH_INDEX_EXPRESSIONS = {
+    "mysql": "YEAR({column}) * 12 + MONTH({column}) - 1",
+    "mssql": "YEAR({column}) * 12 + MONTH({column}) - 1",
+    "sqlite": "CAST(strftime('%Y', {column}) AS INTEGER) * 12 "
+    "+ CAST(strftime('%m', {column}) AS INTEGER) - 1",
+}
+
+MONTH_INDEX_COLUMN = "month_index"
+# Month index of the P2 start of a lapsed-client window
+WINDOW_COLUMN = "l_window"
+
+
+def get_presence_query(
+    query: str,
+    customer_column: str,
+    date_column: str,
+    first_month: Optional[int] = None,
+    last_month: Optional[int] = None,
+    dialect: str = "mysql",
+) -> str:
+    """
+    Build a query returning the distinct (customer, month) pairs of a query's rows instead of the rows themselves.
+
+    :param query: SQL query whose result includes `customer_column` and `date_column`.
+    :param customer_column: The customer column (e.g. customer_tk).
+    :param date_column: The date column assigning rows to months (e.g. invoice_date).
+    :param first_month: Optional first month index to include.
+    :param last_month: Optional last month index to include.
+    :param dialect: SQL dialect of the database ('mysql', 'mssql' or 'sqlite').
+    :return: A query returning the columns `customer_column` and month_index.
+    :raises ValueError: If the dialect is not supported
+    """
+    if dialect not in MONTH_INDEX_EXPRESSIONS:
+        raise ValueError(
+            f"Unsupported SQL dialect '{dialect}'. "
+            f"Supported dialects: {', '.join(MONTH_INDEX_EXPRESSIONS)}"
+        )
+
+    month_index = MONTH_INDEX_EXPRESSIONS[dialect].format(
+        column=f"presence_source.{date_column}"
+    )
+    conditions = [f"presence_source.{date_column} IS NOT NULL"]
+    if first_month is not None:
+        conditions.append(f"{month_index} >= {int(first_month)}")
+    if last_month is not None:
+        conditions.append(f"{month_index} <= {int(last_month)}")
+
+    return (
+        f"SELECT DISTINCT presence_source.{customer_column}, {month_index} AS {MONTH_INDEX_COLUMN} "
+        f"FROM ({query.strip().rstrip(';')}) AS presence_source "
+        f"WHERE {' AND '.join(conditions)}"
+    )
+
+
+def fetch_customer_month_presence(
+    query: str,
+    customer_column: str,
+    date_column: str,
+    db_user: str,
+    db_password: str,
+    db_host: str,
+    db_name: str,
+    db_port: int = 3306,
+    first_month: Optional[int] = None,
+    last_month: Optional[int] = None,
+    connection_pool: Optional[ConnectionPool] = None,
+    dialect: str = "mysql",
+) -> pd.DataFrame:
+    """
+    Fetch the distinct (customer, month) pairs of a query, aggregated by the database.
+
+    :param query: SQL query whose result includes `customer_column` and `date_column`.
+    :param customer_column: The customer column (e.g. customer_tk).
+    :param date_column: The date column assigning rows to months (e.g. invoice_date).
+    :param db_user: Database user
+    :param db_password: Database password
+    :param db_host: Database host
+    :param db_name: Database name
+    :param db_port: Database port
+    :param first_month: Optional first month index to include.
+    :param last_month: Optional last month index to include.
+    :param connection_pool: Optional pool to borrow the connection from (e.g. of sqlite3 connections for testing).
+    :param dialect: SQL dialect of the database ('mysql', 'mssql' or 'sqlite').
+    :return: DataFrame with the columns `customer_column` and month_index, one row per distinct pair.
+    :raises pymysql.MySQLError: If the query fails (or the error of the connection's driver)
+    """
+    presence = fetch_data_in_batches(
+        query=get_presence_query(
+            query, customer_column, date_column, first_month, last_month, dialect
+        ),
+        db_user=db_user,
+        db_password=db_password,
+        db_host=db_host,
+        db_name=db_name,
+        db_port=db_port,
+        connection_pool=connection_pool,
+        # A failed query must not look like a result without customers
+        raise_errors=True,
+    )
+    if presence.empty:
+        return pd.DataFrame(
+            {
+                customer_column: pd.Series(dtype=np.int64),
+                MONTH_INDEX_COLUMN: pd.Series(dtype=np.int64),
+            }
+        )
+    # Drivers without column types (e.g. sqlite3) return object columns
+    presence = presence.infer_objects()
+    presence[MONTH_INDEX_COLUMN] = presence[MONTH_INDEX_COLUMN].astype(np.int64)
+    return presence
+
+
+def get_presence_frame(
+    presence: pd.DataFrame, customer_column: str, date_column: str
+) -> pd.DataFrame:
+    """
+    Represent every (customer, month) pair as one row dated the first day of its month.
+
+    :param presence: DataFrame with the columns `customer_column` and month_index.
+    :param customer_column: The customer column.
+    :param date_column: The date column the insights function reads.
+    :return: DataFrame with the columns `customer_column`, `date_column` and month_index.
+    """
+    return pd.DataFrame(
+        {
+            customer_column: presence[customer_column].to_numpy(),
+            date_column: get_month_starts(presence[MONTH_INDEX_COLUMN].to_numpy()),
+            MONTH_INDEX_COLUMN: presence[MONTH_INDEX_COLUMN].to_numpy(),
+        }
+    )
+
+
+def get_lapsed_customer_months(
+    presence: pd.DataFrame, start_year: int = 2018
+) -> pd.DataFrame:
+    """
+    Find the lapsed (customer, P1 month) pairs of every window from the customer-month presence table.
+
+    :param presence: DataFrame with the columns customer_tk and month_index (see fetch_customer_month_presence).
+    :param start_year: integer representing the start year from which to measure inactivity.
+                       Defaults to 2018.
+    :return: DataFrame with the columns customer_tk, month_index, l_window and l_period, ordered by window.
+    """
+    presence_frame = get_presence_frame(presence, "customer_tk", "invoice_date")
+    lapsed = get_lapsed_client_periods(presence_frame, start_year)
+    lapsed_customer_months = materialize_lapsed_clients(
+        presence_frame, lapsed, ["customer_tk", MONTH_INDEX_COLUMN]
+    )
+    lapsed_customer_months.insert(
+        2,
+        WINDOW_COLUMN,
+        lapsed.periods["window"].to_numpy(dtype=np.int64)[lapsed.period_ids],
+    )
+    return lapsed_customer_months
+
+
+def get_active_customer_months(
+    presence: pd.DataFrame, start_year: int = 2020, months_threshold: int = 18
+) -> pd.DataFrame:
+    """
+    Find the active (customer, month) pairs from the customer-month presence table.
+
+    :param presence: DataFrame with the columns customer_tk and month_index (see fetch_customer_month_presence).
+    :param start_year: integer representing the start year from which to measure activity.
+                       Defaults to 2020.
+    :param months_threshold: Integer representing the number of months within which a customer
+                             must have made a purchase to be considered active. Defaults to 18 months.
+    :return: DataFrame with the columns customer_tk and month_index, ordered by month.
+    """
+    active = get_filtered_active_customers(
+        get_presence_frame(presence, "customer_tk", "date_field"),
+        start_year,
+        months_threshold,
+    )
+    return active[["customer_tk", MONTH_INDEX_COLUMN]]
+
+
+def fetch_lapsed_customer_months(
+    query: str,
+    db_user: str,
+    db_password: str,
+    db_host: str,
+    db_name: str,
+    db_port: int = 3306,
+    start_year: int = 2018,
+    connection_pool: Optional[ConnectionPool] = None,
+    dialect: str = "mysql",
+) -> pd.DataFrame:
+    """
+    Find the lapsed (customer, P1 month) pairs of a sales query, fetching only its customer-month presence.
+
+    :param query: The sales query (its result must include customer_tk and invoice_date).
+    :param db_user: Database user
+    :param db_password: Database password
+    :param db_host: Database host
+    :param db_name: Database name
+    :param db_port: Database port
+    :param start_year: integer representing the start year from which to measure inactivity.
+    :param connection_pool: Optional pool to borrow the connection from.
+    :param dialect: SQL dialect of the database ('mysql', 'mssql' or 'sqlite').
+    :return: DataFrame with the columns customer_tk, month_index, l_window and l_period (see get_lapsed_customer_months).
+    :raises pymysql.MySQLError: If the query fails (or the error of the connection's driver)
+    """
+    # Months covered by the P1 of the first window to the P2 of the last window
+    presence = fetch_customer_month_presence(
+        query,
+        "customer_tk",
+        "invoice_date",
+        db_user,
+        db_password,
+        db_host,
+        db_name,
+        db_port=db_port,
+        first_month=start_year * 12 - 5,
+        last_month=get_month_index_for_date(datetime.now()),
+        connection_pool=connection_pool,
+        dialect=dialect,
+    )
+    return get_lapsed_customer_months(presence, start_year)
+
+
+def fetch_active_customer_months(
+    query: str,
+    db_user: str,
+    db_password: str,
+    db_host: str,
+    db_name: str,
+    db_port: int = 3306,
+    start_year: int = 2020,
+    months_threshold: int = 18,
+    connection_pool: Optional[ConnectionPool] = None,
+    dialect: str = "mysql",
+) -> pd.DataFrame:
+    """
+    Find the active (customer, month) pairs of a customers-from-sales query, fetching only its customer-month presence.
+
+    :param query: The customers-from-sales query (its result must include customer_tk and date_field).
+    :param db_user: Database user
+    :param db_password: Database password
+    :param db_host: Database host
+    :param db_name: Database name
+    :param db_port: Database port
+    :param start_year: integer representing the start year from which to measure activity.
+    :param months_threshold: Number of months within which a customer must have made a purchase to be active.
+    :param connection_pool: Optional pool to borrow the connection from.
+    :param dialect: SQL dialect of the database ('mysql', 'mssql' or 'sqlite').
+    :return: DataFrame with the columns customer_tk and month_index (see get_active_customer_months).
+    :raises pymysql.MySQLError: If the query fails (or the error of the connection's driver)
+    """
+    # Months from the lookback window of the first month to the end of the current year
+    presence = fetch_customer_month_presence(
+        query,
+        "customer_tk",
+        "date_field",
+        db_user,
+        db_password,
+        db_host,
+        db_name,
+        db_port=db_port,
+        first_month=start_year * 12 - months_threshold,
+        last_month=datetime.now().year * 12 + 11,
+        connection_pool=connection_pool,
+        dialect=dialect,
+    )
+    return get_active_customer_months(presence, start_year, months_threshold)
+
+
+def join_customer_months(
+    detail_df: pd.DataFrame,
+    customer_months: pd.DataFrame,
+    date_column: str,
+    order_column: str,
+    extra_columns: List[str],
+) -> pd.DataFrame:
+    """
+    Select the detail rows of (customer, month) pairs, once per pair they match.
+
+    :param detail_df: The detail rows (e.g. the sales data).
+    :param customer_months: DataFrame with the columns customer_tk and month_index.
+    :param date_column: The column assigning detail rows to months.
+    :param order_column: The column of `customer_months` the result is ordered by, before the detail row order.
+    :param extra_columns: Columns of `customer_months` added to the selected detail rows.
+    :return: The matching detail rows with the extra columns.
+    """
+    detail_keys = pd.DataFrame(
+        {
+            "position": np.arange(len(detail_df)),
+            "customer_tk": detail_df["customer_tk"].to_numpy(),
+            MONTH_INDEX_COLUMN: get_month_index(detail_df[date_column]).to_numpy(),
+        }
+    )
+    matched = detail_keys.merge(
+        customer_months, on=["customer_tk", MONTH_INDEX_COLUMN]
+    ).sort_values([order_column, "position"])
+
+    result = detail_df.iloc[matched["position"].to_numpy()].reset_index(drop=True)
+    for column in extra_columns:
+        result[column] = matched[column].to_numpy()
+    return result
+
+
+def join_lapsed_clients(
+    sales_data: pd.DataFrame, lapsed_customer_months: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Select the lapsed client rows of the sales data from its lapsed (customer, P1 month) pairs.
+
+    The result is the same as get_lapsed_clients(sales_data) when the pairs were computed from the same rows.
+
+    :param sales_data: DataFrame containing sales data.
+    :param lapsed_customer_months: The result of get_lapsed_customer_months or fetch_lapsed_customer_months.
+    :return: The lapsed client rows with their l_period.
+    """
+    return join_customer_months(
+        sales_data, lapsed_customer_months, "invoice_date", WINDOW_COLUMN, ["l_period"]
+    )
+
+
+def join_active_customers(
+    customers_from_sales_data_df: pd.DataFrame, active_customer_months: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Select the active customer rows of the customers-from-sales data from its active (customer, month) pairs.
+
+    The result is the same as get_filtered_active_customers(customers_from_sales_data_df)
+    when the pairs were computed from the same rows.
+
+    :param customers_from_sales_data_df: DataFrame containing customer sales data.
+    :param active_customer_months: The result of get_active_customer_months or fetch_active_customer_months.
+    :return: The active customer rows.
+    """
+    return join_customer_months(
+        customers_from_sales_data_df,
+        active_customer_months,
+        "date_field",
+        MONTH_INDEX_COLUMN,
+        [],
+    )
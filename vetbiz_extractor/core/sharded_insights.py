@@ -0,0 +1,298 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+from vetbiz_extractor.core.insights_extractor import (
+    get_follow_up_consults,
+    get_dental_sales_after_consultation,
+    get_lapsed_clients,
+    get_lapsed_client_periods,
+)
+from vetbiz_extractor.core.funnel_insights import FUNNEL_RECORD_COLUMNS
+from vetbiz_extractor.utils.product_index import get_product_index
+from vetbiz_extractor.utils.profiling import profiled, span
+
+# Insights functions that only relate rows of the same customer, so they can run on shards of customers
+SHARDABLE_INSIGHTS = {
+    "get_follow_up_consults": get_follow_up_consults,
+    "get_dental_sales_after_consultation": get_dental_sales_after_consultation,
+    "get_lapsed_clients": get_lapsed_clients,
+}
+
+SHARD_KEYS = ("clinic_tk", "customer_tk")
+
+# The only columns the shardable insights functions read; shards carry just these
+SHARD_COLUMNS = ["sale_id", "clinic_tk", "customer_tk", "invoice_date", "product_name"]
+
+# Position of a result row's source row in the unsharded sales data, and the lapsed-client window number
+ROW_COLUMN = "__row"
+WINDOW_COLUMN = "__window"
+
+# Columns restoring the order of the single-process results once the shard results are concatenated
+RESULT_ORDER_COLUMNS = {
+    "get_follow_up_consults": [ROW_COLUMN],
+    "get_dental_sales_after_consultation": [ROW_COLUMN],
+    "get_lapsed_clients": [WINDOW_COLUMN, ROW_COLUMN],
+}
+
+# Results made of sales data rows are sent back as row positions (and the columns they add),
+# and the rows are taken from the unsharded sales data
+ROW_RESULT_COLUMNS = {
+    "get_follow_up_consults": [],
+    "get_dental_sales_after_consultation": [],
+    "get_lapsed_clients": ["l_period"],
+}
+
+# Columns of the sales data rows of results that only keep some columns
+ROW_RESULT_SELECTED_COLUMNS = {
+    "get_dental_sales_after_consultation": FUNNEL_RECORD_COLUMNS,
+}
+
+
+def write_arrow_file(df: pd.DataFrame, path: str) -> None:
+    """
+    Write a DataFrame to an uncompressed Arrow IPC file, so it can be memory-mapped by another process.
+
+    :param df: The DataFrame to write (its index is not written).
+    :param path: The file path.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow_file(path: str) -> pd.DataFrame:
+    """
+    Read a DataFrame from an Arrow IPC file through a memory map.
+
+    :param path: The file path.
+    :return: The DataFrame, with the dtypes it was written with.
+    """
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def get_shard_ids(sales_data: pd.DataFrame, shard_by: str, n_shards: int) -> np.ndarray:
+    """
+    Assign every row of the sales data to a shard.
+
+    Clinics are assigned whole, largest first, to the shard with the fewest rows so far.
+    Customers are assigned by a hash of customer_tk.
+    Rows without a customer_tk are the rows of one customer (see get_key_codes), whatever their clinic,
+    so they are all assigned to one shard.
+
+    :param sales_data: DataFrame containing sales data.
+    :param shard_by: 'clinic_tk' or 'customer_tk'.
+    :param n_shards: Number of shards.
+    :return: The shard id of every row.
+    """
+    missing_customers = sales_data["customer_tk"].isna().to_numpy()
+    if shard_by == "customer_tk":
+        customer_hashes = pd.util.hash_pandas_object(
+            sales_data["customer_tk"], index=False
+        ).to_numpy()
+        shard_ids = (customer_hashes % np.uint64(n_shards)).astype(np.int64)
+        shard_ids[missing_customers] = 0
+        return shard_ids
+
+    # Clinics, and the rows without a customer_tk as one more group
+    clinic_codes, clinics = pd.factorize(sales_data["clinic_tk"], use_na_sentinel=False)
+    group_codes = np.where(missing_customers, len(clinics), clinic_codes)
+    group_rows = np.bincount(group_codes, minlength=len(clinics) + 1)
+    group_shards = np.empty(len(group_rows), dtype=np.int64)
+    shard_rows = np.zeros(n_shards, dtype=np.int64)
+    for group in np.argsort(-group_rows, kind="stable"):
+        shard = np.argmin(shard_rows)
+        group_shards[group] = shard
+        shard_rows[shard] += group_rows[group]
+    return group_shards[group_codes]
+
+
+def run_insights_on_shard(
+    shard_path: str,
+    result_dir: str,
+    insights: Sequence[str],
+    insight_params: Dict[str, Dict[str, Any]],
+) -> Dict[str, str]:
+    """
+    Run insights functions on one shard and write each result, with its order columns, to an Arrow file.
+
+    This runs in a worker process.
+
+    :param shard_path: Arrow file holding the shard, with the ROW_COLUMN of every row.
+    :param result_dir: Directory the results are written to.
+    :param insights: Names of the insights functions to run.
+    :param insight_params: Keyword parameters of each insights function.
+    :return: Mapping of insights function names to result file paths.
+    """
+    shard = read_arrow_file(shard_path)
+    product_index = get_product_index(shard)
+
+    result_paths = {}
+    for insight in insights:
+        params = insight_params.get(insight, {})
+        if insight == "get_lapsed_clients":
+            # Only the row positions and periods are returned, not copies of the rows
+            lapsed = get_lapsed_client_periods(shard, **params)
+            result = pd.DataFrame(
+                {
+                    WINDOW_COLUMN: lapsed.periods["window"].to_numpy(dtype=np.int64)[
+                        lapsed.period_ids
+                    ],
+                    ROW_COLUMN: shard[ROW_COLUMN].to_numpy()[lapsed.rows],
+                    "l_period": pd.Categorical.from_codes(
+                        lapsed.period_ids, lapsed.periods["l_period"]
+                    ),
+                }
+            )
+        elif insight == "get_dental_sales_after_consultation":
+            result = get_dental_sales_after_consultation(
+                shard, product_index=product_index, **params
+            )
+            # Dental records are unique (clinic, customer, date) keys, each taken from its first dental row
+            first_dental_rows = shard.loc[
+                product_index.get_mask("dental"), FUNNEL_RECORD_COLUMNS + [ROW_COLUMN]
+            ].drop_duplicates(FUNNEL_RECORD_COLUMNS)
+            result = result.merge(
+                first_dental_rows, on=FUNNEL_RECORD_COLUMNS, how="left"
+            )
+        else:
+            result = get_follow_up_consults(
+                shard, product_index=product_index, **params
+            )
+
+        if insight in ROW_RESULT_COLUMNS:
+            result = result[RESULT_ORDER_COLUMNS[insight] + ROW_RESULT_COLUMNS[insight]]
+
+        result_paths[insight] = os.path.join(
+            result_dir, f"{insight}_{os.path.basename(shard_path)}"
+        )
+        write_arrow_file(result, result_paths[insight])
+    return result_paths
+
+
+@profiled()
+def run_insights_sharded(
+    sales_data: pd.DataFrame,
+    insights: Sequence[str] = tuple(SHARDABLE_INSIGHTS),
+    shard_by: str = "clinic_tk",
+    n_shards: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    insight_params: Optional[Dict[str, Dict[str, Any]]] = None,
+    temp_dir: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Run insights functions on shards of the sales data in a process pool and concatenate their results.
+
+    Rows are partitioned by clinic_tk (every customer buying at one clinic only) or by a hash of customer_tk
+    (exact for any data); rows without a customer_tk are kept in one shard either way. Shards and results are exchanged as memory-mapped Arrow IPC files in a temporary
+    directory instead of pickled DataFrames. The results are identical to running the functions on the whole
+    sales data, in the same row order.
+
+    Shards only carry the columns the functions read (SHARD_COLUMNS). Results made of sales data rows come
+    back as row positions and are taken from `sales_data` in this process.
+
+    :param sales_data: DataFrame containing sales data.
+    :param insights: Names of the insights functions to run, from SHARDABLE_INSIGHTS.
+    :param shard_by: 'clinic_tk' or 'customer_tk'.
+    :param n_shards: Number of shards (default is one per worker).
+    :param max_workers: Maximum number of worker processes (default is the number of CPUs).
+    :param insight_params: Optional keyword parameters of each insights function, by function name.
+    :param temp_dir: Optional directory the temporary Arrow files are created in (e.g. a RAM disk).
+    :return: Mapping of insights function names to their results, in the order of `insights`.
+    :raises ValueError: If an insights function or the shard key is not supported
+    """
+    unsupported_insights = [
+        insight for insight in insights if insight not in SHARDABLE_INSIGHTS
+    ]
+    if unsupported_insights:
+        raise ValueError(
+            f"Unsupported insights functions: {', '.join(unsupported_insights)}. "
+            f"Supported functions: {', '.join(SHARDABLE_INSIGHTS)}"
+        )
+    if shard_by not in SHARD_KEYS:
+        raise ValueError(
+            f"Unsupported shard key '{shard_by}'. Supported keys: {', '.join(SHARD_KEYS)}"
+        )
+
+    max_workers = max_workers or os.cpu_count() or 1
+    n_shards = n_shards or max_workers
+    insight_params = insight_params or {}
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as shard_dir:
+        with span("write_shards", rows_in=len(sales_data), shard_by=shard_by):
+            shard_ids = get_shard_ids(sales_data, shard_by, n_shards)
+            shard_paths = []
+            for shard_id in np.unique(shard_ids):
+                rows = np.flatnonzero(shard_ids == shard_id)
+                shard = sales_data[SHARD_COLUMNS].iloc[rows].reset_index(drop=True)
+                shard[ROW_COLUMN] = rows
+                shard_paths.append(os.path.join(shard_dir, f"shard_{shard_id}.arrow"))
+                write_arrow_file(shard, shard_paths[-1])
+
+        with span("run_shards", shards=len(shard_paths)):
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        run_insights_on_shard,
+                        shard_path,
+                        shard_dir,
+                        list(insights),
+                        insight_params,
+                    )
+                    for shard_path in shard_paths
+                ]
+                shard_result_paths = [future.result() for future in futures]
+
+        results = {}
+        for insight in insights:
+            with span("concat_shard_results", insight=insight) as concat_span:
+                results[insight] = concat_shard_results(
+                    insight,
+                    [read_arrow_file(paths[insight]) for paths in shard_result_paths],
+                    sales_data,
+                    insight_params.get(insight, {}),
+                )
+                concat_span.set(rows_out=len(results[insight]))
+        return results
+
+
+def concat_shard_results(
+    insight: str,
+    shard_results: List[pd.DataFrame],
+    sales_data: pd.DataFrame,
+    params: Dict[str, Any],
+) -> pd.DataFrame:
+    """
+    Concatenate the results of an insights function on every shard in the order of the single-process result.
+
+    :param insight: Name of the insights function.
+    :param shard_results: The result of every shard, with its order columns.
+    :param sales_data: The unsharded sales data.
+    :param params: Keyword parameters of the insights function.
+    :return: The combined result without the order columns.
+    """
+    non_empty_results = [df for df in shard_results if not df.empty]
+    if not non_empty_results:
+        return SHARDABLE_INSIGHTS[insight](sales_data.iloc[:0], **params)
+
+    order_columns = RESULT_ORDER_COLUMNS[insight]
+    results = pd.concat(non_empty_results, ignore_index=True)
+    order = np.lexsort(
+        [results[column].to_numpy() for column in reversed(order_columns)]
+    )
+    results = results.iloc[order].reset_index(drop=True)
+
+    if insight not in ROW_RESULT_COLUMNS:
+        return results.drop(columns=order_columns)
+
+    row_results = sales_data.iloc[results[ROW_COLUMN].to_numpy()].reset_index(drop=True)
+    if insight in ROW_RESULT_SELECTED_COLUMNS:
+        row_results = row_results[ROW_RESULT_SELECTED_COLUMNS[insight]]
+    for column in ROW_RESULT_COLUMNS[insight]:
+        row_results[column] = results[column].to_numpy(dtype=object)
+    return row_results
@@ -1,17 +1,87 @@
 import time
+import queue
+import threading
+import numpy as np
 import pandas as pd
 import pymysql
-import pymssql
 import calendar
 import os
-from datetime import datetime
-from typing import List, Tuple, Union, Callable, Any, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache, partial
+from pymysql.constants import FIELD_TYPE
+from vetbiz_extractor.utils.connection_pool import (
+    ConnectionPool,
+    close_quietly,
+    open_connection,
+)
+from vetbiz_extractor.utils.profiling import profiled, span
+from vetbiz_extractor.utils.time_budget import (
+    TimeBudget,
+    cancel_on_exhaustion,
+    get_query_budget,
+)
+from typing import (
+    List,
+    Tuple,
+    Union,
+    Callable,
+    Any,
+    Optional,
+    Dict,
+    Iterator,
+    Sequence,
+    NamedTuple,
+)
+
+# Column kinds used to type fetched columns from the MySQL cursor description
+MYSQL_COLUMN_KINDS = {
+    FIELD_TYPE.TINY: "integer",
+    FIELD_TYPE.SHORT: "integer",
+    FIELD_TYPE.LONG: "integer",
+    FIELD_TYPE.LONGLONG: "integer",
+    FIELD_TYPE.INT24: "integer",
+    FIELD_TYPE.YEAR: "integer",
+    FIELD_TYPE.FLOAT: "float",
+    FIELD_TYPE.DOUBLE: "float",
+    FIELD_TYPE.DECIMAL: "float",
+    FIELD_TYPE.NEWDECIMAL: "float",
+    FIELD_TYPE.DATE: "date",
+    FIELD_TYPE.NEWDATE: "date",
+    FIELD_TYPE.DATETIME: "datetime",
+    FIELD_TYPE.TIMESTAMP: "datetime",
+}
+
+# pymssql type codes: NUMBER (3), DATETIME (4) and DECIMAL (5)
+MSSQL_COLUMN_KINDS = {
+    3: "infer",
+    4: "datetime",
+    5: "float",
+}
+
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# DataFrame.attrs keys tagging fetched data cut short by a time budget or missing failed tables
+PARTIAL_RESULT_ATTR = "partial"
+PARTIAL_TABLES_ATTR = "partial_tables"
+FAILED_TABLES_ATTR = "failed_tables"
+
+# Placeholder of query parameters, per SQL dialect
+QUERY_PLACEHOLDERS = {"mssql": "%s", "mysql": "%s", "sqlite": "?"}
+
+# Day number (days since 1970-01-01) marking a missing date in int32 day number columns
+MISSING_DAY_NUMBER = np.iinfo(np.int32).min
+
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 10**9
 
 
 def measure_execution_time(script_function: Callable[..., Any]) -> Callable[..., Any]:
     """
     Decorator to measure the execution time of a script function and print the duration in minutes.
 
+    The script also runs in the root span of the profile when profiling is enabled
+    (see vetbiz_extractor.utils.profiling).
+
     :param script_function: The function representing the script to be timed.
     :return: The wrapper function.
     """
@@ -20,7 +90,8 @@ def measure_execution_time(script_function: Callable[..., Any]) -> Callable[...,
         start_time = time.time()
         print("Starting script...")
         # Run the script function
-        result = script_function(*args, **kwargs)
+        with span(script_function.__name__):
+            result = script_function(*args, **kwargs)
         end_time = time.time()
         duration_seconds = end_time - start_time
         duration_minutes = duration_seconds / 60
@@ -30,70 +101,92 @@ def measure_execution_time(script_function: Callable[..., Any]) -> Callable[...,
     return wrapper
 
 
-def fetch_xero_journals_data_from_etani(
-    db_server: str,
-    db_user: str,
-    db_password: str,
-    db_name: str,
-    journals_tables_list: List[str],
-    batch_size: int = 10000,
-    query_limit: Optional[int] = None,
-) -> pd.DataFrame:
+def run_concurrently(
+    tasks: Dict[str, Callable[[], Any]], max_workers: Optional[int] = None
+) -> Dict[str, Any]:
     """
-    Fetches data from multiple Xero journals tables in the Etani SQL database and combines them into a single DataFrame.
+    Run independent tasks, such as source queries, concurrently in a thread pool and print the latency of each.
 
-    :param db_server: The database server address.
-    :param db_user: The username for the database.
-    :param db_password: The password for the database user.
-    :param db_name: The name of the database.
-    :param journals_tables_list: A list of journal table names to fetch data from.
-    :param batch_size: Number of rows to fetch per batch
-    :param query_limit: An optional limit on the number of rows per table.
-    :return: A pandas DataFrame containing the combined data from the specified journal tables.
+    :param tasks: Mapping of task names to callables taking no arguments.
+    :param max_workers: Maximum number of tasks running at the same time (default is one thread per task).
+    :return: Mapping of task names to task results, in the order of `tasks`.
     """
 
-    try:
-        with pymssql.connect(
-            server=db_server,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-        ) as conn:
-            cursor = conn.cursor()
+    def run_timed_task(name: str, task: Callable[[], Any]) -> Any:
+        start_time = time.time()
+        with span(name):
+            result = task()
+        print(f"{name} finished in {time.time() - start_time:.2f} seconds")
+        return result
 
-            all_journals_data = []
-            for journal_table in journals_tables_list:
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(tasks), 1)) as executor:
+        futures = {
+            name: executor.submit(run_timed_task, name, task)
+            for name, task in tasks.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
 
-                if query_limit:
-                    query = f"SELECT TOP {query_limit} * FROM {journal_table};"
-                else:
-                    query = f"SELECT * FROM {journal_table};"
 
-                cursor.execute(query)
+def get_failed_tables_dataframe(tables: Sequence[str]) -> pd.DataFrame:
+    """
+    Return the result of a fetch that failed as a whole: an empty DataFrame tagged as partial, with every table failed.
 
-                # Initialize an empty DataFrame to accumulate the results
-                df = pd.DataFrame()
-                column_names = [desc[0] for desc in cursor.description]
+    :param tables: The tables that were to be fetched (empty when they were not known yet, e.g. before discovery).
+    :return: An empty DataFrame with the partial, partial_tables and failed_tables attrs.
+    """
+    df = pd.DataFrame()
+    df.attrs[PARTIAL_RESULT_ATTR] = True
+    df.attrs[PARTIAL_TABLES_ATTR] = []
+    df.attrs[FAILED_TABLES_ATTR] = list(tables)
+    return df
 
-                while True:
-                    rows = cursor.fetchmany(batch_size)
-                    if not rows:
-                        break
 
-                    batch_df = pd.DataFrame(rows, columns=column_names)
-                    batch_df = exclude_all_na_columns(batch_df)
-                    df = pd.concat([df, batch_df], ignore_index=True)
+def cancel_connection_query(conn: Any) -> None:
+    """
+    Cancel the query running on a connection from another thread, for drivers that support it.
 
-                all_journals_data.append(df)
+    sqlite3 connections are interrupted. pymssql has no public cancel, so its connections are cancelled
+    through the underlying _mssql connection (conn._conn) when it exposes a cancel method; with any other
+    connection (or a pymssql version without it) nothing is cancelled, and the query runs until it
+    ends while the time budget only stops fetching its rows.
 
-            cursor.close()
+    :param conn: A DB-API connection.
+    """
+    interrupt = getattr(conn, "interrupt", None)
+    if callable(interrupt):
+        interrupt()
+        return
+    cancel = getattr(getattr(conn, "_conn", None), "cancel", None)
+    if callable(cancel):
+        cancel()
+
+
+def cancel_mysql_query(connection_factory: Callable[[], Any], thread_id: int) -> None:
+    """
+    Cancel the query of a MySQL connection by killing it from a new connection, as MySQL has no in-band cancel.
+
+    :param connection_factory: A callable returning a new pymysql connection to the same server.
+    :param thread_id: The thread id of the connection running the query.
+    """
+    killer = connection_factory()
+    try:
+        killer.kill(thread_id)
+    finally:
+        close_quietly(killer)
 
-            results = pd.concat(all_journals_data)
-            return results if not results.empty else pd.DataFrame(columns=column_names)
-    except pymssql.DatabaseError as e:
-        print(f"Database error occurred: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+
+def to_query_param(value: Any) -> Any:
+    """
+    Convert a pandas or NumPy scalar (e.g. a column maximum) into a Python value the database drivers can escape.
+
+    :param value: The value to convert.
+    :return: The value as a Python scalar.
+    """
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
 
 
 def exclude_all_na_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -101,6 +194,326 @@ def exclude_all_na_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df.dropna(axis=1, how="all")
 
 
+def get_column_kinds(
+    cursor_description: Sequence[Sequence[Any]], column_kinds: Dict[Any, str]
+) -> List[str]:
+    """
+    Map the type codes of a cursor description to column kinds.
+
+    :param cursor_description: The DB-API cursor description.
+    :param column_kinds: Mapping of driver type codes to 'integer', 'float', 'date', 'datetime' or 'infer'.
+    :return: The kind of each column ('object' for unmapped type codes).
+    """
+    return [column_kinds.get(desc[1], "object") for desc in cursor_description]
+
+
+def convert_column_values(values: Sequence[Any], kind: str) -> np.ndarray:
+    """
+    Convert the values of one fetched column into a typed NumPy array.
+
+    Integer columns containing NULLs become float64 with NaN, as pandas would infer them.
+
+    :param values: The column values as returned by the driver.
+    :param kind: The column kind ('integer', 'float', 'date', 'datetime', 'infer' or 'object').
+                 'infer' leaves the dtype to pandas.
+    :return: A NumPy array holding the column values.
+    """
+    if kind == "integer" and None not in values:
+        return np.array(values, dtype=np.int64)
+    if kind in ("integer", "float"):
+        return np.array(
+            [np.nan if value is None else float(value) for value in values],
+            dtype=np.float64,
+        )
+    if kind == "date":
+        # Day numbers convert much faster than parsing datetime.date objects
+        days = np.array(
+            [
+                (
+                    value.toordinal() - UNIX_EPOCH_ORDINAL
+                    if isinstance(value, date)
+                    else np.iinfo(np.int64).min
+                )
+                for value in values
+            ],
+            dtype=np.int64,
+        )
+        return days.astype("datetime64[D]").astype("datetime64[ns]")
+    if kind == "datetime":
+        return pd.to_datetime(values, errors="coerce").to_numpy()
+    if kind == "infer":
+        return pd.Series(values).to_numpy()
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def iter_cursor_row_batches(cursor: Any, batch_size: int) -> Iterator[Sequence[Any]]:
+    """
+    Fetch rows from an executed cursor in batches.
+
+    :param cursor: A DB-API cursor with an executed query.
+    :param batch_size: Number of rows to fetch per batch.
+    :return: An iterator of non-empty row batches.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_cursor_row_batches_in_background(
+    cursor: Any, batch_size: int, max_queued_batches: int = 2
+) -> Iterator[Sequence[Any]]:
+    """
+    Fetch rows from an executed cursor in batches on a background thread, so receiving the next batches
+    overlaps with processing the current one.
+
+    At most `max_queued_batches` fetched batches wait in a bounded queue; the fetching thread blocks while
+    the queue is full, so memory stays flat whatever the size of the result.
+    The cursor is only used by the fetching thread until the iterator is exhausted or closed.
+
+    :param cursor: A DB-API cursor with an executed query.
+    :param batch_size: Number of rows to fetch per batch.
+    :param max_queued_batches: Maximum number of fetched batches waiting to be processed.
+    :return: An iterator of non-empty row batches.
+    """
+    batches = queue.Queue(maxsize=max_queued_batches)
+    stopped = threading.Event()
+
+    def put(item: Any) -> None:
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch_batches() -> None:
+        try:
+            for rows in iter_cursor_row_batches(cursor, batch_size):
+                if stopped.is_set():
+                    return
+                put(rows)
+            put(None)
+        except BaseException as e:
+            put(e)
+
+    fetcher = threading.Thread(target=fetch_batches, daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        fetcher.join()
+
+
+def iter_cursor_column_batches(
+    cursor: Any,
+    batch_size: int,
+    column_kinds: Dict[Any, str],
+    max_queued_batches: int = 0,
+) -> Iterator[List[np.ndarray]]:
+    """
+    Fetch rows from an executed cursor in batches and yield them as typed column arrays.
+
+    :param cursor: A DB-API cursor with an executed query.
+    :param batch_size: Number of rows to fetch per batch.
+    :param column_kinds: Mapping of driver type codes to column kinds.
+    :param max_queued_batches: When above 0, batches are fetched on a background thread with at most this many
+                               batches waiting (see iter_cursor_row_batches_in_background).
+    :return: An iterator of lists holding one array per column.
+    """
+    kinds = get_column_kinds(cursor.description, column_kinds)
+
+    if max_queued_batches > 0:
+        row_batches = iter_cursor_row_batches_in_background(
+            cursor, batch_size, max_queued_batches
+        )
+    else:
+        row_batches = iter_cursor_row_batches(cursor, batch_size)
+
+    for rows in row_batches:
+        yield [
+            convert_column_values(values, kind)
+            for values, kind in zip(zip(*rows), kinds)
+        ]
+
+
+def columns_to_dataframe(
+    column_names: List[str], columns: List[np.ndarray]
+) -> pd.DataFrame:
+    """
+    Build a DataFrame from column arrays, keeping duplicate column names.
+
+    :param column_names: The column names.
+    :param columns: One array per column.
+    :return: A DataFrame holding the columns.
+    """
+    df = pd.DataFrame(dict(enumerate(columns)))
+    df.columns = column_names
+    return df
+
+
+def fetch_cursor_dataframe(
+    cursor: Any,
+    batch_size: int,
+    column_kinds: Dict[Any, str],
+    max_queued_batches: int = 0,
+    time_budget: Optional[TimeBudget] = None,
+) -> pd.DataFrame:
+    """
+    Fetch all rows of an executed cursor in batches into a single DataFrame.
+
+    Batches are accumulated as typed column buffers and the DataFrame is built once at the end.
+    When `time_budget` runs out, fetching stops after the current batch (or when the cancelled query fails)
+    and the rows fetched so far are returned, tagged as partial in the DataFrame attrs.
+
+    :param cursor: A DB-API cursor with an executed query.
+    :param batch_size: Number of rows to fetch per batch.
+    :param column_kinds: Mapping of driver type codes to column kinds.
+    :param max_queued_batches: When above 0, batches are fetched on a background thread with at most this many
+                               batches waiting (see iter_cursor_row_batches_in_background).
+    :param time_budget: An optional budget of the query.
+    :return: A DataFrame with the fetched rows (empty, with the cursor's columns, if there are none).
+    """
+    column_names = [desc[0] for desc in cursor.description]
+    column_buffers = [[] for _ in column_names]
+
+    is_partial = False
+    try:
+        for batch_columns in iter_cursor_column_batches(
+            cursor, batch_size, column_kinds, max_queued_batches
+        ):
+            for column_buffer, column in zip(column_buffers, batch_columns):
+                column_buffer.append(column)
+            if time_budget is not None and time_budget.is_exhausted():
+                is_partial = True
+                break
+    except Exception:
+        # A query cancelled because the budget ran out fails with a driver error
+        if time_budget is None or not time_budget.is_exhausted():
+            raise
+        is_partial = True
+
+    if not column_buffers or not column_buffers[0]:
+        df = pd.DataFrame(columns=column_names)
+    else:
+        df = columns_to_dataframe(
+            column_names,
+            [np.concatenate(column_buffer) for column_buffer in column_buffers],
+        )
+    if is_partial:
+        df.attrs[PARTIAL_RESULT_ATTR] = True
+    return df
+
+
+def fetch_query_dataframe(
+    cursor: Any,
+    query_args: Sequence[Any],
+    batch_size: int,
+    column_kinds: Dict[Any, str],
+    max_queued_batches: int = 0,
+    time_budget: Optional[TimeBudget] = None,
+) -> pd.DataFrame:
+    """
+    Execute a query on a cursor and fetch all its rows into a single DataFrame (see fetch_cursor_dataframe).
+
+    :param cursor: A DB-API cursor.
+    :param query_args: The arguments of cursor.execute (the query and optional parameters).
+    :param batch_size: Number of rows to fetch per batch.
+    :param column_kinds: Mapping of driver type codes to column kinds.
+    :param max_queued_batches: When above 0, batches are fetched on a background thread.
+    :param time_budget: An optional budget of the query.
+    :return: A DataFrame with the fetched rows, tagged as partial when the budget ran out.
+    """
+    try:
+        cursor.execute(*query_args)
+    except Exception:
+        if time_budget is None or not time_budget.is_exhausted():
+            raise
+        df = pd.DataFrame()
+        df.attrs[PARTIAL_RESULT_ATTR] = True
+        return df
+    return fetch_cursor_dataframe(
+        cursor, batch_size, column_kinds, max_queued_batches, time_budget
+    )
+
+
+def apply_column_schema(df: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    """
+    Cast the columns of a DataFrame to the dtypes of a schema.
+
+    Columns of the schema missing from the DataFrame (e.g. dropped as all-NA) are ignored.
+
+    :param df: The DataFrame to cast.
+    :param schema: Mapping of column names to dtypes (e.g. {"product_name": "category"}).
+    :return: The DataFrame with the schema dtypes applied.
+    """
+    return df.astype({name: dtype for name, dtype in schema.items() if name in df})
+
+
+def downcast_columns(df: pd.DataFrame, category_threshold: float = 0.5) -> pd.DataFrame:
+    """
+    Downcast the columns of a DataFrame to compact dtypes.
+
+    int64 columns whose values fit are cast to int32, and object columns holding strings
+    with a ratio of unique values up to `category_threshold` (e.g. product_name) become categoricals.
+
+    :param df: The DataFrame to downcast.
+    :param category_threshold: Maximum ratio of unique values for an object column to become a categorical.
+    :return: The downcast DataFrame.
+    """
+    int32_info = np.iinfo(np.int32)
+    dtypes = {}
+    for name, column in df.items():
+        if column.dtype == np.int64:
+            if column.empty or (
+                int32_info.min <= column.min() and column.max() <= int32_info.max
+            ):
+                dtypes[name] = np.int32
+        elif column.dtype == object:
+            values = column.dropna()
+            if (
+                not values.empty
+                and pd.api.types.infer_dtype(values, skipna=True) == "string"
+                and values.nunique() <= category_threshold * len(column)
+            ):
+                dtypes[name] = "category"
+    return df.astype(dtypes)
+
+
+def finalize_fetched_dataframe(
+    df: pd.DataFrame, schema: Optional[Dict[str, str]] = None, downcast: bool = False
+) -> pd.DataFrame:
+    """
+    Drop the all-NA columns of fetched data once, then apply an optional schema and downcasting.
+
+    :param df: The fetched DataFrame.
+    :param schema: Optional mapping of column names to dtypes.
+    :param downcast: Whether to downcast the columns to compact dtypes.
+    :return: The finalized DataFrame (empty frames are returned unchanged).
+    """
+    if df.empty:
+        return df
+
+    df = exclude_all_na_columns(df)
+    if schema:
+        df = apply_column_schema(df, schema)
+    if downcast:
+        df = downcast_columns(df)
+    return df
+
+
+@profiled()
 def fetch_data_in_batches(
     query: str,
     db_user: str,
@@ -109,10 +522,29 @@ def fetch_data_in_batches(
     db_name: str,
     db_port: int = 3306,
     batch_size: int = 10000,
+    schema: Optional[Dict[str, str]] = None,
+    downcast: bool = False,
+    connection_pool: Optional[ConnectionPool] = None,
+    query_params: Optional[Sequence[Any]] = None,
+    stream: bool = False,
+    max_queued_batches: int = 2,
+    query_timeout: Optional[float] = None,
+    time_budget: Optional[TimeBudget] = None,
+    raise_errors: bool = False,
 ) -> pd.DataFrame:
     """
     Fetch data from the database in batches.
 
+    Each batch is converted into typed column buffers, and the DataFrame is built once
+    after the last batch, so fetching does not copy the rows fetched so far.
+
+    By default pymysql buffers the whole result client-side before the first batch is returned.
+    With `stream`, rows are read through an unbuffered server-side cursor (SSCursor) on a background thread,
+    so receiving rows overlaps with converting them and at most `max_queued_batches` raw batches are held at a time.
+
+    When the query runs out of time (`query_timeout` or `time_budget`), it is cancelled and the rows fetched so far
+    are returned, tagged as partial in the DataFrame attrs (df.attrs["partial"]).
+
     :param query: SQL query to execute
     :param db_user: Database user
     :param db_password: Database password
@@ -120,10 +552,104 @@ def fetch_data_in_batches(
     :param db_port: Database port
     :param db_name: Database name
     :param batch_size: Number of rows to fetch per batch
+    :param schema: Optional mapping of column names to dtypes applied to the fetched data
+    :param downcast: Whether to downcast the fetched data to compact dtypes (see downcast_columns)
+    :param connection_pool: Optional pool to borrow the connection from, e.g. to share connections between queries
+    :param query_params: Optional parameters for the %s placeholders of the query
+    :param stream: Whether to stream the result through an unbuffered server-side cursor
+    :param max_queued_batches: Maximum number of received batches waiting to be converted when streaming
+    :param query_timeout: Optional maximum number of seconds for the query
+    :param time_budget: Optional budget of the whole extraction (see TimeBudget), shared with other fetches
+    :param raise_errors: Whether to raise errors instead of printing them and returning an empty DataFrame,
+                         for callers that cannot tell an empty result from a failed query
     :return: DataFrame with the fetched data
     """
+    connection_factory = partial(
+        pymysql.connect,
+        user=db_user,
+        password=db_password,
+        host=db_host,
+        port=db_port,
+        database=db_name,
+    )
+    query_budget = get_query_budget(time_budget, query_timeout)
+    try:
+        # Using a context manager to connect to the database (or borrow a pooled connection)
+        with open_connection(connection_pool, connection_factory) as conn:
+            cursor = conn.cursor(pymysql.cursors.SSCursor) if stream else conn.cursor()
+            if isinstance(conn, pymysql.connections.Connection):
+                cancel_query = partial(
+                    cancel_mysql_query,
+                    (
+                        connection_pool.connection_factory
+                        if connection_pool is not None
+                        else connection_factory
+                    ),
+                    conn.thread_id(),
+                )
+            else:
+                cancel_query = partial(cancel_connection_query, conn)
+
+            with cancel_on_exhaustion(query_budget, cancel_query):
+                df = fetch_query_dataframe(
+                    cursor,
+                    (query,) if query_params is None else (query, query_params),
+                    batch_size,
+                    MYSQL_COLUMN_KINDS,
+                    max_queued_batches if stream else 0,
+                    query_budget,
+                )
+            if df.attrs.get(PARTIAL_RESULT_ATTR):
+                print(f"Query ran out of time: returning {len(df)} rows fetched")
+                if connection_pool is not None:
+                    connection_pool.invalidate(conn)
+            else:
+                cursor.close()
+
+            return finalize_fetched_dataframe(df, schema, downcast)
+    except pymysql.MySQLError as e:
+        if raise_errors:
+            raise
+        print(f"Database error occurred: {e}")
+        return pd.DataFrame()
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"An unexpected error occurred: {e}")
+        return pd.DataFrame()
+
+
+def iter_data_in_batches(
+    query: str,
+    db_user: str,
+    db_password: str,
+    db_host: str,
+    db_name: str,
+    db_port: int = 3306,
+    batch_size: int = 10000,
+    stream: bool = False,
+    max_queued_batches: int = 2,
+) -> Iterator[pd.DataFrame]:
+    """
+    Fetch data from the database and yield it batch by batch, so downstream steps can stream.
+
+    Every batch has the same columns and the dtypes derived from the cursor description.
+    The connection stays open until the generator is exhausted or closed.
+    With `stream`, the result is read through an unbuffered server-side cursor on a background thread
+    (see fetch_data_in_batches), so memory stays flat whatever the size of the result.
+
+    :param query: SQL query to execute
+    :param db_user: Database user
+    :param db_password: Database password
+    :param db_host: Database host
+    :param db_port: Database port
+    :param db_name: Database name
+    :param batch_size: Number of rows to fetch per batch
+    :param stream: Whether to stream the result through an unbuffered server-side cursor
+    :param max_queued_batches: Maximum number of received batches waiting to be converted when streaming
+    :return: An iterator of DataFrames with at most batch_size rows each
+    """
     try:
-        # Using a context manager to connect to the database
         with pymysql.connect(
             user=db_user,
             password=db_password,
@@ -131,32 +657,27 @@ def fetch_data_in_batches(
             port=db_port,
             database=db_name,
         ) as conn:
-            cursor = conn.cursor()
+            cursor = conn.cursor(pymysql.cursors.SSCursor) if stream else conn.cursor()
             cursor.execute(query)
 
-            # Initialize an empty DataFrame to accumulate the results
-            df = pd.DataFrame()
             column_names = [desc[0] for desc in cursor.description]
 
-            while True:
-                rows = cursor.fetchmany(batch_size)
-                if not rows:
-                    break
-
-                batch_df = pd.DataFrame(rows, columns=column_names)
-                batch_df = exclude_all_na_columns(batch_df)
-                df = pd.concat([df, batch_df], ignore_index=True)
+            for batch_columns in iter_cursor_column_batches(
+                cursor,
+                batch_size,
+                MYSQL_COLUMN_KINDS,
+                max_queued_batches if stream else 0,
+            ):
+                yield columns_to_dataframe(column_names, batch_columns)
 
             cursor.close()
-            return df if not df.empty else pd.DataFrame(columns=column_names)
     except pymysql.MySQLError as e:
         print(f"Database error occurred: {e}")
-        return pd.DataFrame()
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        return pd.DataFrame()
 
 
+@lru_cache(maxsize=None)
 def end_of_month(year: int, month: int) -> int:
     """
     Return the last day of a given month in a given year.
@@ -225,6 +746,7 @@ def get_products_list(products: List[str], keyword: str) -> List[str]:
     ]
 
 
+@lru_cache(maxsize=None)
 def get_date_range_for_month(year: int, month: int) -> Tuple[datetime, datetime]:
     """
     Returns the start and end date for a given month and year.
@@ -238,13 +760,76 @@ def get_date_range_for_month(year: int, month: int) -> Tuple[datetime, datetime]
     return start_date, end_date
 
 
+class DateIndexedFrame:
+    """
+    A DataFrame sorted once by a date column, answering date range queries with binary searches.
+
+    Each range query is two searchsorted calls on the sorted dates and returns a positional slice
+    of the sorted frame (a view, not a copy), instead of scanning the whole column with boolean masks.
+    Rows come out ordered by date (rows with the same date keep their original order) with their
+    original index labels; rows with a missing date are never returned.
+    """
+
+    def __init__(self, df: pd.DataFrame, date_column: str = "date_field"):
+        """
+        :param df: The DataFrame to index.
+        :param date_column: The datetime column to index on (default is date_field).
+        """
+        self.date_column = date_column
+        self.df = df.sort_values(date_column, kind="stable", na_position="last")
+        dates = pd.to_datetime(self.df[date_column]).to_numpy(dtype="datetime64[ns]")
+        # Missing dates are sorted last, after every date a query can select
+        self.dates = dates[: len(dates) - int(np.isnat(dates).sum())]
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def get_row_bounds(
+        self, start_dates: Any, end_dates: Any
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Locate the sorted rows of one or several date ranges, start_date <= date <= end_date.
+
+        :param start_dates: The start date of every range (a date or an array of dates).
+        :param end_dates: The end date of every range (a date or an array of dates).
+        :return: The start and stop positions of every range in the sorted frame.
+        """
+        start_dates = pd.to_datetime(start_dates)
+        end_dates = pd.to_datetime(end_dates)
+        starts = np.searchsorted(
+            self.dates, np.asarray(start_dates, dtype="datetime64[ns]"), side="left"
+        )
+        stops = np.searchsorted(
+            self.dates, np.asarray(end_dates, dtype="datetime64[ns]"), side="right"
+        )
+        return starts, np.maximum(starts, stops)
+
+    def get_range(
+        self, start_date: Union[str, datetime], end_date: Union[str, datetime]
+    ) -> pd.DataFrame:
+        """
+        Return the rows within a date range, start_date <= date <= end_date.
+
+        :param start_date: The start date of the date range.
+        :param end_date: The end date of the date range.
+        :return: A slice of the sorted frame.
+        """
+        start, stop = self.get_row_bounds(start_date, end_date)
+        return self.df.iloc[int(start) : int(stop)]
+
+
 def filter_data_for_date_range(
-    df: pd.DataFrame, start_date: Union[str, datetime], end_date: Union[str, datetime]
+    df: Union[pd.DataFrame, DateIndexedFrame],
+    start_date: Union[str, datetime],
+    end_date: Union[str, datetime],
 ) -> pd.DataFrame:
     """
     Filters the DataFrame for entries within the specified date range.
 
-    :param df: The input DataFrame containing a 'date_field' column.
+    A DateIndexedFrame is filtered with binary searches on its sorted dates, which pays off when
+    the same data is filtered for many ranges (e.g. month by month). Its rows come out ordered by date.
+
+    :param df: The input DataFrame containing a 'date_field' column, or a DateIndexedFrame.
     :param start_date: The start date of the date range (string or datetime).
     :param end_date: The end date of the date range (string or datetime).
     :return: A DataFrame filtered for the specified date range.
@@ -262,4 +847,179 @@ def filter_data_for_date_range(
         except ValueError:
             raise ValueError("The provided end_date is not a valid date string")
 
+    if isinstance(df, DateIndexedFrame):
+        return df.get_range(start_date, end_date)
+
     return df[(df["date_field"] >= start_date) & (df["date_field"] <= end_date)]
+
+
+def get_month_index(dates: pd.Series) -> pd.Series:
+    """
+    Convert dates to month indices (year * 12 + month - 1), so consecutive months differ by one.
+
+    :param dates: A Series of datetime values, or of int32 day numbers (see encode_sales_data).
+    :return: A Series of month indices (NaN where the date is missing).
+    """
+    if pd.api.types.is_integer_dtype(dates.dtype):
+        dates = get_dates_for_day_numbers(dates)
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def get_dates_for_day_numbers(day_numbers: pd.Series) -> pd.Series:
+    """
+    Convert int32 day numbers (days since 1970-01-01) into datetime values.
+
+    :param day_numbers: A Series of day numbers, MISSING_DAY_NUMBER where the date is missing.
+    :return: A Series of datetime64[ns] values (NaT where the date is missing).
+    """
+    days = day_numbers.to_numpy(dtype=np.int64)
+    dates = days.astype("datetime64[D]").astype("datetime64[ns]")
+    dates[days == MISSING_DAY_NUMBER] = np.datetime64("NaT")
+    return pd.Series(dates, index=day_numbers.index, name=day_numbers.name)
+
+
+def get_key_codes(keys: pd.Series, missing_as_key: bool = False) -> np.ndarray:
+    """
+    Return dense integer codes of a key column, reusing the codes of a categorical column.
+
+    :param keys: A key column (e.g. customer_tk), plain or categorical.
+    :param missing_as_key: Whether missing keys share a code of their own, i.e. are compared equal to each other,
+                           instead of being coded -1.
+    :return: An int64 array of codes.
+    """
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        codes = keys.cat.codes.to_numpy(dtype=np.int64)
+        if missing_as_key:
+            codes = np.where(codes < 0, len(keys.cat.categories), codes)
+        return codes
+    codes, _ = pd.factorize(keys, use_na_sentinel=not missing_as_key)
+    return codes.astype(np.int64)
+
+
+def get_time_values(dates: pd.Series) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Return dates as integers that can be compared and subtracted, whether they are datetimes or int32 day numbers.
+
+    :param dates: A Series of datetime values, or of day numbers.
+    :return: The int64 time values, a mask of the dates that are present, and the number of time units per day.
+    """
+    if pd.api.types.is_integer_dtype(dates.dtype):
+        times = dates.to_numpy(dtype=np.int64)
+        return times, times != MISSING_DAY_NUMBER, 1
+
+    times = pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")
+    return times.view(np.int64), ~np.isnat(times), NANOSECONDS_PER_DAY
+
+
+def get_month_index_for_date(date: datetime) -> int:
+    """
+    Return the month index (year * 12 + month - 1) of a single date.
+
+    :param date: The date to convert.
+    :return: The month index of the date.
+    """
+    return date.year * 12 + date.month - 1
+
+
+def get_date_for_month_index(month_index: int) -> datetime:
+    """
+    Return the first day of the month represented by a month index.
+
+    :param month_index: A month index as returned by get_month_index_for_date.
+    :return: A datetime for the first day of that month.
+    """
+    year, month = divmod(int(month_index), 12)
+    return datetime(year, month + 1, 1)
+
+
+class MonthWindows(NamedTuple):
+    """
+    Calendar bounds of a span of consecutive months, as read-only datetime64[ns] arrays aligned with `months`.
+
+    - months: the month indices of the span.
+    - starts: the first day of every month.
+    - ends: the last day of every month.
+    - lookback_starts: the first day of the month `lookback_months` months before every month.
+    - lookahead_ends: the last day of the month `lookahead_months` months after every month.
+    """
+
+    months: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    lookback_starts: np.ndarray
+    lookahead_ends: np.ndarray
+
+
+def get_month_starts(month_indices: np.ndarray) -> np.ndarray:
+    """
+    Return the first day of the months represented by an array of month indices.
+
+    :param month_indices: An array of month indices.
+    :return: A datetime64[ns] array of the first day of every month.
+    """
+    months = np.asarray(month_indices, dtype=np.int64) - 1970 * 12
+    return months.astype("datetime64[M]").astype("datetime64[ns]")
+
+
+@lru_cache(maxsize=128)
+def get_month_windows(
+    first_month: int,
+    last_month: int,
+    lookback_months: int = 0,
+    lookahead_months: int = 0,
+) -> MonthWindows:
+    """
+    Precompute the calendar bounds of every month from `first_month` to `last_month` (inclusive).
+
+    The table is cached per parameter set, so windowed functions called month after month share it.
+
+    :param first_month: The month index of the first month.
+    :param last_month: The month index of the last month.
+    :param lookback_months: Number of months before every month covered by its lookback bound (default is 0).
+    :param lookahead_months: Number of months after every month covered by its lookahead bound (default is 0).
+    :return: The month windows of the span.
+    """
+    months = np.arange(first_month, last_month + 1, dtype=np.int64)
+    one_day = np.timedelta64(1, "D")
+    windows = MonthWindows(
+        months=months,
+        starts=get_month_starts(months),
+        ends=get_month_starts(months + 1) - one_day,
+        lookback_starts=get_month_starts(months - lookback_months),
+        lookahead_ends=get_month_starts(months + lookahead_months + 1) - one_day,
+    )
+    # The arrays are shared between callers of the cached table
+    for array in windows:
+        array.flags.writeable = False
+    return windows
+
+
+# The Xero journals fetching moved to vetbiz_extractor.utils.journals
+JOURNALS_NAMES = {
+    "JOURNAL_TABLES_PATTERN",
+    "TABLE_CATALOG_QUERIES",
+    "LIMITED_SELECT_TEMPLATES",
+    "get_etani_connection_factory",
+    "discover_tables",
+    "get_table_batches",
+    "get_journal_tables_query",
+    "fetch_xero_journals_data_from_etani",
+    "fetch_batched_xero_journals_data",
+}
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Resolve the names moved to vetbiz_extractor.utils.journals, so existing imports from this module keep working.
+
+    The journals module imports this module, so its names are only imported when they are first accessed.
+
+    :param name: The name of the attribute.
+    :return: The attribute of the journals module.
+    :raises AttributeError: If the name is neither defined here nor in the journals module
+    """
+    if name in JOURNALS_NAMES:
+        from vetbiz_extractor.utils import journals
+
+        return getattr(journals, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,118 @@
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+
+class ConnectionPool:
+    """
+    A bounded pool of DB-API connections shared by worker threads.
+
+    Connections are opened lazily through `connection_factory`, at most `max_size` are in use
+    at the same time, and released connections are reused by the next caller.
+    A connection whose caller raised an exception, or that was invalidated (e.g. after its query was cancelled),
+    is closed instead of being reused.
+    """
+
+    def __init__(self, connection_factory: Callable[[], Any], max_size: int = 4):
+        """
+        :param connection_factory: A callable returning a new DB-API connection.
+        :param max_size: Maximum number of connections in use at the same time.
+        :raises ValueError: If max_size is lower than 1
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1.")
+
+        self.connection_factory = connection_factory
+        self.max_size = max_size
+        self._idle_connections = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._connections: List[Any] = []
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Borrow a connection from the pool, waiting while all `max_size` connections are in use.
+
+        :return: A context manager yielding a DB-API connection.
+        """
+        with self._slots:
+            try:
+                conn = self._idle_connections.get_nowait()
+            except queue.Empty:
+                conn = self.connection_factory()
+                with self._lock:
+                    self._connections.append(conn)
+
+            try:
+                yield conn
+            except BaseException:
+                self._discard(conn)
+                raise
+            else:
+                with self._lock:
+                    reusable = conn in self._connections
+                if reusable:
+                    self._idle_connections.put(conn)
+
+    def invalidate(self, conn: Any) -> None:
+        """
+        Close a borrowed connection that must not be reused, e.g. after its query was cancelled.
+
+        :param conn: A connection borrowed from the pool.
+        """
+        self._discard(conn)
+
+    def _discard(self, conn: Any) -> None:
+        """Close a connection and forget it."""
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        close_quietly(conn)
+
+    def close(self) -> None:
+        """Close every connection opened by the pool."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        while not self._idle_connections.empty():
+            self._idle_connections.get_nowait()
+        for conn in connections:
+            close_quietly(conn)
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def close_quietly(conn: Any) -> None:
+    """Close a connection, ignoring errors from connections that are already broken."""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+@contextmanager
+def open_connection(
+    connection_pool: Optional[ConnectionPool], connection_factory: Callable[[], Any]
+) -> Iterator[Any]:
+    """
+    Borrow a connection from a pool when one is given, otherwise open a new connection and close it afterwards.
+
+    :param connection_pool: An optional pool to borrow the connection from.
+    :param connection_factory: A callable returning a new DB-API connection, used without a pool.
+    :return: A context manager yielding a DB-API connection.
+    """
+    if connection_pool is not None:
+        with connection_pool.connection() as conn:
+            yield conn
+        return
+
+    conn = connection_factory()
+    try:
+        yield conn
+    finally:
+        close_quietly(conn)
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+from vetbiz_extractor.utils.common import (
+    MISSING_DAY_NUMBER,
+    get_dates_for_day_numbers,
+)
+
+# Key and label columns of the sales frames encoded as dense integer codes (categoricals)
+DEFAULT_CATEGORY_COLUMNS = (
+    "clinic_tk",
+    "customer_tk",
+    "practice_tk",
+    "product_tk",
+    "product_name",
+    "practice_name",
+    "clinic_name",
+)
+# Date columns of the sales frames encoded as int32 day numbers
+DEFAULT_DATE_COLUMNS = ("invoice_date", "date_field")
+
+
+class SalesEncoding(NamedTuple):
+    """
+    Records how a frame was encoded, so analysis outputs can be decoded back to the original dtypes.
+
+    - category_dtypes: the original dtype of every column encoded as a categorical.
+    - date_columns: the columns encoded as int32 day numbers.
+    """
+
+    category_dtypes: Dict[str, np.dtype]
+    date_columns: List[str]
+
+
+def get_day_numbers(dates: pd.Series) -> pd.Series:
+    """
+    Convert datetime values into int32 day numbers (days since 1970-01-01), dropping the time of day.
+
+    :param dates: A Series of datetime values.
+    :return: A Series of int32 day numbers, MISSING_DAY_NUMBER where the date is missing.
+    """
+    days = pd.to_datetime(dates).to_numpy(dtype="datetime64[D]")
+    day_numbers = days.astype(np.int64)
+    day_numbers[np.isnat(days)] = MISSING_DAY_NUMBER
+    return pd.Series(day_numbers.astype(np.int32), index=dates.index, name=dates.name)
+
+
+def encode_sales_data(
+    df: pd.DataFrame,
+    category_columns: Sequence[str] = DEFAULT_CATEGORY_COLUMNS,
+    date_columns: Sequence[str] = DEFAULT_DATE_COLUMNS,
+) -> Tuple[pd.DataFrame, SalesEncoding]:
+    """
+    Encode a sales frame into compact columns before analysis.
+
+    Keys and labels (e.g. customer_tk, clinic_tk, product_name) become categoricals: dense integer codes
+    with their dictionary of values, so grouping, joining and set operations work on small integers.
+    Dates become int32 day numbers. The insights functions accept encoded frames and return encoded rows,
+    which decode_sales_data converts back.
+
+    Dates are encoded at day precision; the time of day (if any) is dropped.
+
+    :param df: The sales frame (or customers-from-sales frame).
+    :param category_columns: Columns to encode as categoricals (missing columns are ignored).
+    :param date_columns: Columns to encode as int32 day numbers (missing columns are ignored).
+    :return: The encoded frame and the encoding needed to decode it.
+    """
+    category_columns = [column for column in category_columns if column in df]
+    date_columns = [column for column in date_columns if column in df]
+
+    encoded = df.copy(deep=False)
+    category_dtypes = {}
+    for column in category_columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        category_dtypes[column] = df[column].dtype
+        encoded[column] = df[column].astype("category")
+    for column in date_columns:
+        encoded[column] = get_day_numbers(df[column])
+
+    return encoded, SalesEncoding(category_dtypes, date_columns)
+
+
+def decode_sales_data(df: pd.DataFrame, encoding: SalesEncoding) -> pd.DataFrame:
+    """
+    Decode the columns of an encoded frame (e.g. an analysis output) back to their original dtypes.
+
+    Missing values of object columns are decoded as None, as fetched from the database.
+
+    :param df: A frame with columns encoded by encode_sales_data.
+    :param encoding: The encoding returned by encode_sales_data.
+    :return: The frame with categoricals and day numbers converted back.
+    """
+    decoded = df.copy(deep=False)
+    for column, dtype in encoding.category_dtypes.items():
+        if column not in df:
+            continue
+        decoded[column] = df[column].astype(dtype)
+        if dtype == object:
+            decoded[column] = decoded[column].where(decoded[column].notna(), None)
+    for column in encoding.date_columns:
+        if column in df:
+            decoded[column] = get_dates_for_day_numbers(df[column])
+    return decoded
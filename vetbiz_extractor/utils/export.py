@@ -0,0 +1,281 @@
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from vetbiz_extractor.utils.common import get_month_index
+from vetbiz_extractor.utils.profiling import span
+
+# File in the export directory holding the name of the latest complete version
+CURRENT_VERSION_FILE = "CURRENT"
+# Date column each insight output is partitioned on (outputs not listed are written as a single file)
+DEFAULT_EXPORT_PARTITIONS = {
+    "df_filtered_active_customers": "date_field",
+    "follow_up_df": "invoice_date",
+    "consults_to_dental_df": "invoice_date",
+    "lapsed_clients_df": "invoice_date",
+}
+# Minimum number of rows of an exported file of consecutive months
+DEFAULT_MIN_ROWS_PER_FILE = 100000
+# File of the exported rows without a date
+UNDATED_FILE = "undated.parquet"
+
+
+def to_export_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert a DataFrame into an Arrow table with its string columns dictionary-encoded.
+
+    :param df: The DataFrame to export.
+    :return: The Arrow table.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for position, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            table = table.set_column(
+                position, field.name, table.column(position).dictionary_encode()
+            )
+    return table
+
+
+def get_export_file_name(first_month: int, last_month: int) -> str:
+    """
+    Return the file name of a group of consecutive month partitions, e.g. 2023-01_2023-04.parquet.
+
+    :param first_month: The month index of the first month in the file.
+    :param last_month: The month index of the last month in the file.
+    :return: The file name.
+    """
+    first_year, first_month = divmod(int(first_month), 12)
+    last_year, last_month = divmod(int(last_month), 12)
+    return f"{first_year:04d}-{first_month + 1:02d}_{last_year:04d}-{last_month + 1:02d}.parquet"
+
+
+def get_export_parts(
+    df: pd.DataFrame,
+    table: pa.Table,
+    partition_column: Optional[str],
+    min_rows_per_file: int = DEFAULT_MIN_ROWS_PER_FILE,
+) -> List[Tuple[str, pa.Table]]:
+    """
+    Split an export table into files of consecutive months of a date column.
+
+    Consecutive months are grouped into one file until it holds at least `min_rows_per_file` rows, so small
+    outputs are not spread over a file per month. Rows without a date are written to undated.parquet.
+    The files are zero-copy slices of the table sorted by month, so they share one schema
+    (and the same string dictionaries).
+
+    :param df: The exported DataFrame.
+    :param table: The Arrow table of `df`.
+    :param partition_column: The date column to partition on, or None for a single file.
+    :param min_rows_per_file: Minimum number of rows of a file of months (the last file may hold fewer).
+    :return: (relative path, table) of every file to write.
+    """
+    if partition_column is None or df.empty:
+        return [("part-00000.parquet", table)]
+
+    months = get_month_index(df[partition_column]).fillna(-1).to_numpy(dtype=np.int64)
+    order = np.argsort(months, kind="stable")
+    table = table.take(pa.array(order))
+    sorted_months = months[order]
+
+    parts = []
+    undated_rows = int(np.searchsorted(sorted_months, 0))
+    if undated_rows:
+        parts.append((UNDATED_FILE, table.slice(0, undated_rows)))
+
+    boundaries = np.flatnonzero(np.diff(sorted_months[undated_rows:])) + 1
+    month_stops = np.append(boundaries + undated_rows, len(sorted_months))
+    start = undated_rows
+    for position, stop in enumerate(month_stops):
+        if stop - start < min_rows_per_file and position < len(month_stops) - 1:
+            continue
+        file_name = get_export_file_name(sorted_months[start], sorted_months[stop - 1])
+        parts.append((file_name, table.slice(start, stop - start)))
+        start = stop
+    return parts
+
+
+def get_current_export_version(export_dir: str) -> Optional[str]:
+    """
+    Return the name of the latest complete export version.
+
+    :param export_dir: The export directory.
+    :return: The version name, or None if nothing was exported yet.
+    """
+    current_path = os.path.join(export_dir, CURRENT_VERSION_FILE)
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path) as f:
+        return f.read().strip()
+
+
+def remove_old_export_versions(export_dir: str, keep_versions: int) -> None:
+    """
+    Remove all but the `keep_versions` latest export versions, and the leftovers of exports interrupted
+    before the current version.
+
+    :param export_dir: The export directory.
+    :param keep_versions: Number of complete versions to keep.
+    """
+    current_version = get_current_export_version(export_dir)
+    versions = sorted(
+        name
+        for name in os.listdir(export_dir)
+        if os.path.isdir(os.path.join(export_dir, name))
+    )
+    complete_versions = [name for name in versions if not name.endswith(".tmp")]
+    kept_versions = set(complete_versions[-keep_versions:]) | {current_version}
+    for name in versions:
+        # Temporary directories of later versions belong to exports still running
+        if name.endswith(".tmp") and name >= current_version:
+            continue
+        if name not in kept_versions:
+            shutil.rmtree(os.path.join(export_dir, name), ignore_errors=True)
+
+
+def export_insights(
+    frames: Dict[str, pd.DataFrame],
+    export_dir: str,
+    partition_columns: Optional[Dict[str, str]] = None,
+    compression: str = "zstd",
+    max_workers: int = 4,
+    keep_versions: int = 3,
+    min_rows_per_file: int = DEFAULT_MIN_ROWS_PER_FILE,
+) -> Dict[str, Any]:
+    """
+    Export insight outputs to compressed Parquet in a new version of an export directory.
+
+    Each output becomes a directory named after its key. An output with a configured date column is split into
+    files of consecutive months holding at least `min_rows_per_file` rows, named after their first and last month
+    (e.g. 2023-01_2023-04.parquet), and undated.parquet for rows without a date; other outputs are written to
+    part-00000.parquet. String columns are dictionary-encoded.
+    All files are written in parallel into a temporary version directory, which is renamed into place once complete;
+    the CURRENT file then points readers to it, so a reader never sees a partial export.
+
+    :param frames: The outputs to export, by name (e.g. {"lapsed_clients_df": lapsed_clients_df}).
+    :param export_dir: The export directory.
+    :param partition_columns: Date column to partition each output on (default is DEFAULT_EXPORT_PARTITIONS).
+    :param compression: Parquet compression codec (default is zstd).
+    :param max_workers: Maximum number of files written concurrently.
+    :param keep_versions: Number of complete versions to keep in the export directory (default is 3).
+    :param min_rows_per_file: Minimum number of rows of a file of months (default is DEFAULT_MIN_ROWS_PER_FILE).
+    :return: The export report: the version, and the rows, files, bytes and write seconds of every output,
+             with the total bytes, wall-clock seconds and throughput.
+    """
+    if partition_columns is None:
+        partition_columns = DEFAULT_EXPORT_PARTITIONS
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    temp_dir = os.path.join(export_dir, f"{version}.tmp")
+
+    start_time = time.perf_counter()
+    with span("export_tables", outputs=len(frames)):
+        files = []
+        for name, df in frames.items():
+            table = to_export_table(df)
+            for relative_path, part in get_export_parts(
+                df, table, partition_columns.get(name), min_rows_per_file
+            ):
+                files.append((name, os.path.join(temp_dir, name, relative_path), part))
+
+    def write_file(path: str, part: pa.Table) -> Tuple[int, float]:
+        file_start_time = time.perf_counter()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(part, path, compression=compression, use_dictionary=True)
+        return os.path.getsize(path), time.perf_counter() - file_start_time
+
+    with span("export_files", files=len(files)):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            written = list(
+                executor.map(lambda file: write_file(file[1], file[2]), files)
+            )
+
+    os.replace(temp_dir, os.path.join(export_dir, version))
+    current_temp_path = os.path.join(export_dir, f"{CURRENT_VERSION_FILE}.tmp")
+    with open(current_temp_path, "w") as f:
+        f.write(version)
+    os.replace(current_temp_path, os.path.join(export_dir, CURRENT_VERSION_FILE))
+    seconds = time.perf_counter() - start_time
+    remove_old_export_versions(export_dir, keep_versions)
+
+    outputs = {
+        name: {"rows": len(df), "files": 0, "bytes": 0, "write_seconds": 0.0}
+        for name, df in frames.items()
+    }
+    for (name, _, _), (size, write_seconds) in zip(files, written):
+        outputs[name]["files"] += 1
+        outputs[name]["bytes"] += size
+        outputs[name]["write_seconds"] += write_seconds
+    total_bytes = sum(output["bytes"] for output in outputs.values())
+    total_rows = sum(output["rows"] for output in outputs.values())
+
+    for name, output in outputs.items():
+        print(
+            f"{name}: {output['rows']} rows, {output['files']} files, "
+            f"{output['bytes'] / 1024 ** 2:.1f} MB"
+        )
+    print(
+        f"Exported version {version}: {total_bytes / 1024 ** 2:.1f} MB in {seconds:.2f}s "
+        f"({total_bytes / 1024 ** 2 / seconds:.1f} MB/s, {total_rows / seconds:.0f} rows/s)"
+    )
+    return {
+        "version": version,
+        "outputs": outputs,
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "mb_per_second": total_bytes / 1024**2 / seconds,
+        "rows_per_second": total_rows / seconds,
+    }
+
+
+def read_exported_insight(
+    export_dir: str, name: str, version: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Read one insight output of an export version.
+
+    :param export_dir: The export directory.
+    :param name: The name of the output (e.g. lapsed_clients_df).
+    :param version: Optional version to read (default is the latest complete version).
+    :return: The output, with its rows grouped by month (dictionary-encoded strings load as categoricals).
+    :raises FileNotFoundError: If there is no export or the output is not part of it
+    """
+    version = version or get_current_export_version(export_dir)
+    if version is None:
+        raise FileNotFoundError(f"No exported insights in {export_dir}.")
+    output_dir = os.path.join(export_dir, version, name)
+    if not os.path.isdir(output_dir):
+        raise FileNotFoundError(f"{name} is not part of export version {version}.")
+
+    paths = sorted(
+        os.path.join(directory, file_name)
+        for directory, _, file_names in os.walk(output_dir)
+        for file_name in file_names
+        if file_name.endswith(".parquet")
+    )
+    # The partitions share one schema, so their tables concatenate without conversion
+    return pa.concat_tables([pq.read_table(path) for path in paths]).to_pandas()
+
+
+def read_exported_insights(
+    export_dir: str, names: Optional[List[str]] = None, version: Optional[str] = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Load precomputed insight outputs, e.g. in a refresh, instead of extracting and computing them again.
+
+    :param export_dir: The export directory.
+    :param names: Optional names of the outputs to read (default is every output of the version).
+    :param version: Optional version to read (default is the latest complete version).
+    :return: The outputs, by name.
+    :raises FileNotFoundError: If there is no export
+    """
+    version = version or get_current_export_version(export_dir)
+    if version is None:
+        raise FileNotFoundError(f"No exported insights in {export_dir}.")
+    if names is None:
+        names = sorted(os.listdir(os.path.join(export_dir, version)))
+    return {name: read_exported_insight(export_dir, name, version) for name in names}
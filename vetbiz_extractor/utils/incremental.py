@@ -0,0 +1,312 @@
+import os
+from functools import partial
+import pandas as pd
+from typing import Any, Callable, List, Optional
+from vetbiz_extractor.utils.common import (
+    FAILED_TABLES_ATTR,
+    PARTIAL_RESULT_ATTR,
+    PARTIAL_TABLES_ATTR,
+    fetch_data_in_batches,
+    finalize_fetched_dataframe,
+    get_failed_tables_dataframe,
+    to_query_param,
+)
+from vetbiz_extractor.utils.connection_pool import ConnectionPool
+from vetbiz_extractor.utils.journals import (
+    discover_tables,
+    fetch_batched_xero_journals_data,
+    get_etani_connection_factory,
+)
+from vetbiz_extractor.utils.profiling import span
+from vetbiz_extractor.utils.time_budget import TimeBudget
+
+# Column used internally to split an incremental journals fetch per table
+SOURCE_TABLE_COLUMN = "__source_table"
+
+
+def read_cached_dataframe(cache_path: str) -> Optional[pd.DataFrame]:
+    """
+    Read a cached DataFrame from a Parquet file.
+
+    :param cache_path: Path of the Parquet file.
+    :return: The cached DataFrame, or None if there is no cache yet.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    return pd.read_parquet(cache_path)
+
+
+def write_cached_dataframe(df: pd.DataFrame, cache_path: str) -> None:
+    """
+    Write a DataFrame to a Parquet cache file atomically, so an interrupted run never leaves a partial cache.
+
+    :param df: The DataFrame to cache.
+    :param cache_path: Path of the Parquet file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    temp_path = f"{cache_path}.tmp"
+    df.to_parquet(temp_path, index=False)
+    os.replace(temp_path, cache_path)
+
+
+def merge_incremental_rows(
+    cached_df: pd.DataFrame,
+    new_rows_df: Optional[pd.DataFrame],
+    watermark_column: str,
+    key_columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Merge rows fetched at or past the watermark into the cached rows.
+
+    The new rows replace the cached rows at the watermark (which were fetched again) and,
+    when `key_columns` are given, any cached rows with the same keys (updated rows).
+    Cached rows without a watermark value (e.g. a NULL invoice_date) are never fetched again, so they are kept
+    unless new rows have the same keys.
+    An empty fetch leaves the cache unchanged, since it always includes the rows at the watermark
+    unless the fetch failed.
+
+    :param cached_df: The cached rows.
+    :param new_rows_df: The rows fetched at or past the watermark of the cached rows.
+    :param watermark_column: The column holding the watermark (e.g. invoice_date or a journal number).
+    :param key_columns: Optional columns identifying a row.
+    :return: The merged rows.
+    """
+    if new_rows_df is None or new_rows_df.empty:
+        return cached_df
+
+    watermarks = cached_df[watermark_column]
+    kept_df = cached_df[(watermarks < watermarks.max()) | watermarks.isna()]
+    if key_columns:
+        kept_df = kept_df[
+            ~pd.MultiIndex.from_frame(kept_df[key_columns]).isin(
+                pd.MultiIndex.from_frame(new_rows_df[key_columns])
+            )
+        ]
+    if kept_df.empty:
+        return new_rows_df.reset_index(drop=True)
+    return pd.concat([kept_df, new_rows_df], ignore_index=True)
+
+
+def fetch_data_incrementally(
+    query: str,
+    cache_path: str,
+    watermark_column: str,
+    db_user: str,
+    db_password: str,
+    db_host: str,
+    db_name: str,
+    db_port: int = 3306,
+    batch_size: int = 10000,
+    key_columns: Optional[List[str]] = None,
+    connection_pool: Optional[ConnectionPool] = None,
+    query_timeout: Optional[float] = None,
+    time_budget: Optional[TimeBudget] = None,
+) -> pd.DataFrame:
+    """
+    Fetch data from the database, downloading only the rows at or past the watermark of a local Parquet cache.
+
+    A cold run (no cache yet) fetches the full result exactly like fetch_data_in_batches and caches it.
+    A warm run wraps the query in a filter on `watermark_column` and merges the new rows into the cache.
+    The wrapped query has a %s parameter, so literal % characters of the query (e.g. in LIKE patterns) are
+    escaped for the driver.
+    A fetch cut short by `query_timeout` or `time_budget` is returned tagged as partial but not cached,
+    since the next run would only fetch the rows past the watermark of the rows fetched so far.
+
+    :param query: SQL query to execute (its result must include `watermark_column`)
+    :param cache_path: Path of the Parquet cache file for this query
+    :param watermark_column: Column whose cached maximum is the high-watermark (e.g. invoice_date)
+    :param db_user: Database user
+    :param db_password: Database password
+    :param db_host: Database host
+    :param db_name: Database name
+    :param db_port: Database port
+    :param batch_size: Number of rows to fetch per batch
+    :param key_columns: Optional columns identifying a row, so updated rows replace their cached version
+    :param connection_pool: Optional pool to borrow the connection from
+    :param query_timeout: Optional maximum number of seconds for the query
+    :param time_budget: Optional budget of the whole extraction (see TimeBudget), shared with other fetches
+    :return: DataFrame with the cached and newly fetched data
+    """
+    fetch = partial(
+        fetch_data_in_batches,
+        db_user=db_user,
+        db_password=db_password,
+        db_host=db_host,
+        db_name=db_name,
+        db_port=db_port,
+        batch_size=batch_size,
+        connection_pool=connection_pool,
+        query_timeout=query_timeout,
+        time_budget=time_budget,
+    )
+
+    cached_df = read_cached_dataframe(cache_path)
+    if cached_df is None or cached_df.empty:
+        df = fetch(query=query)
+        if not df.empty and not df.attrs.get(PARTIAL_RESULT_ATTR):
+            write_cached_dataframe(df, cache_path)
+        return df
+
+    # Literal % characters of the query must not be read as placeholders
+    source_query = query.strip().rstrip(";").replace("%", "%%")
+    incremental_query = (
+        f"SELECT * FROM ({source_query}) AS incremental_source "
+        f"WHERE {watermark_column} >= %s"
+    )
+    new_rows_df = fetch(
+        query=incremental_query,
+        query_params=(to_query_param(cached_df[watermark_column].max()),),
+    )
+    with span("merge_incremental_rows", rows_in=len(new_rows_df)) as merge_span:
+        df = merge_incremental_rows(
+            cached_df, new_rows_df, watermark_column, key_columns
+        )
+        merge_span.set(rows_out=len(df))
+
+    if new_rows_df.attrs.get(PARTIAL_RESULT_ATTR):
+        df.attrs[PARTIAL_RESULT_ATTR] = True
+    elif df is not cached_df:
+        write_cached_dataframe(df, cache_path)
+    return df
+
+
+def fetch_xero_journals_data_incrementally(
+    db_server: str,
+    db_user: str,
+    db_password: str,
+    db_name: str,
+    journals_tables_list: Optional[List[str]],
+    cache_dir: str,
+    watermark_column: str,
+    batch_size: int = 10000,
+    key_columns: Optional[List[str]] = None,
+    max_workers: int = 1,
+    connection_factory: Optional[Callable[[], Any]] = None,
+    columns: Optional[List[str]] = None,
+    tables_per_query: int = 1,
+    query_timeout: Optional[float] = None,
+    time_budget: Optional[TimeBudget] = None,
+    retries: int = 0,
+    retry_backoff_seconds: float = 1.0,
+    journal_tables_pattern: Optional[str] = None,
+    dialect: str = "mssql",
+) -> pd.DataFrame:
+    """
+    Fetch Xero journals tables from Etani, downloading only the rows at or past the watermark of each table's cache.
+
+    Every table is cached in its own Parquet file in `cache_dir`. Tables without a cache are fetched in full.
+    A table whose fetch fails keeps its cached rows; it is listed in the attrs of the result (failed_tables),
+    which is then tagged as partial, as by fetch_xero_journals_data_from_etani. A table cut short by
+    `query_timeout` or `time_budget` is listed in partial_tables and its new rows are not cached.
+
+    With a `journal_tables_pattern`, the tables are discovered from the database catalog before their caches are
+    read (see discover_tables); a failed discovery returns an empty result tagged as partial.
+
+    :param db_server: The database server address.
+    :param db_user: The username for the database.
+    :param db_password: The password for the database user.
+    :param db_name: The name of the database.
+    :param journals_tables_list: A list of journal table names to fetch data from.
+    :param cache_dir: Directory of the Parquet cache files, one per table.
+    :param watermark_column: Column whose cached maximum is the high-watermark (e.g. JournalNumber).
+    :param batch_size: Number of rows to fetch per batch
+    :param key_columns: Optional columns identifying a row, so updated rows replace their cached version.
+    :param max_workers: Maximum number of tables fetched concurrently.
+    :param connection_factory: An optional callable returning a DB-API connection.
+    :param columns: Optional columns to fetch instead of every column (required when tables are batched).
+    :param tables_per_query: Maximum number of tables fetched by one UNION ALL query (default is 1).
+    :param query_timeout: An optional maximum number of seconds per table query.
+    :param time_budget: An optional budget of the whole extraction (see TimeBudget), shared with other fetches.
+    :param retries: Number of times failed tables are fetched again (default is 0).
+    :param retry_backoff_seconds: Seconds to wait before the first retry, doubled for every later retry.
+    :param journal_tables_pattern: An optional LIKE pattern (e.g. JOURNAL_TABLES_PATTERN) of the tables to discover
+                                   and fetch, used instead of `journals_tables_list`.
+    :param dialect: SQL dialect of the database and its catalog ('mssql', 'mysql' or 'sqlite').
+    :return: A pandas DataFrame containing the combined data from the specified journal tables.
+    """
+    if connection_factory is None:
+        connection_factory = get_etani_connection_factory(
+            db_server, db_user, db_password, db_name
+        )
+    if journal_tables_pattern:
+        try:
+            journals_tables_list = list(
+                discover_tables(connection_factory, journal_tables_pattern, dialect)
+            )
+        except Exception as e:
+            print(f"Failed to discover journal tables: {e}")
+            return get_failed_tables_dataframe([])
+        if not journals_tables_list:
+            return pd.DataFrame()
+
+    cache_paths = {
+        journal_table: os.path.join(cache_dir, f"{journal_table}.parquet")
+        for journal_table in journals_tables_list
+    }
+    cached_dfs = {
+        journal_table: read_cached_dataframe(cache_path)
+        for journal_table, cache_path in cache_paths.items()
+    }
+    watermarks = {
+        journal_table: cached_df[watermark_column].max()
+        for journal_table, cached_df in cached_dfs.items()
+        if cached_df is not None and not cached_df.empty
+    }
+
+    new_rows_df = fetch_batched_xero_journals_data(
+        db_server,
+        db_user,
+        db_password,
+        db_name,
+        journals_tables_list,
+        columns=columns,
+        tables_per_query=tables_per_query,
+        connection_factory=connection_factory,
+        dialect=dialect,
+        batch_size=batch_size,
+        max_workers=max_workers,
+        source_table_column=SOURCE_TABLE_COLUMN,
+        watermark_column=watermark_column,
+        watermarks=watermarks,
+        query_timeout=query_timeout,
+        time_budget=time_budget,
+        retries=retries,
+        retry_backoff_seconds=retry_backoff_seconds,
+    )
+    # Rows of a cut-short table are not cached: the next run would only fetch past their watermark
+    partial_tables = set(new_rows_df.attrs.get(PARTIAL_TABLES_ATTR, []))
+
+    all_journals_data = []
+    for journal_table in journals_tables_list:
+        table_rows_df = None
+        if SOURCE_TABLE_COLUMN in new_rows_df:
+            table_rows_df = new_rows_df[
+                new_rows_df[SOURCE_TABLE_COLUMN] == journal_table
+            ].drop(columns=SOURCE_TABLE_COLUMN)
+
+        cached_df = cached_dfs[journal_table]
+        if journal_table not in watermarks:
+            df = table_rows_df
+        else:
+            df = merge_incremental_rows(
+                cached_df, table_rows_df, watermark_column, key_columns
+            )
+
+        if df is None or df.empty:
+            continue
+        if df is not cached_df and journal_table not in partial_tables:
+            write_cached_dataframe(
+                df.reset_index(drop=True), cache_paths[journal_table]
+            )
+        all_journals_data.append(df.reset_index(drop=True))
+
+    if not all_journals_data:
+        results = pd.DataFrame()
+    else:
+        results = finalize_fetched_dataframe(pd.concat(all_journals_data))
+
+    results.attrs = {}
+    if new_rows_df.attrs.get(PARTIAL_RESULT_ATTR):
+        for attr in (PARTIAL_RESULT_ATTR, PARTIAL_TABLES_ATTR, FAILED_TABLES_ATTR):
+            results.attrs[attr] = new_rows_df.attrs[attr]
+    return results
@@ -0,0 +1,507 @@
+import time
+import pandas as pd
+import pymssql
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from vetbiz_extractor.utils.common import (
+    FAILED_TABLES_ATTR,
+    MSSQL_COLUMN_KINDS,
+    PARTIAL_RESULT_ATTR,
+    PARTIAL_TABLES_ATTR,
+    QUERY_PLACEHOLDERS,
+    cancel_connection_query,
+    fetch_query_dataframe,
+    finalize_fetched_dataframe,
+    get_failed_tables_dataframe,
+    to_query_param,
+)
+from vetbiz_extractor.utils.connection_pool import ConnectionPool, close_quietly
+from vetbiz_extractor.utils.profiling import profiled, span
+from vetbiz_extractor.utils.time_budget import (
+    TimeBudget,
+    cancel_on_exhaustion,
+    get_query_budget,
+)
+
+# LIKE pattern of the Xero journals tables of every tenant in the Etani database
+JOURNAL_TABLES_PATTERN = "TAZTECH_%_XEROBLUE_Journals"
+# Catalog queries listing the tables matching a LIKE pattern with their estimated row counts, per SQL dialect
+TABLE_CATALOG_QUERIES = {
+    "mssql": "SELECT t.name, SUM(p.rows) FROM sys.tables AS t "
+    "JOIN sys.partitions AS p ON p.object_id = t.object_id AND p.index_id IN (0, 1) "
+    "WHERE t.name LIKE %s GROUP BY t.name ORDER BY t.name",
+    "mysql": "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s ORDER BY TABLE_NAME",
+    "sqlite": "SELECT name, NULL FROM sqlite_master "
+    "WHERE type = 'table' AND name LIKE ? ORDER BY name",
+}
+
+# SELECT of at most {limit} rows of a table, per SQL dialect (a UNION ALL branch cannot end with a bare LIMIT)
+LIMITED_SELECT_TEMPLATES = {
+    "mssql": "SELECT TOP {limit} {select_list} FROM {table}{where}",
+    "mysql": "(SELECT {select_list} FROM {table}{where} LIMIT {limit})",
+    "sqlite": "SELECT * FROM (SELECT {select_list} FROM {table}{where} LIMIT {limit})",
+}
+
+
+def get_etani_connection_factory(
+    db_server: str, db_user: str, db_password: str, db_name: str
+) -> Callable[[], Any]:
+    """
+    Return a callable opening a new pymssql connection to the Etani database.
+
+    :param db_server: The database server address.
+    :param db_user: The username for the database.
+    :param db_password: The password for the database user.
+    :param db_name: The name of the database.
+    :return: A callable taking no arguments and returning a DB-API connection.
+    """
+    return partial(
+        pymssql.connect,
+        server=db_server,
+        user=db_user,
+        password=db_password,
+        database=db_name,
+    )
+
+
+def discover_tables(
+    connection_factory: Callable[[], Any],
+    pattern: str = JOURNAL_TABLES_PATTERN,
+    dialect: str = "mssql",
+) -> Dict[str, Optional[int]]:
+    """
+    List the tables of a database whose name matches a LIKE pattern, e.g. the journals tables of every tenant.
+
+    :param connection_factory: A callable returning a DB-API connection to the database.
+    :param pattern: The LIKE pattern of the table names (default is JOURNAL_TABLES_PATTERN).
+    :param dialect: SQL dialect of the database ('mssql', 'mysql' or 'sqlite').
+    :return: The estimated row count of every matching table (None when the catalog has no estimate), by name,
+             ordered by name.
+    :raises ValueError: If the dialect is not supported
+    """
+    if dialect not in TABLE_CATALOG_QUERIES:
+        raise ValueError(
+            f"Unsupported SQL dialect '{dialect}'. "
+            f"Supported dialects: {', '.join(TABLE_CATALOG_QUERIES)}"
+        )
+
+    conn = connection_factory()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(TABLE_CATALOG_QUERIES[dialect], (pattern,))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        close_quietly(conn)
+    return {
+        name: None if row_count is None else int(row_count) for name, row_count in rows
+    }
+
+
+def get_table_batches(
+    tables: Sequence[str],
+    tables_per_query: int = 1,
+    table_row_counts: Optional[Dict[str, Optional[int]]] = None,
+    max_rows_per_query: Optional[int] = None,
+) -> List[Tuple[str, ...]]:
+    """
+    Group consecutive tables into batches fetched by one query each.
+
+    A batch holds up to `tables_per_query` tables whose estimated row counts add up to at most `max_rows_per_query`;
+    a table estimated above it is fetched on its own. Tables without an estimate only count towards
+    `tables_per_query`.
+
+    :param tables: The tables, in fetch order.
+    :param tables_per_query: Maximum number of tables per batch (1 fetches every table on its own).
+    :param table_row_counts: Optional estimated row count of tables, by name (e.g. from discover_tables).
+    :param max_rows_per_query: Optional maximum of the estimated rows of a batch.
+    :return: The batches, in the order of `tables`.
+    """
+    table_row_counts = table_row_counts or {}
+    batches = []
+    batch, batch_rows = [], 0
+    for table in tables:
+        table_rows = table_row_counts.get(table) or 0
+        if batch and (
+            len(batch) >= tables_per_query
+            or (
+                max_rows_per_query is not None
+                and batch_rows + table_rows > max_rows_per_query
+            )
+        ):
+            batches.append(tuple(batch))
+            batch, batch_rows = [], 0
+        batch.append(table)
+        batch_rows += table_rows
+    if batch:
+        batches.append(tuple(batch))
+    return batches
+
+
+def get_journal_tables_query(
+    journal_tables: Sequence[str],
+    columns: Optional[Sequence[str]] = None,
+    query_limit: Optional[int] = None,
+    source_table_column: Optional[str] = None,
+    watermark_column: Optional[str] = None,
+    watermarks: Optional[Dict[str, Any]] = None,
+    dialect: str = "mssql",
+) -> tuple:
+    """
+    Build the query fetching a batch of journal tables: one SELECT per table, combined with UNION ALL.
+
+    :param journal_tables: The journal tables of the batch.
+    :param columns: Optional columns to select (default is every column, for tables of a single-table batch).
+    :param query_limit: An optional limit on the number of rows per table.
+    :param source_table_column: An optional column selecting the table name as a literal, for every row.
+    :param watermark_column: An optional column used to fetch only the rows at or past a table's watermark.
+    :param watermarks: Optional mapping of table names to the watermark value of `watermark_column`.
+    :param dialect: SQL dialect of the database ('mssql', 'mysql' or 'sqlite').
+    :return: The arguments of cursor.execute: the query, and its parameters when it has any.
+    :raises ValueError: If the dialect is not supported
+    """
+    if dialect not in LIMITED_SELECT_TEMPLATES:
+        raise ValueError(
+            f"Unsupported SQL dialect '{dialect}'. "
+            f"Supported dialects: {', '.join(LIMITED_SELECT_TEMPLATES)}"
+        )
+
+    selects, params = [], []
+    for journal_table in journal_tables:
+        select_list = ", ".join(columns) if columns else "*"
+        if source_table_column:
+            table_literal = journal_table.replace("'", "''")
+            select_list += f", '{table_literal}' AS {source_table_column}"
+        where = ""
+        if watermark_column and watermarks and journal_table in watermarks:
+            where = f" WHERE {watermark_column} >= {QUERY_PLACEHOLDERS[dialect]}"
+            params.append(to_query_param(watermarks[journal_table]))
+        if query_limit:
+            query = LIMITED_SELECT_TEMPLATES[dialect].format(
+                limit=int(query_limit),
+                select_list=select_list,
+                table=journal_table,
+                where=where,
+            )
+        else:
+            query = f"SELECT {select_list} FROM {journal_table}{where}"
+        selects.append(query)
+
+    query = f"{' UNION ALL '.join(selects)};"
+    return (query, tuple(params)) if params else (query,)
+
+
+@profiled()
+def fetch_xero_journals_data_from_etani(
+    db_server: str,
+    db_user: str,
+    db_password: str,
+    db_name: str,
+    journals_tables_list: Optional[List[str]] = None,
+    batch_size: int = 10000,
+    query_limit: Optional[int] = None,
+    schema: Optional[Dict[str, str]] = None,
+    downcast: bool = False,
+    max_workers: int = 1,
+    source_table_column: Optional[str] = None,
+    connection_factory: Optional[Callable[[], Any]] = None,
+    watermark_column: Optional[str] = None,
+    watermarks: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+    max_queued_batches: int = 2,
+    query_timeout: Optional[float] = None,
+    time_budget: Optional[TimeBudget] = None,
+    retries: int = 0,
+    retry_backoff_seconds: float = 1.0,
+    columns: Optional[List[str]] = None,
+    journal_batches: Optional[List[Tuple[str, ...]]] = None,
+    dialect: str = "mssql",
+) -> pd.DataFrame:
+    """
+    Fetches data from multiple Xero journals tables in the Etani SQL database and combines them into a single DataFrame.
+
+    Tables are fetched by up to `max_workers` threads, one table per worker, each on a connection
+    borrowed from a pool of at most `max_workers` connections. The combined data keeps the order
+    of `journals_tables_list` whatever order the tables finish in.
+
+    A table whose query runs out of time (`query_timeout` or `time_budget`) is cancelled and keeps the rows fetched
+    so far. A table whose fetch fails is retried up to `retries` times, waiting `retry_backoff_seconds` and doubling
+    the wait after every attempt; only the failed tables are fetched again. Cut-short tables and tables still failing
+    are listed in the attrs of the result (partial_tables and failed_tables), which is then tagged as partial.
+
+    With `journal_batches` (see fetch_batched_xero_journals_data), the tables of a batch are fetched together in one
+    UNION ALL query selecting `columns` and the table name as a literal source column, saving a round trip per table;
+    a batch is fetched, cut short, failed and retried as a whole, and all its tables are listed in the attrs.
+
+    :param db_server: The database server address.
+    :param db_user: The username for the database.
+    :param db_password: The password for the database user.
+    :param db_name: The name of the database.
+    :param journals_tables_list: A list of journal table names to fetch data from.
+    :param batch_size: Number of rows to fetch per batch
+    :param query_limit: An optional limit on the number of rows per table.
+    :param schema: An optional mapping of column names to dtypes applied to the combined data.
+    :param downcast: Whether to downcast the combined data to compact dtypes (see downcast_columns).
+    :param max_workers: Maximum number of tables fetched concurrently (1 fetches them one after another).
+    :param source_table_column: An optional column name recording the table each row was fetched from.
+    :param connection_factory: An optional callable returning a DB-API connection,
+                               used instead of connecting to the Etani database with pymssql.
+    :param watermark_column: An optional column used to fetch only the rows at or past a table's watermark.
+    :param watermarks: Optional mapping of table names to the watermark value of `watermark_column`;
+                       tables without a watermark are fetched in full.
+    :param stream: Whether to receive each table's batches on a background thread while the previous batches are
+                   converted (pymssql tuple cursors read rows from the server as they are fetched).
+    :param max_queued_batches: Maximum number of received batches waiting to be converted when streaming.
+    :param query_timeout: An optional maximum number of seconds per table query.
+    :param time_budget: An optional budget of the whole extraction (see TimeBudget), shared with other fetches.
+    :param retries: Number of times failed tables are fetched again (default is 0).
+    :param retry_backoff_seconds: Seconds to wait before the first retry, doubled for every later retry.
+    :param columns: Optional columns to fetch instead of every column. Required when tables are batched,
+                    as the tables of a UNION ALL query must have the same columns.
+    :param journal_batches: Optional batches of tables fetched by one query each, used instead of
+                            `journals_tables_list` (see get_table_batches).
+    :param dialect: SQL dialect of the database ('mssql', 'mysql' or 'sqlite'), e.g. for a sqlite
+                    `connection_factory`.
+    :return: A pandas DataFrame containing the combined data from the specified journal tables.
+             When the fetch fails as a whole, an empty DataFrame tagged as partial with every table failed.
+    :raises ValueError: If neither tables nor batches are given, or if tables are batched without `columns`
+    """
+    if journal_batches is None:
+        journal_batches = [
+            (journal_table,) for journal_table in journals_tables_list or []
+        ]
+    if not journal_batches:
+        raise ValueError(
+            "Either journals_tables_list or journal_batches must be given."
+        )
+    if not columns and any(len(journal_batch) > 1 for journal_batch in journal_batches):
+        raise ValueError(
+            "Batching journal tables into UNION ALL queries requires columns."
+        )
+
+    if connection_factory is None:
+        connection_factory = get_etani_connection_factory(
+            db_server, db_user, db_password, db_name
+        )
+
+    def fetch_journal_batch(pool, journal_batch):
+        """
+        Fetch a batch of journal tables with one query on a pooled connection.
+        :param pool:
+        :param journal_batch:
+        :return:
+        """
+        query_args = get_journal_tables_query(
+            journal_batch,
+            columns,
+            query_limit,
+            # A single table is tagged once fetched rather than by the database
+            source_table_column if len(journal_batch) > 1 else None,
+            watermark_column,
+            watermarks,
+            dialect,
+        )
+
+        table_budget = get_query_budget(time_budget, query_timeout)
+        with span("fetch_journal_table", table=", ".join(journal_batch)) as table_span:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                with cancel_on_exhaustion(
+                    table_budget, partial(cancel_connection_query, conn)
+                ):
+                    df = fetch_query_dataframe(
+                        cursor,
+                        query_args,
+                        batch_size,
+                        MSSQL_COLUMN_KINDS,
+                        max_queued_batches if stream else 0,
+                        table_budget,
+                    )
+                if df.attrs.get(PARTIAL_RESULT_ATTR):
+                    pool.invalidate(conn)
+                else:
+                    cursor.close()
+            table_span.set(rows_out=len(df))
+
+        if source_table_column and len(journal_batch) == 1:
+            df[source_table_column] = journal_batch[0]
+        return df
+
+    def fetch_journal_batches(pool, journal_batches):
+        """
+        Fetch batches of journal tables concurrently, returning the error of every batch that failed.
+        :param pool:
+        :param journal_batches:
+        :return:
+        """
+
+        def fetch_journal_batch_or_error(journal_batch):
+            try:
+                return fetch_journal_batch(pool, journal_batch)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(
+                zip(
+                    journal_batches,
+                    executor.map(fetch_journal_batch_or_error, journal_batches),
+                )
+            )
+
+    try:
+        with ConnectionPool(connection_factory, max_size=max_workers) as pool:
+            journals_data = fetch_journal_batches(pool, journal_batches)
+            for attempt in range(retries):
+                failed_batches = [
+                    journal_batch
+                    for journal_batch, result in journals_data.items()
+                    if isinstance(result, Exception)
+                ]
+                if not failed_batches:
+                    break
+                backoff_seconds = retry_backoff_seconds * 2**attempt
+                if time_budget is None:
+                    time.sleep(backoff_seconds)
+                elif not time_budget.sleep(backoff_seconds):
+                    break
+                print(
+                    f"Retrying {sum(map(len, failed_batches))} failed journal tables "
+                    f"(attempt {attempt + 1} of {retries})"
+                )
+                journals_data.update(fetch_journal_batches(pool, failed_batches))
+
+        failed_tables = []
+        for journal_batch, result in journals_data.items():
+            if isinstance(result, Exception):
+                print(f"Failed to fetch {', '.join(journal_batch)}: {result}")
+                failed_tables.extend(journal_batch)
+        all_journals_data = [
+            df for df in journals_data.values() if not isinstance(df, Exception)
+        ]
+        partial_tables = [
+            journal_table
+            for journal_batch, df in journals_data.items()
+            if not isinstance(df, Exception) and df.attrs.get(PARTIAL_RESULT_ATTR)
+            for journal_table in journal_batch
+        ]
+
+        non_empty_journals_data = [df for df in all_journals_data if not df.empty]
+        if not non_empty_journals_data:
+            results = all_journals_data[-1] if all_journals_data else pd.DataFrame()
+        else:
+            results = finalize_fetched_dataframe(
+                pd.concat(non_empty_journals_data), schema, downcast
+            )
+
+        results.attrs = {}
+        if partial_tables or failed_tables:
+            print(
+                f"Journals are partial: {len(partial_tables)} tables cut short, "
+                f"{len(failed_tables)} tables failed"
+            )
+            results.attrs[PARTIAL_RESULT_ATTR] = True
+            results.attrs[PARTIAL_TABLES_ATTR] = partial_tables
+            results.attrs[FAILED_TABLES_ATTR] = failed_tables
+        return results
+    except pymssql.DatabaseError as e:
+        print(f"Database error occurred: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+
+    # The fetch failed as a whole: no table was fetched
+    return get_failed_tables_dataframe(
+        [
+            journal_table
+            for journal_batch in journal_batches
+            for journal_table in journal_batch
+        ]
+    )
+
+
+def fetch_batched_xero_journals_data(
+    db_server: str,
+    db_user: str,
+    db_password: str,
+    db_name: str,
+    journals_tables_list: Optional[List[str]] = None,
+    journal_tables_pattern: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    tables_per_query: int = 1,
+    max_rows_per_query: Optional[int] = None,
+    connection_factory: Optional[Callable[[], Any]] = None,
+    dialect: str = "mssql",
+    **fetch_options: Any,
+) -> pd.DataFrame:
+    """
+    Fetch Xero journals tables listed or discovered in the Etani catalog, batching small tables into UNION ALL queries.
+
+    With a `journal_tables_pattern`, the tables are discovered from the database catalog (see discover_tables)
+    instead of `journals_tables_list`. With `tables_per_query` above 1, consecutive small tables are grouped into
+    batches (see get_table_batches), each fetched by one query of fetch_xero_journals_data_from_etani.
+
+    :param db_server: The database server address.
+    :param db_user: The username for the database.
+    :param db_password: The password for the database user.
+    :param db_name: The name of the database.
+    :param journals_tables_list: A list of journal table names to fetch data from.
+    :param journal_tables_pattern: An optional LIKE pattern (e.g. JOURNAL_TABLES_PATTERN) of the tables to discover
+                                   and fetch, used instead of `journals_tables_list`.
+    :param columns: Optional columns to fetch instead of every column (required when tables are batched).
+    :param tables_per_query: Maximum number of tables fetched by one query (default is 1, one query per table).
+    :param max_rows_per_query: Optional maximum of the catalog's estimated rows of the tables fetched by one query;
+                               larger tables are fetched on their own. Only discovered tables have estimates.
+    :param connection_factory: An optional callable returning a DB-API connection,
+                               used instead of connecting to the Etani database with pymssql.
+    :param dialect: SQL dialect of the database and its catalog ('mssql', 'mysql' or 'sqlite').
+    :param fetch_options: Other arguments of fetch_xero_journals_data_from_etani (e.g. max_workers or retries).
+    :return: A pandas DataFrame containing the combined data from the journal tables, as returned by
+             fetch_xero_journals_data_from_etani. A failed discovery returns an empty DataFrame tagged as partial.
+    :raises ValueError: If neither tables nor a pattern are given, or if tables are batched without `columns`
+    """
+    if not journals_tables_list and not journal_tables_pattern:
+        raise ValueError(
+            "Either journals_tables_list or journal_tables_pattern must be given."
+        )
+    if tables_per_query > 1 and not columns:
+        raise ValueError(
+            "Batching journal tables into UNION ALL queries requires columns."
+        )
+
+    if connection_factory is None:
+        connection_factory = get_etani_connection_factory(
+            db_server, db_user, db_password, db_name
+        )
+
+    table_row_counts = None
+    if journal_tables_pattern:
+        try:
+            table_row_counts = discover_tables(
+                connection_factory, journal_tables_pattern, dialect
+            )
+        except Exception as e:
+            print(f"Failed to discover journal tables: {e}")
+            return get_failed_tables_dataframe([])
+        journals_tables_list = list(table_row_counts)
+        print(
+            f"Discovered {len(journals_tables_list)} journal tables "
+            f"matching {journal_tables_pattern}"
+        )
+        if not journals_tables_list:
+            return pd.DataFrame()
+
+    return fetch_xero_journals_data_from_etani(
+        db_server,
+        db_user,
+        db_password,
+        db_name,
+        columns=columns,
+        connection_factory=connection_factory,
+        journal_batches=get_table_batches(
+            journals_tables_list, tables_per_query, table_row_counts, max_rows_per_query
+        ),
+        dialect=dialect,
+        **fetch_options,
+    )
@@ -0,0 +1,108 @@
+import os
+import pandas as pd
+from typing import Iterator, List, Optional, Tuple
+from vetbiz_extractor.utils.common import get_month_index
+
+# Partition of the rows without a date, which no monthly analysis reads
+UNDATED_PARTITION = "month=none"
+
+
+def get_month_partition_name(month_index: int) -> str:
+    """
+    Return the directory name of a month partition, e.g. month=2023-04.
+
+    :param month_index: A month index (year * 12 + month - 1).
+    :return: The partition directory name.
+    """
+    year, month = divmod(int(month_index), 12)
+    return f"month={year:04d}-{month + 1:02d}"
+
+
+def get_partition_month_index(partition_name: str) -> int:
+    """
+    Return the month index of a month partition directory name.
+
+    :param partition_name: A partition directory name, e.g. month=2023-04.
+    :return: The month index of the partition.
+    """
+    year, month = partition_name.split("=", 1)[1].split("-")
+    return int(year) * 12 + int(month) - 1
+
+
+def write_month_partitions(
+    df: pd.DataFrame, dataset_dir: str, date_column: str
+) -> None:
+    """
+    Append the rows of a DataFrame to a Parquet dataset partitioned by the year-month of a date column.
+
+    Each call adds one Parquet file per month it has rows for, so a large result can be written batch by
+    batch (e.g. from iter_data_in_batches) without holding it in memory. Rows keep their order within a month.
+
+    :param df: The rows to append.
+    :param dataset_dir: Directory of the dataset.
+    :param date_column: The column assigning rows to months (e.g. invoice_date).
+    """
+    month_index = get_month_index(df[date_column])
+    for month, month_df in df.groupby(month_index.fillna(-1).to_numpy(), sort=True):
+        partition_name = (
+            UNDATED_PARTITION if month < 0 else get_month_partition_name(month)
+        )
+        partition_dir = os.path.join(dataset_dir, partition_name)
+        os.makedirs(partition_dir, exist_ok=True)
+        part_number = len(
+            [name for name in os.listdir(partition_dir) if name.endswith(".parquet")]
+        )
+        temp_path = os.path.join(partition_dir, f"part-{part_number:05d}.tmp")
+        month_df.to_parquet(temp_path, index=False)
+        os.replace(
+            temp_path, os.path.join(partition_dir, f"part-{part_number:05d}.parquet")
+        )
+
+
+def get_month_partitions(dataset_dir: str) -> List[Tuple[int, str]]:
+    """
+    List the month partitions of a dataset in chronological order.
+
+    :param dataset_dir: Directory of the dataset.
+    :return: (month index, partition directory) of every dated partition.
+    """
+    return sorted(
+        (get_partition_month_index(name), os.path.join(dataset_dir, name))
+        for name in os.listdir(dataset_dir)
+        if name.startswith("month=") and name != UNDATED_PARTITION
+    )
+
+
+def read_month_partition(
+    partition_dir: str, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Read the rows of a month partition, in the order they were written.
+
+    :param partition_dir: Directory of the month partition.
+    :param columns: Optional columns to read (default is all columns).
+    :return: The rows of the month.
+    """
+    part_paths = sorted(
+        os.path.join(partition_dir, name)
+        for name in os.listdir(partition_dir)
+        if name.endswith(".parquet")
+    )
+    parts = [pd.read_parquet(path, columns=columns) for path in part_paths]
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts, ignore_index=True)
+
+
+def iter_month_partitions(
+    dataset_dir: str, columns: Optional[List[str]] = None
+) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    Read a month-partitioned dataset one month at a time, in chronological order.
+
+    :param dataset_dir: Directory of the dataset.
+    :param columns: Optional columns to read (default is all columns).
+    :return: An iterator of (month index, rows of the month).
+    """
+    for month, partition_dir in get_month_partitions(dataset_dir):
+        yield month, read_month_partition(partition_dir, columns)
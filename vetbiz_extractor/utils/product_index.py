@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+# Default mapping of product name keywords to product categories (matched case-insensitively)
+DEFAULT_PRODUCT_CATEGORIES = {
+    "consult": "consult",
+    "dental": "dental",
+}
+
+
+class ProductIndex:
+    """
+    Classifies the products of a sales frame into keyword categories once, so analyses filter rows
+    with an integer mask lookup instead of scanning product names again.
+
+    Each distinct product name is matched against every keyword once (vectorized over the distinct
+    names only) and gets a bitmask of the categories it belongs to. Rows hold the bitmask of their product.
+    """
+
+    def __init__(
+        self,
+        product_names: pd.Series,
+        keyword_categories: Optional[Dict[str, str]] = None,
+    ):
+        """
+        :param product_names: The product_name column of the sales frame.
+        :param keyword_categories: Mapping of keywords to category names (default is DEFAULT_PRODUCT_CATEGORIES).
+                                   Several keywords can map to the same category.
+        :raises ValueError: If there are more than 63 categories
+        """
+        keyword_categories = keyword_categories or DEFAULT_PRODUCT_CATEGORIES
+        self.categories = list(dict.fromkeys(keyword_categories.values()))
+        if len(self.categories) > 63:
+            raise ValueError("A product index supports at most 63 categories.")
+        self.category_bits = {
+            category: np.int64(1) << np.int64(bit)
+            for bit, category in enumerate(self.categories)
+        }
+
+        if isinstance(product_names.dtype, pd.CategoricalDtype):
+            product_codes = product_names.cat.codes.to_numpy()
+            self.products = product_names.cat.categories
+        else:
+            product_codes, self.products = pd.factorize(product_names)
+
+        # Non-string product names never match a keyword
+        lowered_products = pd.Series(self.products, dtype=object).str.lower()
+        product_masks = np.zeros(len(self.products) + 1, dtype=np.int64)
+        for keyword, category in keyword_categories.items():
+            matches = lowered_products.str.contains(
+                keyword.lower(), regex=False, na=False
+            ).to_numpy(dtype=bool)
+            product_masks[:-1][matches] |= self.category_bits[category]
+
+        self.product_masks = product_masks[:-1]
+        # Missing products have code -1, which looks up the trailing empty mask
+        self.row_masks = product_masks[product_codes]
+
+    def __len__(self) -> int:
+        return len(self.row_masks)
+
+    def get_mask(self, category: str) -> np.ndarray:
+        """
+        Return a boolean mask of the rows whose product belongs to a category.
+
+        :param category: The category name.
+        :return: A boolean array with one value per row.
+        :raises KeyError: If the category is not part of the index
+        """
+        return (self.row_masks & self.category_bits[category]) != 0
+
+    def get_products(self, category: str) -> List[str]:
+        """
+        Return the distinct product names belonging to a category.
+
+        :param category: The category name.
+        :return: List of product names, in order of first appearance (or of the categorical's categories).
+        """
+        matches = (self.product_masks & self.category_bits[category]) != 0
+        return list(np.asarray(self.products, dtype=object)[matches])
+
+
+def get_product_index(
+    sales_data: pd.DataFrame,
+    product_index: Optional[ProductIndex] = None,
+    keyword_categories: Optional[Dict[str, str]] = None,
+) -> ProductIndex:
+    """
+    Return the product index of a sales frame, building it when none is given.
+
+    :param sales_data: DataFrame containing a 'product_name' column.
+    :param product_index: An optional index already built for the rows of `sales_data`.
+    :param keyword_categories: Optional mapping of keywords to categories used when building the index.
+    :return: The product index of `sales_data`.
+    :raises ValueError: If the given index does not have one entry per row of `sales_data`
+    """
+    if product_index is None:
+        return ProductIndex(sales_data["product_name"], keyword_categories)
+
+    if len(product_index) != len(sales_data):
+        raise ValueError(
+            f"The product index has {len(product_index)} rows but the sales data has {len(sales_data)}."
+        )
+    return product_index
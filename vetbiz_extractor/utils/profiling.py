@@ -0,0 +1,293 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import warnings
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Environment variables switching profiling on without code changes
+PROFILE_ENV_VAR = "VETBIZ_PROFILE"  # "json" or "chrome"
+PROFILE_PATH_ENV_VAR = "VETBIZ_PROFILE_PATH"
+PROFILE_MEMORY_ENV_VAR = "VETBIZ_PROFILE_MEMORY"  # "1" to trace Python allocations
+
+PROFILE_FORMATS = ("json", "chrome")
+
+
+class Span:
+    """A timed stage of a run, with optional attributes such as row counts."""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.thread_id = threading.get_ident()
+        self.attributes = attributes
+        self.start_time = 0.0
+        self.duration = 0.0
+        self.start_max_rss_mb: Optional[float] = None
+        self.max_rss_mb: Optional[float] = None
+        self.start_traced_memory = 0
+        self.peak_traced_memory = 0
+        self.children_peak_traced_memory = 0
+
+    def set(self, **attributes: Any) -> None:
+        """Record attributes of the span, e.g. span.set(rows_out=len(df))."""
+        self.attributes.update(attributes)
+
+
+class NullSpan:
+    """The span handed out while profiling is disabled; recording attributes does nothing."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def get_max_rss_mb() -> Optional[float]:
+    """Return the peak resident set size of the process in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return max_rss / 1024**2 if os.uname().sysname == "Darwin" else max_rss / 1024
+
+
+class Profiler:
+    """
+    Records nestable timing spans and writes them as structured JSON or as a Chrome trace
+    (open in chrome://tracing or https://ui.perfetto.dev).
+
+    Spans nest per thread. Each span records the peak resident set size of the process at its end
+    (process_max_rss_mb) and how much the span raised it (max_rss_growth_mb). With `trace_memory`, each span
+    also records the peak of traced Python allocations (tracemalloc) above its starting point.
+    Both are approximate while threads overlap.
+    """
+
+    def __init__(
+        self,
+        output_format: Optional[str] = None,
+        output_path: Optional[str] = None,
+        trace_memory: bool = False,
+    ):
+        """
+        :param output_format: "json" or "chrome"; None disables profiling.
+        :param output_path: File the profile is written to.
+        :param trace_memory: Whether to trace Python allocations with tracemalloc.
+        :raises ValueError: If the output format is not supported
+        """
+        if output_format is not None and output_format not in PROFILE_FORMATS:
+            raise ValueError(
+                f"Unsupported profile format '{output_format}'. "
+                f"Supported formats: {', '.join(PROFILE_FORMATS)}"
+            )
+
+        self.enabled = output_format is not None
+        self.output_format = output_format
+        self.output_path = output_path or (
+            "vetbiz_trace.json" if output_format == "chrome" else "vetbiz_profile.json"
+        )
+        self.trace_memory = trace_memory
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if self.enabled and trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """
+        Time the enclosed block as a span nested in the current span of the thread.
+
+        :param name: Name of the stage.
+        :param attributes: Attributes recorded with the span (e.g. table=..., rows_in=...).
+        :return: A context manager yielding the span, so attributes can be added with span.set(...).
+        """
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+
+        stack = self._stack()
+        span = Span(name, stack[-1] if stack else None, attributes)
+        if self.trace_memory:
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            if span.parent:
+                span.parent.children_peak_traced_memory = max(
+                    span.parent.children_peak_traced_memory, peak_memory
+                )
+            tracemalloc.reset_peak()
+            span.start_traced_memory = current_memory
+
+        span.start_max_rss_mb = get_max_rss_mb()
+        stack.append(span)
+        span.start_time = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start_time
+            stack.pop()
+            span.max_rss_mb = get_max_rss_mb()
+            if self.trace_memory:
+                _, peak_memory = tracemalloc.get_traced_memory()
+                span.peak_traced_memory = max(
+                    peak_memory, span.children_peak_traced_memory
+                )
+                tracemalloc.reset_peak()
+                if span.parent:
+                    span.parent.children_peak_traced_memory = max(
+                        span.parent.children_peak_traced_memory,
+                        span.peak_traced_memory,
+                    )
+            with self._lock:
+                self.spans.append(span)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return the recorded spans as a JSON-serializable dictionary, in start order."""
+        spans = []
+        for span in sorted(self.spans, key=lambda s: s.start_time):
+            record = {
+                "name": span.name,
+                "parent": span.parent.name if span.parent else None,
+                "depth": span.depth,
+                "thread_id": span.thread_id,
+                "start_seconds": span.start_time - self._origin,
+                "duration_seconds": span.duration,
+                "process_max_rss_mb": span.max_rss_mb,
+                "max_rss_growth_mb": (
+                    None
+                    if span.max_rss_mb is None
+                    else span.max_rss_mb - span.start_max_rss_mb
+                ),
+                **span.attributes,
+            }
+            if self.trace_memory:
+                record["peak_traced_memory_mb"] = (
+                    span.peak_traced_memory - span.start_traced_memory
+                ) / 1024**2
+            spans.append(record)
+        return {"spans": spans}
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the recorded spans in the Chrome trace event format."""
+        pid = os.getpid()
+        events = []
+        for record, span in zip(
+            self.to_json()["spans"], sorted(self.spans, key=lambda s: s.start_time)
+        ):
+            args = {
+                key: value
+                for key, value in record.items()
+                if key not in ("name", "parent", "depth", "thread_id", "start_seconds")
+            }
+            events.append(
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": (span.start_time - self._origin) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, output_path: Optional[str] = None) -> None:
+        """
+        Write the recorded spans to the output file.
+
+        :param output_path: Optional file path overriding the profiler's output path.
+        """
+        if not self.enabled:
+            return
+
+        profile = (
+            self.to_chrome_trace() if self.output_format == "chrome" else self.to_json()
+        )
+        with open(output_path or self.output_path, "w") as f:
+            json.dump(profile, f, indent=2, default=str)
+
+
+def profiler_from_env() -> Profiler:
+    """
+    Create the profiler configured by the VETBIZ_PROFILE* environment variables.
+
+    An unsupported profile format disables profiling with a warning, so a typo in the environment
+    does not break importing the library.
+    """
+    output_format = os.getenv(PROFILE_ENV_VAR) or None
+    try:
+        return Profiler(
+            output_format=output_format.lower() if output_format else None,
+            output_path=os.getenv(PROFILE_PATH_ENV_VAR),
+            trace_memory=os.getenv(PROFILE_MEMORY_ENV_VAR) == "1",
+        )
+    except ValueError as e:
+        warnings.warn(f"{e}. Profiling is disabled.", RuntimeWarning)
+        return Profiler()
+
+
+PROFILER = profiler_from_env()
+if PROFILER.enabled:
+    atexit.register(PROFILER.write)
+
+
+def span(name: str, **attributes: Any):
+    """
+    Time the enclosed block as a span of the process-wide profiler (a no-op unless profiling is enabled).
+
+    :param name: Name of the stage.
+    :param attributes: Attributes recorded with the span.
+    :return: A context manager yielding the span.
+    """
+    return PROFILER.span(name, **attributes)
+
+
+def profiled(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording each call of a function as a span, with the row counts of its
+    first DataFrame argument (rows_in) and of its result (rows_out).
+
+    :param name: Name of the span (defaults to the function name).
+    :return: The decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+
+            with PROFILER.span(span_name) as function_span:
+                rows_in = next(
+                    (len(arg) for arg in args if hasattr(arg, "columns")), None
+                )
+                if rows_in is not None:
+                    function_span.set(rows_in=rows_in)
+                result = function(*args, **kwargs)
+                if hasattr(result, "columns"):
+                    function_span.set(rows_out=len(result))
+                return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Optional
+
+# Product catalogue: (product name, relative frequency, unit sale price)
+SYNTHETIC_PRODUCTS = [
+    ("Consultation", 20, 85.0),
+    ("Re-check Consultation", 8, 45.0),
+    ("After Hours Consult", 2, 180.0),
+    ("Dental Scale and Polish", 3, 450.0),
+    ("Dental Extraction", 1, 220.0),
+    ("Dental Radiograph", 1, 120.0),
+    ("Vaccination C5", 6, 110.0),
+    ("Vaccination F3", 4, 95.0),
+    ("Desexing Female Dog", 1, 420.0),
+    ("Surgery Soft Tissue", 1, 650.0),
+    ("Heartworm Prevention", 10, 60.0),
+    ("Flea and Tick Treatment", 12, 45.0),
+    ("Prescription Diet Dry Food", 15, 95.0),
+    ("Antibiotics Tablets", 8, 35.0),
+    ("Pathology Panel", 3, 160.0),
+]
+
+
+def generate_synthetic_sales_data(
+    n_rows: int,
+    n_clinics: int = 12,
+    n_customers: Optional[int] = None,
+    start_date: datetime = datetime(2016, 1, 1),
+    end_date: datetime = datetime(2024, 12, 31),
+    zipf_exponent: float = 0.8,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Generate a deterministic synthetic sales frame shaped like the result of the sales query.
+
+    Sales lines are grouped into visits of 2.5 lines on average. Customers belong to one clinic and their
+    visit counts follow a Zipf-like distribution, so a few customers visit very often and most rarely.
+    Invoice dates are spread uniformly between `start_date` and `end_date`.
+
+    :param n_rows: Number of sales lines to generate.
+    :param n_clinics: Number of clinics (spread over practices of four clinics).
+    :param n_customers: Number of customers (defaults to one customer per 25 lines).
+    :param start_date: The first possible invoice date.
+    :param end_date: The last possible invoice date.
+    :param zipf_exponent: Exponent of the customer visit frequency distribution.
+    :param seed: Seed of the random generator; the same arguments always produce the same frame.
+    :return: A DataFrame of synthetic sales lines.
+    """
+    rng = np.random.default_rng(seed)
+    n_customers = n_customers or max(n_rows // 25, 1)
+
+    # Visits: Zipf-like customer frequencies, uniform dates
+    n_visits = max(n_rows * 2 // 5, 1)
+    customer_weights = 1.0 / np.arange(1, n_customers + 1) ** zipf_exponent
+    visit_customers = rng.choice(
+        n_customers, size=n_visits, p=customer_weights / customer_weights.sum()
+    )
+    first_day = np.datetime64(start_date, "D").astype(np.int64)
+    last_day = np.datetime64(end_date, "D").astype(np.int64)
+    visit_days = rng.integers(first_day, last_day + 1, size=n_visits)
+
+    # Lines: every visit gets at least one line, the rest are spread at random
+    line_visits = np.concatenate(
+        [
+            np.arange(n_visits),
+            rng.integers(0, n_visits, size=max(n_rows - n_visits, 0)),
+        ]
+    )[:n_rows]
+    line_visits.sort()
+
+    product_names = np.array([product[0] for product in SYNTHETIC_PRODUCTS])
+    product_weights = np.array([product[1] for product in SYNTHETIC_PRODUCTS], float)
+    product_prices = np.array([product[2] for product in SYNTHETIC_PRODUCTS])
+    line_products = rng.choice(
+        len(SYNTHETIC_PRODUCTS), size=n_rows, p=product_weights / product_weights.sum()
+    )
+
+    customer_clinics = rng.integers(0, n_clinics, size=n_customers)
+    line_customers = visit_customers[line_visits]
+    line_clinics = customer_clinics[line_customers]
+    invoice_date = pd.to_datetime(visit_days[line_visits], unit="D")
+
+    unit_sale = np.round(
+        product_prices[line_products] * rng.uniform(0.8, 1.2, n_rows), 2
+    )
+    unit_cost = np.round(unit_sale * rng.uniform(0.3, 0.6, n_rows), 2)
+    fixed_sale = np.where(rng.random(n_rows) < 0.1, 15.0, 0.0)
+
+    sales_data = pd.DataFrame(
+        {
+            "sale_id": np.arange(1, n_rows + 1),
+            "visit_id": line_visits + 1,
+            "practice_tk": line_clinics // 4 + 1,
+            "clinic_tk": line_clinics + 1,
+            "customer_tk": line_customers + 1,
+            "product_tk": line_products + 1,
+            "unit_cost": unit_cost,
+            "fixed_cost": 0.0,
+            "unit_sale": unit_sale,
+            "fixed_sale": fixed_sale,
+            "practice_name": pd.Series(line_clinics // 4 + 1).map("Practice {}".format),
+            "clinic_name": pd.Series(line_clinics + 1).map("Clinic {}".format),
+            "customer_id": line_customers + 100000,
+            "invoice_date": invoice_date,
+            "total_cost": unit_cost,
+            "total_sale": unit_sale + fixed_sale,
+            "year": invoice_date.year,
+            "month": invoice_date.month,
+            "product_name": product_names[line_products],
+        }
+    )
+    # Order the sales lines by invoice date, keeping the lines of a visit together
+    return sales_data.sort_values("invoice_date", kind="mergesort").reset_index(
+        drop=True
+    )
+
+
+def generate_synthetic_customers_from_sales_data(
+    sales_data: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Derive a frame shaped like the result of the customers from sales query from synthetic sales data.
+
+    :param sales_data: A DataFrame returned by generate_synthetic_sales_data.
+    :return: A DataFrame of customer sales with a 'date_field' column.
+    """
+    customers_from_sales_data = sales_data[
+        [
+            "visit_id",
+            "sale_id",
+            "clinic_tk",
+            "customer_tk",
+            "customer_id",
+            "practice_name",
+            "clinic_name",
+            "product_name",
+            "unit_cost",
+            "fixed_cost",
+            "unit_sale",
+            "fixed_sale",
+            "invoice_date",
+            "month",
+            "year",
+        ]
+    ].rename(columns={"invoice_date": "date_field"})
+    customers_from_sales_data.insert(4, "active", 1)
+    return customers_from_sales_data.reset_index(drop=True)
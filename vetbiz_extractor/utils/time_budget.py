@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Seconds between two checks of a budget by the thread cancelling queries that run out of time
+BUDGET_POLL_SECONDS = 0.1
+
+
+class TimeBudget:
+    """
+    A deadline for an extraction or for one of its queries, which can also be cancelled explicitly.
+
+    Budgets nest: a query budget created with `child` is exhausted when its own time runs out,
+    or when the budget of the whole extraction runs out or is cancelled.
+    Fetch functions check their budget between batches and cancel the running query when it is exhausted.
+    """
+
+    def __init__(
+        self, seconds: Optional[float] = None, parent: Optional["TimeBudget"] = None
+    ):
+        """
+        :param seconds: Number of seconds from now the budget lasts (default is no time limit).
+        :param parent: An optional budget this budget is part of.
+        """
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+        self.parent = parent
+        self._cancelled = threading.Event()
+
+    def child(self, seconds: Optional[float] = None) -> "TimeBudget":
+        """
+        Create a budget, e.g. for one query, that is part of this budget.
+
+        :param seconds: Number of seconds the child budget lasts at most (default is the rest of this budget).
+        :return: The child budget.
+        """
+        return TimeBudget(seconds, parent=self)
+
+    def cancel(self) -> None:
+        """Exhaust the budget (and its children) now."""
+        self._cancelled.set()
+
+    def remaining(self) -> Optional[float]:
+        """
+        Return the number of seconds left.
+
+        :return: The seconds left (0 once exhausted), or None when the budget has no time limit.
+        """
+        if self._cancelled.is_set():
+            return 0.0
+        remaining = (
+            None
+            if self.deadline is None
+            else max(self.deadline - time.monotonic(), 0.0)
+        )
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = (
+                    parent_remaining
+                    if remaining is None
+                    else min(remaining, parent_remaining)
+                )
+        return remaining
+
+    def is_exhausted(self) -> bool:
+        """Return whether the budget ran out or was cancelled."""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Sleep for up to `seconds`, waking up early when the budget runs out.
+
+        :param seconds: Number of seconds to sleep.
+        :return: Whether the budget is still left after sleeping.
+        """
+        remaining = self.remaining()
+        time.sleep(seconds if remaining is None else min(seconds, remaining))
+        return not self.is_exhausted()
+
+
+def get_query_budget(
+    time_budget: Optional[TimeBudget], query_timeout: Optional[float]
+) -> Optional[TimeBudget]:
+    """
+    Return the budget of one query: at most `query_timeout` seconds, within the budget of the whole extraction.
+
+    :param time_budget: An optional budget of the whole extraction.
+    :param query_timeout: An optional maximum number of seconds for the query.
+    :return: The query budget, or None when there is neither.
+    """
+    if time_budget is None:
+        return None if query_timeout is None else TimeBudget(query_timeout)
+    return time_budget.child(query_timeout)
+
+
+@contextmanager
+def cancel_on_exhaustion(
+    time_budget: Optional[TimeBudget], cancel: Callable[[], None]
+) -> Iterator[None]:
+    """
+    Call `cancel` (e.g. cancel the running query) from a watching thread if the budget runs out
+    before the block ends.
+
+    :param time_budget: An optional budget (nothing is watched without one).
+    :param cancel: A callable cancelling the work of the block. Errors it raises are ignored.
+    :return: A context manager watching the budget while the block runs.
+    """
+    if time_budget is None:
+        yield
+        return
+
+    done = threading.Event()
+
+    def watch() -> None:
+        while not done.wait(BUDGET_POLL_SECONDS):
+            if time_budget.is_exhausted():
+                try:
+                    cancel()
+                except Exception:
+                    pass
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        done.set()
+        watcher.join()